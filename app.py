@@ -1,38 +1,84 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory, session
+from flask import Flask, render_template, request, jsonify, send_from_directory, session, Response, stream_with_context
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
+import orjson
 from werkzeug.security import generate_password_hash, check_password_hash
+import concurrent.futures
+import csv
+import io
 import json
 import threading
 import time
+import numpy as np
 import os
 import uuid
-from datetime import datetime, timedelta
-import sqlite3
+import itertools
+import hashlib
+from datetime import datetime, timedelta, date
 import jwt
 from functools import wraps
+from cachetools import TTLCache
+import cachetools.func
 
 # Import your enhanced modules
+from db import get_conn, get_write_conn, write_lock, close_all
 from enhanced_sensor_handler import EnhancedSensorDataHandler
 from enhanced_analyzer import EnhancedRehabilitationAnalyzer
 from enhanced_gpt_advisor import EnhancedGPTRehabilitationAdvisor
 
 import logging
+import logging.handlers
+import queue
 logging.basicConfig(level=logging.DEBUG)
 
+# Hot loops log through a queue so formatting/write syscalls happen on a
+# dedicated listener thread, not in the sampling path
+_log_queue = queue.SimpleQueue()
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.handlers.QueueHandler(_log_queue))
+logger.propagate = False
+_log_listener = logging.handlers.QueueListener(_log_queue, logging.StreamHandler())
+_log_listener.start()
+
+# NumPy scalars (simulation buffers) and int keys serialize natively
+_ORJSON_OPTS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+class OrJSONProvider(JSONProvider):
+    """orjson-backed provider so every jsonify() skips stdlib json"""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=_ORJSON_OPTS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 app = Flask(__name__)
+app.json = OrJSONProvider(app)
+# Let nginx/apache take over file transfers via X-Sendfile when fronted
+app.use_x_sendfile = os.environ.get('REHABIT_X_SENDFILE') == '1'
 CORS(app, supports_credentials=True)  # Allow cross-origin requests with credentials
 app.secret_key = 'rehabtech_pro_secret_key_2025'  # Change in production
 
 # Global variables
 current_sessions = {}  # Support multiple concurrent sessions
+current_sessions_lock = threading.RLock()  # Guards inserts/pops on the dict
 data_handler = None
 analyzer = None
 advisor = None
 JWT_SECRET = 'jwt_secret_key_rehabtech_pro'  # Change in production
 
+# Shared worker pool for per-test collectors: bounded, and workers are
+# reused across rapid start/stop cycles instead of spawning raw threads
+_collector_pool = concurrent.futures.ThreadPoolExecutor(
+    max_workers=16, thread_name_prefix='collector'
+)
+
+# Snapshotted at init so the status endpoint doesn't stat() per request
+_db_file_exists = False
+
 def init_components():
     """Initialize system components"""
-    global data_handler, analyzer, advisor
+    global data_handler, analyzer, advisor, _db_file_exists
 
     # Initialize enhanced data handler with WiFi (ESP32 leg.ino)
     # ESP32 WiFi AP模式配置:
@@ -55,8 +101,59 @@ def init_components():
     # Initialize enhanced AI advisor
     advisor = EnhancedGPTRehabilitationAdvisor(db_path="rehabtech_pro.db")
 
+    # Covering indexes for the hot query patterns (login, stats, realtime poll)
+    with write_lock:
+        get_write_conn().executescript('''
+            CREATE INDEX IF NOT EXISTS idx_sd_session_ts ON sensor_data(session_id, timestamp DESC);
+            CREATE INDEX IF NOT EXISTS idx_ts_user_start ON training_sessions(user_id, start_time);
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_users_email ON users(email);
+            CREATE INDEX IF NOT EXISTS idx_ar_session ON analysis_results(session_id);
+            ANALYZE;
+        ''')
+
+        # Maintained row counters: /api/system/status reads two O(1) PK
+        # lookups instead of scanning users and training_sessions
+        get_write_conn().executescript('''
+            CREATE TABLE IF NOT EXISTS stats (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL DEFAULT 0
+            );
+            INSERT OR IGNORE INTO stats(name, value)
+                SELECT 'users', COUNT(*) FROM users;
+            INSERT OR IGNORE INTO stats(name, value)
+                SELECT 'training_sessions', COUNT(*) FROM training_sessions;
+            CREATE TRIGGER IF NOT EXISTS users_ins AFTER INSERT ON users BEGIN
+                UPDATE stats SET value = value + 1 WHERE name = 'users';
+            END;
+            CREATE TRIGGER IF NOT EXISTS users_del AFTER DELETE ON users BEGIN
+                UPDATE stats SET value = value - 1 WHERE name = 'users';
+            END;
+            CREATE TRIGGER IF NOT EXISTS ts_ins AFTER INSERT ON training_sessions BEGIN
+                UPDATE stats SET value = value + 1 WHERE name = 'training_sessions';
+            END;
+            CREATE TRIGGER IF NOT EXISTS ts_del AFTER DELETE ON training_sessions BEGIN
+                UPDATE stats SET value = value - 1 WHERE name = 'training_sessions';
+            END;
+        ''')
+
+    # The handler's init_database has run by now, so this holds for good
+    _db_file_exists = os.path.exists('rehabtech_pro.db')
+
+    # Single shared collector for all stream sessions
+    collector_thread = threading.Thread(target=sensor_stream_collector, daemon=True)
+    collector_thread.start()
+
+    # Periodic liveness snapshot consumed by /api/system/status
+    _refresh_health_snapshot()
+
     print("✅ System components initialized successfully")
 
+# Cache of verified token payloads so polling clients (e.g. /api/sensor/data
+# every few hundred ms) don't pay for jwt.decode on every request.
+# Entries never outlive the token's own exp (checked on hit below).
+_token_cache = TTLCache(maxsize=4096, ttl=60)
+_token_cache_lock = threading.Lock()
+
 def token_required(f):
     """JWT token validation decorator"""
     @wraps(f)
@@ -64,19 +161,35 @@ def token_required(f):
         token = request.headers.get('Authorization')
         if not token:
             return jsonify({'error': 'Token is missing'}), 401
-        
+
         try:
             if token.startswith('Bearer '):
                 token = token[7:]
+
+            with _token_cache_lock:
+                cached = _token_cache.get(token)
+
+            if cached is not None:
+                # Honor the token's own expiry even while cached
+                if cached['exp'] <= time.time():
+                    with _token_cache_lock:
+                        _token_cache.pop(token, None)
+                    return jsonify({'error': 'Token has expired'}), 401
+                request.current_user_id = cached['user_id']
+                return f(*args, **kwargs)
+
             data = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
             current_user_id = data['user_id']
+            # Only cache successfully verified tokens
+            with _token_cache_lock:
+                _token_cache[token] = {'user_id': current_user_id, 'exp': data['exp']}
             # Add user info to request context
             request.current_user_id = current_user_id
         except jwt.ExpiredSignatureError:
             return jsonify({'error': 'Token has expired'}), 401
         except jwt.InvalidTokenError:
             return jsonify({'error': 'Token is invalid'}), 401
-        
+
         return f(*args, **kwargs)
     return decorated
 
@@ -98,25 +211,24 @@ def register():
             return jsonify({'success': False, 'message': 'All fields are required'}), 400
         
         # Check if user already exists
-        conn = sqlite3.connect("rehabtech_pro.db")
-        cursor = conn.cursor()
-        
+        cursor = get_conn().cursor()
+
         cursor.execute('SELECT id FROM users WHERE email = ?', (email,))
         if cursor.fetchone():
-            conn.close()
             return jsonify({'success': False, 'message': 'Email already registered'}), 400
-        
+
         # Create new user
         user_id = str(uuid.uuid4())
         password_hash = generate_password_hash(password)
-        
-        cursor.execute('''
-            INSERT INTO users (id, email, password_hash, full_name, role, created_at)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (user_id, email, password_hash, name, role, datetime.now()))
-        
-        conn.commit()
-        conn.close()
+        created_at = datetime.now().isoformat()
+
+        with write_lock:
+            conn = get_write_conn()
+            conn.execute('''
+                INSERT INTO users (id, email, password_hash, full_name, role, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (user_id, email, password_hash, name, role, created_at))
+            conn.commit()
         
         return jsonify({
             'success': True,
@@ -138,27 +250,31 @@ def login():
         if not all([email, password]):
             return jsonify({'success': False, 'message': 'Email and password are required'}), 400
         
-        conn = sqlite3.connect("rehabtech_pro.db")
-        cursor = conn.cursor()
-        
+        cursor = get_conn().cursor()
+
         cursor.execute('''
-            SELECT id, password_hash, full_name, role, age, sex, weight, 
+            SELECT id, password_hash, full_name, role, age, sex, weight,
                    rehabilitation_stage, main_problems
             FROM users WHERE email = ?
         ''', (email,))
-        
+
         user = cursor.fetchone()
-        conn.close()
-        
-        if not user or not check_password_hash(user[1], password):
+
+        # Unknown email: bail out before any PBKDF2 work so floods of bad
+        # logins don't burn ~100 ms of hashing each
+        if not user:
+            return jsonify({'success': False, 'message': 'Invalid email or password'}), 401
+
+        if not check_password_hash(user[1], password):
             return jsonify({'success': False, 'message': 'Invalid email or password'}), 401
         
-        # Generate JWT token
+        # Generate JWT token (integer epoch exp is what PyJWT consumes anyway,
+        # and avoids a datetime construction per login)
         token_payload = {
             'user_id': user[0],
             'email': email,
             'role': user[3],
-            'exp': datetime.utcnow() + timedelta(hours=24)
+            'exp': int(time.time()) + 86400  # 24 hours
         }
         token = jwt.encode(token_payload, JWT_SECRET, algorithm='HS256')
         
@@ -199,22 +315,20 @@ def get_user_profile():
     try:
         user_id = request.current_user_id
         
-        conn = sqlite3.connect("rehabtech_pro.db")
-        cursor = conn.cursor()
-        
+        cursor = get_conn().cursor()
+
         cursor.execute('''
             SELECT id, email, full_name, role, age, sex, weight,
                    rehabilitation_stage, main_problems, created_at, updated_at
             FROM users WHERE id = ?
         ''', (user_id,))
-        
+
         user = cursor.fetchone()
-        conn.close()
-        
+
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
-        return jsonify({
+        return etag_json({
             'success': True,
             'user': {
                 'id': user[0],
@@ -250,20 +364,22 @@ def update_user_profile():
         rehabilitation_stage = data.get('rehabilitation_stage')
         main_problems = data.get('main_problems')
         
-        conn = sqlite3.connect("rehabtech_pro.db")
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            UPDATE users 
-            SET full_name = ?, age = ?, sex = ?, weight = ?, 
-                rehabilitation_stage = ?, main_problems = ?, updated_at = ?
-            WHERE id = ?
-        ''', (full_name, age, sex, weight, rehabilitation_stage, 
-              main_problems, datetime.now(), user_id))
-        
-        conn.commit()
-        conn.close()
-        
+        updated_at = datetime.now().isoformat()
+
+        with write_lock:
+            conn = get_write_conn()
+            conn.execute('''
+                UPDATE users
+                SET full_name = ?, age = ?, sex = ?, weight = ?,
+                    rehabilitation_stage = ?, main_problems = ?, updated_at = ?
+                WHERE id = ?
+            ''', (full_name, age, sex, weight, rehabilitation_stage,
+                  main_problems, updated_at, user_id))
+            conn.commit()
+
+        # Drop cached AI-profile lookups so reports see the new data
+        get_user_profile_for_ai.cache_clear()
+
         return jsonify({'success': True, 'message': 'Profile updated successfully'})
         
     except Exception as e:
@@ -276,44 +392,37 @@ def get_user_stats():
     try:
         user_id = request.current_user_id
         
-        conn = sqlite3.connect("rehabtech_pro.db")
-        cursor = conn.cursor()
-        
-        # Get total sessions
-        cursor.execute('SELECT COUNT(*) FROM training_sessions WHERE user_id = ?', (user_id,))
-        total_sessions = cursor.fetchone()[0]
-        
+        cursor = get_conn().cursor()
+
+        # Total / weekly / average score in one scan instead of three round trips
+        cursor.execute('''
+            SELECT COUNT(*) AS total_sessions,
+                   SUM(CASE WHEN start_time >= date('now', '-7 days') THEN 1 ELSE 0 END) AS weekly_sessions,
+                   (SELECT AVG(overall_score)
+                    FROM analysis_results ar
+                    JOIN training_sessions ts ON ar.session_id = ts.session_id
+                    WHERE ts.user_id = ? AND ar.created_at >= date('now', '-30 days')) AS avg_score
+            FROM training_sessions
+            WHERE user_id = ?
+        ''', (user_id, user_id))
+
+        total_sessions, weekly_sessions, avg_score = cursor.fetchone()
+        weekly_sessions = weekly_sessions or 0
+        rehab_score = int(avg_score) if avg_score else 75
+
         # Get current streak (consecutive days with training)
         cursor.execute('''
-            SELECT DISTINCT DATE(start_time) as training_date 
-            FROM training_sessions 
+            SELECT DISTINCT DATE(start_time) as training_date
+            FROM training_sessions
             WHERE user_id = ? AND status = 'completed'
             ORDER BY training_date DESC
+            LIMIT 400
         ''', (user_id,))
         
         training_dates = [row[0] for row in cursor.fetchall()]
         current_streak = calculate_streak(training_dates)
-        
-        # Get weekly progress (last 7 days)
-        cursor.execute('''
-            SELECT COUNT(*) FROM training_sessions 
-            WHERE user_id = ? AND start_time >= date('now', '-7 days')
-        ''', (user_id,))
-        weekly_sessions = cursor.fetchone()[0]
-        
-        # Calculate rehabilitation score (average of recent test scores)
-        cursor.execute('''
-            SELECT AVG(overall_score) FROM analysis_results ar
-            JOIN training_sessions ts ON ar.session_id = ts.session_id
-            WHERE ts.user_id = ? AND ar.created_at >= date('now', '-30 days')
-        ''', (user_id,))
-        
-        avg_score_result = cursor.fetchone()
-        rehab_score = int(avg_score_result[0]) if avg_score_result[0] else 75
-        
-        conn.close()
-        
-        return jsonify({
+
+        return etag_json({
             'success': True,
             'stats': {
                 'total_sessions': total_sessions,
@@ -327,24 +436,23 @@ def get_user_stats():
         return jsonify({'error': str(e)}), 500
 
 def calculate_streak(training_dates):
-    """Calculate consecutive training streak"""
+    """Calculate consecutive training streak (set lookup, no re-parsing)"""
     if not training_dates:
         return 0
-    
+
+    dates = {date.fromisoformat(s) for s in training_dates}
+
+    # Walk backwards day by day from today; a streak ending yesterday
+    # still counts until today's training happens
+    d = date.today()
+    if d not in dates:
+        d -= timedelta(days=1)
+
     streak = 0
-    current_date = datetime.now().date()
-    
-    for date_str in training_dates:
-        training_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-        days_diff = (current_date - training_date).days
-        
-        if days_diff == streak:
-            streak += 1
-        elif days_diff == streak + 1:
-            streak += 1
-        else:
-            break
-    
+    while d in dates:
+        streak += 1
+        d -= timedelta(days=1)
+
     return streak
 
 # =============================================================================
@@ -354,6 +462,7 @@ def calculate_streak(training_dates):
 # Global variable to store sensor data stream
 sensor_data_stream = {}
 training_sessions_data = {}
+training_sessions_lock = threading.Lock()
 
 @app.route('/api/sensor/command', methods=['POST'])
 def send_sensor_command():
@@ -438,16 +547,9 @@ def get_sensor_data():
                     'mode': 'wifi'
                 })
 
-        # Fallback: return simulated data
-        import random
-        simulated_data = {
-            'force': round(20 + random.random() * 40, 2),
-            'angle': round(30 + random.random() * 60, 2),
-            'yaw': round(-90 + random.random() * 180, 2),
-            'virtual_angle': round(30 + random.random() * 60, 2),
-            'timestamp': time.time(),
-            'data_quality': 1.0
-        }
+        # Fallback: serve a pre-seeded simulated sample from the ring buffer
+        sample = _sim_ring[next(_sim_ring_idx) % SIM_RING_SIZE]
+        simulated_data = dict(sample, timestamp=time.time())
 
         return jsonify({
             'success': True,
@@ -466,24 +568,17 @@ def start_sensor_stream():
         data = request.json
         session_id = data.get('session_id', str(uuid.uuid4()))
 
-        # Initialize stream for this session
-        training_sessions_data[session_id] = {
-            'session_id': session_id,
-            'start_time': time.time(),
-            'is_streaming': True,
-            'data_points': []
-        }
+        # Register the session; the shared collector thread fans data out
+        with training_sessions_lock:
+            training_sessions_data[session_id] = {
+                'session_id': session_id,
+                'start_time': time.time(),
+                'is_streaming': True,
+                'data_points': []
+            }
 
         print(f"📡 WiFi sensor stream started - Session: {session_id}")
 
-        # Start background thread to collect data from WiFi sensor
-        stream_thread = threading.Thread(
-            target=collect_wifi_sensor_data,
-            args=(session_id,)
-        )
-        stream_thread.daemon = True
-        stream_thread.start()
-
         return jsonify({
             'success': True,
             'session_id': session_id,
@@ -501,9 +596,12 @@ def stop_sensor_stream():
         data = request.json
         session_id = data.get('session_id')
 
-        if session_id in training_sessions_data:
-            training_sessions_data[session_id]['is_streaming'] = False
-            data_points_count = len(training_sessions_data[session_id]['data_points'])
+        with training_sessions_lock:
+            session_state = training_sessions_data.get(session_id)
+
+        if session_state:
+            session_state['is_streaming'] = False
+            data_points_count = len(session_state['data_points'])
 
             print(f"📡 WiFi sensor stream stopped - Session: {session_id}, Data points: {data_points_count}")
 
@@ -519,37 +617,154 @@ def stop_sensor_stream():
         print(f"❌ Error stopping sensor stream: {e}")
         return jsonify({'success': False, 'message': str(e)}), 500
 
-def collect_wifi_sensor_data(session_id):
-    """Background thread to collect data from WiFi sensor (ESP32 leg.ino)"""
-    import random
+# Flush this many buffered stream points per transaction (~25 s at 2 Hz);
+# per-row autocommit inserts are the classic SQLite bottleneck
+STREAM_FLUSH_SIZE = 50
+
+# Keep hot insert SQL as one module-level literal so sqlite3's per-connection
+# statement cache reuses the prepared plan instead of re-parsing each flush
+INSERT_SENSOR_DATA_SQL = '''
+    INSERT INTO sensor_data
+    (timestamp, test_type, force_value, angle_value, session_id, user_id)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+
+def ts_read_sql(col='timestamp'):
+    """SQL expression rendering sensor timestamps as ISO text.
+
+    New databases store sensor_data.timestamp as INTEGER epoch
+    microseconds (8-byte keys, integer compares); older databases have
+    TEXT timestamps. Reads go through this CASE so both come back as
+    strings.
+    """
+    return (f"CASE typeof({col}) WHEN 'integer' "
+            f"THEN datetime({col} / 1000000, 'unixepoch') ELSE {col} END")
+
+# Whether sensor_data stores force/angle as fixed-point integers (value x 100).
+# Decided per database by the declared column type: new schemas use INTEGER
+# (centinewtons/centidegrees, 1-3 byte varints), legacy ones REAL physical
+# units. Detected once and cached; per-row typeof() is unreliable here because
+# column affinity can silently convert between int and real.
+_SENSOR_VALUES_FIXED = None
+
+def sensor_values_fixed(conn=None):
+    global _SENSOR_VALUES_FIXED
+    if _SENSOR_VALUES_FIXED is None:
+        cols = {row[1]: (row[2] or '').upper() for row in
+                (conn or get_conn()).execute('PRAGMA table_info(sensor_data)')}
+        _SENSOR_VALUES_FIXED = cols.get('force_value') == 'INTEGER'
+    return _SENSOR_VALUES_FIXED
+
+def val_read_sql(col):
+    """SQL expression restoring a stored force/angle column to physical units"""
+    return f'{col} / 100.0' if sensor_values_fixed() else col
+
+# Simulation fallback: generate random points in vectorized batches instead
+# of four Python-level random.random() calls per 500 ms tick.
+# Columns: force (20-60N), angle (30-90°), yaw (-90-90°), virtual_angle (30-90°)
+SIM_BATCH_SIZE = 64
+_sim_scale = np.array([40.0, 60.0, 180.0, 60.0], dtype=np.float32)
+_sim_offset = np.array([20.0, 30.0, -90.0, 30.0], dtype=np.float32)
+
+def make_sim_batch(rng):
+    """Pre-generate a (SIM_BATCH_SIZE, 4) batch of simulated sensor rows"""
+    batch = rng.random((SIM_BATCH_SIZE, 4), dtype=np.float32)
+    np.multiply(batch, _sim_scale, out=batch)
+    np.add(batch, _sim_offset, out=batch)
+    return batch
+
+# Pre-seeded ring of simulated /api/sensor/data responses so the disconnected
+# fallback does no RNG work on the request path
+SIM_RING_SIZE = 256
+
+def _build_sim_ring():
+    rng = np.random.default_rng()
+    batch = rng.random((SIM_RING_SIZE, 4), dtype=np.float32)
+    np.multiply(batch, _sim_scale, out=batch)
+    np.add(batch, _sim_offset, out=batch)
+    return [
+        {
+            'force': float(row[0]),
+            'angle': float(row[1]),
+            'yaw': float(row[2]),
+            'virtual_angle': float(row[3]),
+            'data_quality': 1.0
+        }
+        for row in batch
+    ]
+
+_sim_ring = _build_sim_ring()
+_sim_ring_idx = itertools.count()
+
+def etag_json(payload):
+    """jsonify with an ETag so unchanged polled responses short-circuit to 304"""
+    body = orjson.dumps(payload)
+    etag = hashlib.blake2b(body, digest_size=8).hexdigest()
+    if request.headers.get('If-None-Match') == etag:
+        return Response(status=304, headers={'ETag': etag})
+    return Response(body, mimetype='application/json', headers={'ETag': etag})
+
+def flush_stream_points(session_id, points):
+    """Write buffered stream data points to sensor_data in one transaction"""
+    if not points:
+        return
+    try:
+        with write_lock:
+            conn = get_write_conn()
+            fixed = sensor_values_fixed(conn)
+            conn.execute('BEGIN')
+            conn.executemany(INSERT_SENSOR_DATA_SQL, [
+                (int(p['timestamp'] * 1e6),
+                 'force and angle test',
+                 # fixed-point schemas store value x 100 integers
+                 int(round(p['force'] * 100)) if fixed else p['force'],
+                 int(round(p['angle'] * 100)) if fixed else p['angle'],
+                 session_id,
+                 '')  # stream sessions are not tied to a logged-in user
+                for p in points
+            ])
+            conn.execute('COMMIT')
+        points.clear()
+    except Exception as e:
+        print(f"❌ Error flushing stream data: {e}")
+
+def sensor_stream_collector():
+    """Single shared collector thread: one ESP32 read per 2 Hz tick,
+    fanned out to every active stream session.
+
+    One thread regardless of session count keeps device round-trips
+    constant and avoids per-session thread/GIL churn.
+    """
+    print("🚀 Shared WiFi sensor stream collector started")
 
-    print(f"🚀 WiFi sensor data collection started for session: {session_id}")
+    pending_points = {}  # session_id -> points awaiting DB flush
 
-    while (session_id in training_sessions_data and
-           training_sessions_data[session_id]['is_streaming']):
+    # Simulation fallback batch, refilled every SIM_BATCH_SIZE ticks
+    rng = np.random.default_rng()
+    sim_batch = make_sim_batch(rng)
+    sim_idx = 0
+
+    while True:
         try:
+            sensor_data = None
+
             # 从ESP32读取数据
             if data_handler and data_handler.is_connected:
                 # 使用data_handler从ESP32读取数据
                 sensor_data = data_handler.read_sensor_data('force and angle test')
 
-                if sensor_data:
-                    force = sensor_data.get('force_value', 0)
-                    angle = sensor_data.get('angle_value', 0)
-                    yaw = sensor_data.get('yaw_angle', 0)
-                    virtual_angle = sensor_data.get('virtual_angle', 0)
-                else:
-                    # 如果读取失败，使用模拟数据
-                    force = round(20 + random.random() * 40, 2)
-                    angle = round(30 + random.random() * 60, 2)
-                    yaw = round(-90 + random.random() * 180, 2)
-                    virtual_angle = round(30 + random.random() * 60, 2)
+            if sensor_data:
+                force = sensor_data.get('force_value', 0)
+                angle = sensor_data.get('angle_value', 0)
+                yaw = sensor_data.get('yaw_angle', 0)
+                virtual_angle = sensor_data.get('virtual_angle', 0)
             else:
-                # WiFi未连接，使用模拟数据
-                force = round(20 + random.random() * 40, 2)
-                angle = round(30 + random.random() * 60, 2)
-                yaw = round(-90 + random.random() * 180, 2)
-                virtual_angle = round(30 + random.random() * 60, 2)
+                # WiFi未连接或读取失败，从预生成的模拟批次取一行
+                if sim_idx >= SIM_BATCH_SIZE:
+                    sim_batch = make_sim_batch(rng)
+                    sim_idx = 0
+                force, angle, yaw, virtual_angle = (float(v) for v in sim_batch[sim_idx])
+                sim_idx += 1
 
             data_point = {
                 'force': force,
@@ -559,7 +774,24 @@ def collect_wifi_sensor_data(session_id):
                 'timestamp': time.time()
             }
 
-            training_sessions_data[session_id]['data_points'].append(data_point)
+            with training_sessions_lock:
+                active = [(sid, st) for sid, st in training_sessions_data.items()
+                          if st['is_streaming']]
+
+            for sid, st in active:
+                st['data_points'].append(data_point)
+                buf = pending_points.setdefault(sid, [])
+                buf.append(data_point)
+
+                # Flush buffered points in one short transaction per batch
+                if len(buf) >= STREAM_FLUSH_SIZE:
+                    flush_stream_points(sid, buf)
+
+            # Flush the remainder for sessions whose stream just stopped
+            active_ids = {sid for sid, _ in active}
+            for sid in list(pending_points):
+                if sid not in active_ids:
+                    flush_stream_points(sid, pending_points.pop(sid))
 
             # Sleep for 500ms (2 Hz update rate, 与leg.ino的stream间隔一致)
             time.sleep(0.5)
@@ -568,8 +800,6 @@ def collect_wifi_sensor_data(session_id):
             print(f"❌ Error collecting WiFi sensor data: {e}")
             time.sleep(0.5)  # 出错后继续尝试
 
-    print(f"✅ WiFi sensor data collection completed for session: {session_id}")
-
 # =============================================================================
 # TESTING ENDPOINTS
 # =============================================================================
@@ -596,24 +826,23 @@ def start_test():
         )
         
         # Store session info
-        current_sessions[session_id] = {
-            'session_id': session_id,
-            'user_id': user_id,
-            'test_type': test_type,
-            'duration': duration,
-            'interval': interval,
-            'start_time': datetime.now(),
-            'data_count': 0,
-            'is_collecting': True
-        }
+        with current_sessions_lock:
+            current_sessions[session_id] = {
+                'session_id': session_id,
+                'user_id': user_id,
+                'test_type': test_type,
+                'duration': duration,
+                'interval': interval,
+                'start_time': datetime.now(),
+                'data_count': 0,
+                'is_collecting': True,
+                'stop_event': threading.Event()
+            }
         
-        # Start background data collection
-        collection_thread = threading.Thread(
-            target=collect_data_background,
-            args=(test_type, session_id, user_id, duration, interval)
+        # Start background data collection on the shared pool
+        current_sessions[session_id]['future'] = _collector_pool.submit(
+            collect_data_background, test_type, session_id, user_id, duration, interval
         )
-        collection_thread.daemon = True
-        collection_thread.start()
         
         return jsonify({
             'success': True,
@@ -636,9 +865,20 @@ def stop_test():
         if not session_id or session_id not in current_sessions:
             return jsonify({'error': 'Invalid session'}), 400
         
-        # Stop data collection
+        # Stop data collection (wake the collector out of its sleep too)
         current_sessions[session_id]['is_collecting'] = False
-        
+        current_sessions[session_id]['stop_event'].set()
+
+        # Wait for the collector worker so its final _flush_ring lands
+        # before analysis; otherwise the tail of the session is still
+        # in the ring when comprehensive_analysis reads the DB
+        future = current_sessions[session_id].get('future')
+        if future is not None:
+            try:
+                future.result(timeout=10)
+            except Exception as e:
+                print(f"⚠️ Collector worker did not finish cleanly: {e}")
+
         # End training session
         data_handler.end_training_session(session_id)
         
@@ -651,8 +891,11 @@ def stop_test():
         # Generate AI recommendations
         recommendations = advisor.generate_recommendations(analysis_results, user_profile)
         
-        # Clean up session
-        session_data = current_sessions.pop(session_id)
+        # Clean up session (drop the worker future; it isn't serializable)
+        with current_sessions_lock:
+            session_data = current_sessions.pop(session_id)
+        session_data.pop('future', None)
+        session_data.pop('stop_event', None)
         
         return jsonify({
             'success': True,
@@ -670,29 +913,55 @@ def stop_test():
 def get_realtime_data(session_id):
     """Get real-time test data"""
     try:
+        # Live stream sessions: answer from the in-memory buffer, no SQL
+        with training_sessions_lock:
+            stream_state = training_sessions_data.get(session_id)
+
+        if stream_state is not None:
+            points = stream_state['data_points']
+            if points:
+                latest = points[-1]
+                return jsonify({
+                    'success': True,
+                    'data': {
+                        'timestamp': latest['timestamp'],
+                        'force_value': latest['force'],
+                        'angle_value': latest['angle'],
+                        'data_count': len(points),
+                        'session_id': session_id
+                    }
+                })
+            return jsonify({
+                'success': True,
+                'data': {
+                    'message': 'No data available yet',
+                    'data_count': 0,
+                    'session_id': session_id
+                }
+            })
+
         if session_id not in current_sessions:
             return jsonify({'error': 'Session not found'}), 404
-        
-        conn = sqlite3.connect("rehabtech_pro.db")
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT timestamp, force_value, angle_value 
-            FROM sensor_data 
-            WHERE session_id = ? 
-            ORDER BY timestamp DESC 
+
+        cursor = get_conn().cursor()
+
+        cursor.execute(f'''
+            SELECT {ts_read_sql()}, {val_read_sql('force_value')},
+                   {val_read_sql('angle_value')}
+            FROM sensor_data
+            WHERE session_id = ?
+            ORDER BY timestamp DESC
             LIMIT 1
         ''', (session_id,))
-        
+
         result = cursor.fetchone()
-        
+
         cursor.execute('''
             SELECT COUNT(*) FROM sensor_data WHERE session_id = ?
         ''', (session_id,))
-        
+
         data_count = cursor.fetchone()[0]
-        conn.close()
-        
+
         if result:
             return jsonify({
                 'success': True,
@@ -789,23 +1058,48 @@ def get_progress_report():
 # DATA EXPORT ENDPOINTS
 # =============================================================================
 
+# Rows per fetchmany()/response chunk: big enough to amortize the WSGI
+# yield per chunk, small enough to keep memory O(1) per export
+_EXPORT_BATCH = 1000
+
+
+def _csv_batches(cursor):
+    """Yield CSV chunks of _EXPORT_BATCH rows straight off a cursor"""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+
+    cursor.arraysize = _EXPORT_BATCH
+    for batch in iter(lambda: cursor.fetchmany(_EXPORT_BATCH), []):
+        buf.seek(0)
+        buf.truncate()
+        # csv.writer (C implementation) handles quoting correctly
+        writer.writerows([['' if v is None else v for v in row] for row in batch])
+        yield buf.getvalue()
+
+
 @app.route('/api/export/session/<session_id>', methods=['GET'])
 @token_required
 def export_session_data(session_id):
-    """Export session data as CSV"""
+    """Export session data as CSV (streamed in batches)"""
     try:
-        data = data_handler.get_session_data(session_id)
-        
-        # Convert to CSV format
-        csv_content = "Timestamp,Test Type,Force Value (N),Angle Value (°)\n"
-        for item in data:
-            csv_content += f"{item['timestamp']},{item['test_type']},{item.get('force_value', '')},{item.get('angle_value', '')}\n"
-        
-        return csv_content, 200, {
-            'Content-Type': 'text/csv',
+        def generate():
+            yield 'Timestamp,Test Type,Force Value (N),Angle Value (°)\r\n'
+
+            cursor = get_conn().cursor()
+            cursor.execute(f'''
+                SELECT {ts_read_sql()}, test_type, {val_read_sql('force_value')},
+                       {val_read_sql('angle_value')}
+                FROM sensor_data
+                WHERE session_id = ?
+                ORDER BY timestamp
+            ''', (session_id,))
+
+            yield from _csv_batches(cursor)
+
+        return Response(stream_with_context(generate()), mimetype='text/csv', headers={
             'Content-Disposition': f'attachment; filename=rehabtech_session_{session_id}.csv'
-        }
-        
+        })
+
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -817,32 +1111,28 @@ def export_user_history():
         user_id = request.current_user_id
         days = int(request.args.get('days', 30))
         
-        # Get user training history
-        conn = sqlite3.connect("rehabtech_pro.db")
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT ts.session_id, ts.start_time, ts.end_time, ts.duration,
-                   sd.timestamp, sd.test_type, sd.force_value, sd.angle_value
-            FROM training_sessions ts
-            LEFT JOIN sensor_data sd ON ts.session_id = sd.session_id
-            WHERE ts.user_id = ? AND ts.start_time >= date('now', '-{} days')
-            ORDER BY ts.start_time DESC, sd.timestamp
-        '''.format(days), (user_id,))
-        
-        data = cursor.fetchall()
-        conn.close()
-        
-        # Convert to CSV
-        csv_content = "Session ID,Session Start,Session End,Duration (s),Data Timestamp,Test Type,Force (N),Angle (°)\n"
-        for row in data:
-            csv_content += f"{row[0]},{row[1]},{row[2]},{row[3]},{row[4]},{row[5]},{row[6] or ''},{row[7] or ''}\n"
-        
-        return csv_content, 200, {
-            'Content-Type': 'text/csv',
+        def generate():
+            yield ('Session ID,Session Start,Session End,Duration (s),'
+                   'Data Timestamp,Test Type,Force (N),Angle (°)\r\n')
+
+            # Get user training history, streamed straight off the cursor
+            cursor = get_conn().cursor()
+            cursor.execute(f'''
+                SELECT ts.session_id, ts.start_time, ts.end_time, ts.duration,
+                       {ts_read_sql('sd.timestamp')}, sd.test_type,
+                       {val_read_sql('sd.force_value')}, {val_read_sql('sd.angle_value')}
+                FROM training_sessions ts
+                LEFT JOIN sensor_data sd ON ts.session_id = sd.session_id
+                WHERE ts.user_id = ? AND ts.start_time >= date('now', ? || ' days')
+                ORDER BY ts.start_time DESC, sd.timestamp
+            ''', (user_id, f'-{days}'))
+
+            yield from _csv_batches(cursor)
+
+        return Response(stream_with_context(generate()), mimetype='text/csv', headers={
             'Content-Disposition': f'attachment; filename=rehabtech_history_{user_id}_{days}days.csv'
-        }
-        
+        })
+
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -850,166 +1140,310 @@ def export_user_history():
 # SYSTEM ENDPOINTS
 # =============================================================================
 
+# Monitoring pollers hit these endpoints every few seconds; cache the
+# serialized body so repeat hits inside the TTL skip COUNT(*) + JSON work
+_STATUS_TTL = 5.0
+_HEALTH_TTL = 30.0
+_status_cache = {'body': None, 'ts': 0.0}
+_health_cache = {'body': None, 'ts': 0.0}
+_status_cache_lock = threading.Lock()
+
+# Liveness flags refreshed off the request path so monitoring polls never
+# touch the sensor handler or AI client objects directly
+_health_snapshot = {'wifi': False, 'ai': False, 'sensor_ip': 'N/A'}
+_health_snapshot_lock = threading.Lock()
+
+def _refresh_health_snapshot():
+    snap = {
+        'wifi': bool(data_handler and data_handler.is_connected),
+        'ai': bool(advisor and advisor.client),
+        'sensor_ip': getattr(data_handler, 'sensor_ip', 'N/A')
+    }
+    with _health_snapshot_lock:
+        _health_snapshot.update(snap)
+
+    timer = threading.Timer(_STATUS_TTL, _refresh_health_snapshot)
+    timer.daemon = True
+    timer.start()
+
+def _now_iso():
+    """One gettimeofday + format per response, shared by the status endpoints"""
+    return datetime.fromtimestamp(time.time()).isoformat()
+
 @app.route('/api/system/status', methods=['GET'])
 def get_system_status():
     """Get system status"""
     try:
+        # Serve from cache unless the client explicitly asks for fresh data
+        if request.headers.get('Cache-Control') != 'no-cache':
+            if (_status_cache['body'] is not None and
+                    time.monotonic() - _status_cache['ts'] < _STATUS_TTL):
+                return Response(_status_cache['body'], mimetype='application/json')
+
         # Check database connection
         db_status = 'offline'
         total_users = 0
         total_sessions = 0
         
-        if os.path.exists('rehabtech_pro.db'):
+        if _db_file_exists:
             try:
-                conn = sqlite3.connect("rehabtech_pro.db")
-                cursor = conn.cursor()
-                
-                cursor.execute('SELECT COUNT(*) FROM users')
-                total_users = cursor.fetchone()[0]
-                
-                cursor.execute('SELECT COUNT(*) FROM training_sessions')
-                total_sessions = cursor.fetchone()[0]
-                
-                conn.close()
+                cursor = get_conn().cursor()
+
+                # Trigger-maintained counters: two O(1) PK lookups, no scans
+                cursor.execute('''
+                    SELECT (SELECT value FROM stats WHERE name = 'users'),
+                           (SELECT value FROM stats WHERE name = 'training_sessions')
+                ''')
+                total_users, total_sessions = cursor.fetchone()
+                total_users = total_users or 0
+                total_sessions = total_sessions or 0
+
                 db_status = 'online'
             except Exception as e:
                 db_status = f'error: {str(e)}'
         
-        return jsonify({
+        body = orjson.dumps({
             'success': True,
             'status': {
                 'database': db_status,
                 'total_users': total_users,
                 'total_sessions': total_sessions,
                 'active_sessions': len(current_sessions),
-                'wifi_sensor': 'connected' if data_handler.is_connected else 'simulation_mode',
-                'sensor_ip': data_handler.sensor_ip if hasattr(data_handler, 'sensor_ip') else 'N/A',
-                'ai_service': 'available' if advisor.client else 'simulation_mode',
-                'system_time': datetime.now().isoformat(),
+                'wifi_sensor': 'connected' if _health_snapshot['wifi'] else 'simulation_mode',
+                'sensor_ip': _health_snapshot['sensor_ip'],
+                'ai_service': 'available' if _health_snapshot['ai'] else 'simulation_mode',
+                'system_time': _now_iso(),
                 'version': '1.0.0'
             }
         })
-        
+
+        with _status_cache_lock:
+            _status_cache['body'] = body
+            _status_cache['ts'] = time.monotonic()
+
+        return Response(body, mimetype='application/json')
+
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/system/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({
+    if (_health_cache['body'] is not None and
+            time.monotonic() - _health_cache['ts'] < _HEALTH_TTL):
+        return Response(_health_cache['body'], mimetype='application/json')
+
+    body = orjson.dumps({
         'status': 'healthy',
-        'timestamp': datetime.now().isoformat(),
+        'timestamp': _now_iso(),
         'version': '1.0.0'
     })
 
+    with _status_cache_lock:
+        _health_cache['body'] = body
+        _health_cache['ts'] = time.monotonic()
+
+    return Response(body, mimetype='application/json')
+
 # =============================================================================
 # STATIC FILE SERVING
 # =============================================================================
 
+# index.html is read once into memory; every later request is served from
+# bytes (or a 304) without touching the disk
+_index_cache = None
+
+def _load_index():
+    global _index_cache
+    if _index_cache is None:
+        with open('index.html', 'rb') as f:
+            body = f.read()
+        etag = hashlib.blake2b(body, digest_size=8).hexdigest()
+        _index_cache = (body, etag)
+    return _index_cache
+
 @app.route('/')
 def index():
     """Serve homepage"""
-    return send_from_directory('.', 'index.html')
+    body, etag = _load_index()
+    if request.headers.get('If-None-Match') == etag:
+        return Response(status=304, headers={'ETag': etag})
+    return Response(body, mimetype='text/html', headers={'ETag': etag})
 
 @app.route('/index-app/')
 @app.route('/index-app/<path:filename>')
 def serve_index_app(filename='index.html'):
     """Serve index React app files"""
-    return send_from_directory('./index', filename)
+    return send_from_directory('./index', filename, conditional=True, max_age=3600)
 
 @app.route('/<path:filename>')
 def serve_static(filename):
     """Serve static files"""
-    return send_from_directory('.', filename)
+    return send_from_directory('.', filename, conditional=True, max_age=3600)
 
 # =============================================================================
 # HELPER FUNCTIONS
 # =============================================================================
 
+# Identical SQL literal every call keeps the prepared plan in sqlite3's
+# statement cache instead of re-parsing the query text
+_PROFILE_SQL = ('SELECT full_name, age, sex, weight, rehabilitation_stage, main_problems '
+                'FROM users WHERE id = ?')
+_SEX = {1: 'Male', 2: 'Female'}
+
+@cachetools.func.ttl_cache(maxsize=1024, ttl=300)
 def get_user_profile_for_ai(user_id):
-    """Get user profile formatted for AI analysis"""
+    """Get user profile formatted for AI analysis
+
+    Cached for 5 minutes; profiles only change via PUT /api/users/profile,
+    which clears the cache.
+    """
     try:
-        conn = sqlite3.connect("rehabtech_pro.db")
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT full_name, age, sex, weight, rehabilitation_stage, main_problems
-            FROM users WHERE id = ?
-        ''', (user_id,))
-        
+        cursor = get_conn().cursor()
+        cursor.execute(_PROFILE_SQL, (user_id,))
         user = cursor.fetchone()
-        conn.close()
-        
+
         if user:
             return {
                 'name': user[0],
                 'age': user[1],
-                'sex': 'Male' if user[2] == 1 else 'Female' if user[2] == 2 else 'Unknown',
+                'sex': _SEX.get(user[2], 'Unknown'),
                 'weight': user[3],
                 'rehabilitation_stage': user[4],
                 'main_problems': user[5]
             }
-        
+
         return {}
-        
+
     except Exception as e:
         print(f"Error getting user profile: {e}")
         return {}
 
+# Flush collected test samples every N rows or at least once a second,
+# so one commit covers a whole batch instead of fsyncing per sample
+COLLECT_FLUSH_SIZE = 50
+COLLECT_FLUSH_SECONDS = 1.0
+
+# Struct-array layout for the collection ring: numeric fields live in one
+# contiguous block instead of a new dict/tuple per sample (test_type,
+# session_id and user_id are constant per session so they stay out of it)
+_COLLECT_DTYPE = np.dtype([('ts', 'f8'), ('force', 'f4'), ('angle', 'f4'),
+                           ('quality', 'f4')])
+
+
+def _flush_ring(ring, head, test_type, session_id, user_id):
+    """Drain the first `head` rows of the ring into one batched insert"""
+    if head:
+        # NaN marks a channel absent from this test type; restore it to
+        # None so the missing channel persists as SQL NULL, not a fake 0
+        data_handler.save_batch(
+            [(ts, test_type,
+              None if force != force else force,
+              None if angle != angle else angle,
+              session_id, user_id, quality)
+             for ts, force, angle, quality in ring[:head].tolist()])
+
+
 def collect_data_background(test_type, session_id, user_id, duration, interval):
     """Background data collection function"""
     start_time = time.time()
     data_count = 0
-    
+
+    # Preallocated ring: the hot loop writes fields in place instead of
+    # allocating a tuple per sample, so long sessions stop churning the GC
+    ring = np.zeros(COLLECT_FLUSH_SIZE, dtype=_COLLECT_DTYPE)
+    head = 0
+    last_flush = time.time()
+
+    # One lookup up front; the loop works off this local reference so each
+    # sample doesn't pay two dict probes, and stop/flag checks can't race
+    # a concurrent pop of the session entry
+    session = current_sessions.get(session_id)
+    if session is None:
+        return
+    stop_event = session['stop_event']
+
     print(f"🚀 Starting background data collection: {test_type}, Session: {session_id}")
-    
-    while (session_id in current_sessions and 
-           current_sessions[session_id]['is_collecting'] and 
-           (time.time() - start_time) < duration):
-        try:
-            # Read sensor data
-            sensor_data = data_handler.read_sensor_data(test_type)
-            
-            if sensor_data:
-                # Save to database
-                data_handler.save_to_database(sensor_data, session_id, user_id)
-                data_count += 1
-                
-                # Update session data count
-                if session_id in current_sessions:
-                    current_sessions[session_id]['data_count'] = data_count
-                
-                # Print debug info
-                force_str = f"Force: {sensor_data.get('force_value', 'N/A'):.2f}N" if sensor_data.get('force_value') else ""
-                angle_str = f"Angle: {sensor_data.get('angle_value', 'N/A'):.2f}°" if sensor_data.get('angle_value') else ""
-                print(f"[{data_count}] {force_str} {angle_str} -> Saved")
-            
-            time.sleep(interval)
-            
-        except Exception as e:
-            print(f"❌ Data collection error: {e}")
-            break
-    
+
+    # Deadline-based pacing: sleeping a fixed interval after each sample
+    # accumulates read+save latency as drift and undershoots the sample rate
+    next_tick = time.monotonic()
+
+    try:
+        while (session['is_collecting'] and
+               not stop_event.is_set() and
+               (time.time() - start_time) < duration):
+            try:
+                # Read sensor data
+                sensor_data = data_handler.read_sensor_data(test_type)
+
+                if sensor_data:
+                    row = ring[head]
+                    # Each sample keeps its own capture time so batching
+                    # doesn't collapse a flush window onto one timestamp
+                    row['ts'] = sensor_data.get('timestamp') or time.time()
+                    force = sensor_data.get('force_value')
+                    angle = sensor_data.get('angle_value')
+                    # Single-channel tests carry None for the other channel;
+                    # keep that as NaN in the float ring (0.0 would be a
+                    # real reading)
+                    row['force'] = np.nan if force is None else force
+                    row['angle'] = np.nan if angle is None else angle
+                    row['quality'] = sensor_data.get('data_quality', 1.0)
+                    head += 1
+                    data_count += 1
+
+                    if (head >= COLLECT_FLUSH_SIZE or
+                            (time.time() - last_flush) > COLLECT_FLUSH_SECONDS):
+                        _flush_ring(ring, head, test_type, session_id, user_id)
+                        head = 0
+                        last_flush = time.time()
+
+                    # Update session data count
+                    session['data_count'] = data_count
+
+                    # Log sparsely; per-sample printing dominates fast loops
+                    if data_count % 100 == 0:
+                        logger.debug("sample %d force=%s angle=%s", data_count,
+                                     sensor_data.get('force_value'),
+                                     sensor_data.get('angle_value'))
+
+                next_tick += interval
+                sleep_for = next_tick - time.monotonic()
+                if sleep_for > 0:
+                    # Event.wait so a stop request cancels the sleep instantly
+                    if stop_event.wait(sleep_for):
+                        break
+                else:
+                    # Overran the deadline; resync instead of racing to catch up
+                    next_tick = time.monotonic()
+
+            except Exception as e:
+                print(f"❌ Data collection error: {e}")
+                break
+    finally:
+        # Persist whatever is still buffered when the loop exits
+        _flush_ring(ring, head, test_type, session_id, user_id)
+
     # Mark collection as stopped
-    if session_id in current_sessions:
-        current_sessions[session_id]['is_collecting'] = False
-    
+    session['is_collecting'] = False
+
     print(f"✅ Data collection completed - Total data points: {data_count}")
 
 # =============================================================================
 # APPLICATION STARTUP
 # =============================================================================
 
+if os.environ.get('REHABIT_GUNICORN') == '1' and __name__ != "__main__":
+    # Imported by a gunicorn worker: bring up the sensor stack here
+    init_components()
+
 if __name__ == "__main__":
     print("=" * 80)
     print("🏥 Regenix - ADVANCED REHABILITATION ANALYTICS PLATFORM")
     print("=" * 80)
-    
-    # Initialize components
-    init_components()
-    
-    print("\n✅ System initialization completed!")
-    print("🌐 Web server starting at: http://localhost:5000")
+
+    print("\n🌐 Web server starting at: http://localhost:5000")
     print("📖 API documentation: http://localhost:5000/api/system/status")
     print("\n📋 Available API Endpoints:")
     print("   🔐 Authentication:")
@@ -1036,17 +1470,50 @@ if __name__ == "__main__":
     print("=" * 80)
     
     try:
-        # Start Flask application
-        app.run(
-            host='0.0.0.0',  # Allow external access
-            port=5000,
-            debug=True,
-            use_reloader=False  # Avoid duplicate initialization
-        )
+        if os.environ.get('REHABIT_DEV') == '1':
+            # Werkzeug dev server: debugging only
+            init_components()
+            print("✅ System initialization completed!")
+            app.run(
+                host='0.0.0.0',  # Allow external access
+                port=5000,
+                debug=True,
+                threaded=True,  # Sensor endpoints block on ESP32 I/O; don't serialize clients
+                use_reloader=False  # Avoid duplicate initialization
+            )
+        else:
+            # Production: gunicorn with threaded workers. exec replaces this
+            # launcher process, so only the single worker ever initializes
+            # the sensor stack (REHABIT_GUNICORN makes it do so on import) —
+            # no second process holding a poller/collector/DB writer.
+            import sys
+            os.environ['REHABIT_GUNICORN'] = '1'
+            if sys.platform != 'win32':
+                try:
+                    os.execvp('gunicorn', [
+                        'gunicorn', '-w', '1', '-k', 'gthread',
+                        '--threads', '8', '-b', '0.0.0.0:5000', 'app:app'
+                    ])
+                except FileNotFoundError:
+                    print("⚠️ gunicorn not found, falling back to the "
+                          "built-in threaded server")
+            # Windows (start_app.bat runs `python app.py`; gunicorn can't
+            # run there) or no gunicorn installed: serve in-process instead
+            os.environ.pop('REHABIT_GUNICORN', None)
+            init_components()
+            print("✅ System initialization completed!")
+            app.run(
+                host='0.0.0.0',
+                port=5000,
+                threaded=True,
+                use_reloader=False
+            )
     except KeyboardInterrupt:
         print("\n\n🛑 System shutting down safely...")
+        _collector_pool.shutdown(wait=False, cancel_futures=True)
         if data_handler:
             data_handler.close()
+        close_all()
         print("👋 Goodbye!")
     except Exception as e:
         print(f"❌ Startup failed: {e}")
\ No newline at end of file
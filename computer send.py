@@ -4,107 +4,190 @@ WiFi传感器测试程序
 通过WiFi HTTP请求向传感器发送测试数据
 
 替代原来的串口通信方式
+
+异步版本：发送任务与1Hz节奏解耦，单个慢请求不会拖慢发送频率
 """
 
+import asyncio
+import os
 import random
+import socket
 import time
-import requests
-import json
+
+import aiohttp
+import orjson
 
 # WiFi传感器配置
 SENSOR_IP = "192.168.1.100"  # 修改为你的传感器IP地址
 SENSOR_PORT = 80
 SENSOR_URL = f"http://{SENSOR_IP}:{SENSOR_PORT}/api/data"
 
-print("=" * 60)
-print("WiFi传感器测试程序")
-print("=" * 60)
-print(f"传感器地址: {SENSOR_URL}")
-print("按 Ctrl+C 停止发送")
-print("=" * 60)
-
-# 测试WiFi连接
-try:
-    print("\n正在测试WiFi连接...")
-    response = requests.get(f"http://{SENSOR_IP}:{SENSOR_PORT}/api/health", timeout=5)
-    if response.status_code == 200:
-        print(f"✅ WiFi传感器连接成功: {SENSOR_IP}:{SENSOR_PORT}")
-    else:
-        print(f"⚠️ WiFi传感器响应异常，状态码: {response.status_code}")
-        print("提示: 请确认传感器IP地址和端口是否正确")
-except requests.exceptions.RequestException as e:
-    print(f"❌ WiFi传感器连接失败: {e}")
-    print("提示: 请检查以下项目:")
-    print("  1. 传感器是否已开机并连接到WiFi")
-    print("  2. 电脑和传感器是否在同一网络")
-    print("  3. SENSOR_IP 是否设置正确")
-    print("\n将继续运行，每次发送时会尝试连接...")
-
-print("\n开始发送测试数据...\n")
-
-# 发送测试数据
+# 传输协议: http (默认) / udp / tcp
+# ESP固件支持原始socket时，换行分隔的JSON比HTTP省掉约300字节的头部开销
+SENSOR_PROTOCOL = os.environ.get("SENSOR_PROTOCOL", "http").lower()
+
+# 发送统计
 send_count = 0
 error_count = 0
 
-while True:
+
+def print_error_hint():
+    print("\n" + "=" * 60)
+    print("⚠️ 警告: 连续错误超过10次")
+    print("建议检查:")
+    print("  1. WiFi传感器是否正常运行")
+    print("  2. 网络连接是否稳定")
+    print("  3. IP地址是否正确")
+    print("=" * 60 + "\n")
+
+
+async def test_connection(session):
+    """测试WiFi连接"""
+    try:
+        print("\n正在测试WiFi连接...")
+        async with session.get(
+            f"http://{SENSOR_IP}:{SENSOR_PORT}/api/health",
+            timeout=aiohttp.ClientTimeout(total=5)
+        ) as response:
+            if response.status == 200:
+                print(f"✅ WiFi传感器连接成功: {SENSOR_IP}:{SENSOR_PORT}")
+            else:
+                print(f"⚠️ WiFi传感器响应异常，状态码: {response.status}")
+                print("提示: 请确认传感器IP地址和端口是否正确")
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        print(f"❌ WiFi传感器连接失败: {e}")
+        print("提示: 请检查以下项目:")
+        print("  1. 传感器是否已开机并连接到WiFi")
+        print("  2. 电脑和传感器是否在同一网络")
+        print("  3. SENSOR_IP 是否设置正确")
+        print("\n将继续运行，每次发送时会尝试连接...")
+
+
+async def send_one(session):
+    """发送一条测试数据（独立任务，不阻塞发送节奏）"""
+    global send_count, error_count
+
+    test_data = make_test_data()
+
     try:
-        # 生成随机测试数据
-        test_data = {
-            "force": round(random.uniform(10, 100), 2),  # 拉力: 10-100N
-            "angle": round(random.uniform(0, 180), 2),   # 角度: 0-180度
-            "timestamp": time.time(),
-            "quality": random.uniform(0.85, 1.0)
-        }
-
-        # 通过WiFi HTTP POST发送数据到传感器
-        response = requests.post(
+        async with session.post(
             SENSOR_URL,
             json=test_data,
-            timeout=5
-        )
-
-        if response.status_code == 200:
-            send_count += 1
-            print(f"[{send_count:04d}] ✅ 发送成功 -> Force: {test_data['force']:.2f}N, Angle: {test_data['angle']:.2f}°")
-            error_count = 0  # 重置错误计数
-        else:
-            error_count += 1
-            print(f"[WARN] ⚠️ 发送失败，HTTP状态码: {response.status_code}")
-
-    except requests.exceptions.Timeout:
+            timeout=aiohttp.ClientTimeout(total=5)
+        ) as response:
+            if response.status == 200:
+                send_count += 1
+                print(f"[{send_count:04d}] ✅ 发送成功 -> Force: {test_data['force']:.2f}N, Angle: {test_data['angle']:.2f}°")
+                error_count = 0  # 重置错误计数
+            else:
+                error_count += 1
+                print(f"[WARN] ⚠️ 发送失败，HTTP状态码: {response.status}")
+
+    except asyncio.TimeoutError:
         error_count += 1
         print(f"[ERROR] ❌ 请求超时 (错误次数: {error_count})")
 
-    except requests.exceptions.ConnectionError:
+    except aiohttp.ClientConnectionError:
         error_count += 1
         print(f"[ERROR] ❌ 连接失败，无法连接到传感器 (错误次数: {error_count})")
 
-    except requests.exceptions.RequestException as e:
+    except aiohttp.ClientError as e:
         error_count += 1
         print(f"[ERROR] ❌ WiFi通信错误: {e} (错误次数: {error_count})")
 
+    except Exception as e:
+        error_count += 1
+        print(f"[ERROR] ❌ 未知错误: {e}")
+
+
+def make_test_data():
+    """构造一条测试数据"""
+    return {
+        "force": round(random.uniform(10, 100), 2),  # 拉力: 10-100N
+        "angle": round(random.uniform(0, 180), 2),   # 角度: 0-180度
+        "timestamp": time.time(),
+        "quality": random.uniform(0.85, 1.0)
+    }
+
+
+def main_socket():
+    """UDP/TCP发送循环：单个持久socket + 换行分隔JSON，不需要HTTP头部"""
+    global send_count, error_count
+
+    if SENSOR_PROTOCOL == "udp":
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    else:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.connect((SENSOR_IP, SENSOR_PORT))  # 三次握手只做一次
+        print(f"✅ TCP连接成功: {SENSOR_IP}:{SENSOR_PORT}")
+
+    print("\n开始发送测试数据...\n")
+
+    with sock:
+        while True:
+            test_data = make_test_data()
+            line = orjson.dumps(test_data) + b"\n"
+
+            try:
+                if SENSOR_PROTOCOL == "udp":
+                    sock.sendto(line, (SENSOR_IP, SENSOR_PORT))
+                else:
+                    sock.sendall(line)
+                send_count += 1
+                print(f"[{send_count:04d}] ✅ 发送成功 -> Force: {test_data['force']:.2f}N, Angle: {test_data['angle']:.2f}°")
+                error_count = 0
+            except OSError as e:
+                error_count += 1
+                print(f"[ERROR] ❌ socket发送失败: {e} (错误次数: {error_count})")
+
+            if error_count > 10:
+                print_error_hint()
+                error_count = 0
+
+            time.sleep(1.0)
+
+
+async def main():
+    global error_count
+
+    connector = aiohttp.TCPConnector(limit=16, keepalive_timeout=30)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await test_connection(session)
+
+        print("\n开始发送测试数据...\n")
+
+        while True:
+            # fire-and-forget：请求延迟不影响1Hz的发送节奏
+            asyncio.create_task(send_one(session))
+
+            # 如果连续错误超过10次，提示用户
+            if error_count > 10:
+                print_error_hint()
+                error_count = 0  # 重置错误计数
+
+            # 每秒发送一次
+            await asyncio.sleep(1.0)
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("WiFi传感器测试程序")
+    print("=" * 60)
+    if SENSOR_PROTOCOL in ("udp", "tcp"):
+        print(f"传感器地址: {SENSOR_PROTOCOL}://{SENSOR_IP}:{SENSOR_PORT}")
+    else:
+        print(f"传感器地址: {SENSOR_URL}")
+    print("按 Ctrl+C 停止发送")
+    print("=" * 60)
+
+    try:
+        if SENSOR_PROTOCOL in ("udp", "tcp"):
+            main_socket()
+        else:
+            asyncio.run(main())
     except KeyboardInterrupt:
         print("\n\n" + "=" * 60)
         print("程序已停止")
         print(f"总计发送: {send_count} 次")
         print(f"错误次数: {error_count} 次")
         print("=" * 60)
-        break
-
-    except Exception as e:
-        error_count += 1
-        print(f"[ERROR] ❌ 未知错误: {e}")
-
-    # 如果连续错误超过10次，提示用户
-    if error_count > 10:
-        print("\n" + "=" * 60)
-        print("⚠️ 警告: 连续错误超过10次")
-        print("建议检查:")
-        print("  1. WiFi传感器是否正常运行")
-        print("  2. 网络连接是否稳定")
-        print("  3. IP地址是否正确")
-        print("=" * 60 + "\n")
-        error_count = 0  # 重置错误计数
-
-    # 每秒发送一次
-    time.sleep(1)
@@ -0,0 +1,68 @@
+"""
+SQLite连接管理器 - 线程本地连接池
+
+Every endpoint used to open/close its own connection to rehabtech_pro.db,
+throwing away SQLite's page cache on each request. Here we keep:
+- one shared read-write connection guarded by write_lock (single writer)
+- one thread-local read connection per worker thread (N readers)
+"""
+
+import sqlite3
+import threading
+
+DB_PATH = 'rehabtech_pro.db'
+
+_local = threading.local()
+
+# Single shared writer connection + lock (SQLite allows only one writer anyway)
+write_lock = threading.Lock()
+_write_conn = None
+_init_lock = threading.Lock()
+
+
+def _apply_pragmas(conn):
+    """Apply WAL + tuning PRAGMAs once per connection
+
+    WAL lets sensor inserts (2 Hz) run concurrently with user API reads
+    instead of serializing them behind the rollback journal.
+    """
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    conn.execute('PRAGMA mmap_size=268435456')  # 256 MB
+    conn.execute('PRAGMA cache_size=-65536')    # 64 MB page cache
+    conn.execute('PRAGMA busy_timeout=5000')
+
+
+def get_conn():
+    """Get the calling thread's read connection (created lazily, kept warm)"""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False,
+                                       cached_statements=256)
+        conn.row_factory = sqlite3.Row
+        _apply_pragmas(conn)
+        _local.conn = conn
+    return conn
+
+
+def get_write_conn():
+    """Get the shared write connection (hold write_lock while using it)"""
+    global _write_conn
+    if _write_conn is None:
+        with _init_lock:
+            if _write_conn is None:
+                conn = sqlite3.connect(DB_PATH, check_same_thread=False,
+                                       cached_statements=256)
+                conn.row_factory = sqlite3.Row
+                _apply_pragmas(conn)
+                _write_conn = conn
+    return _write_conn
+
+
+def close_all():
+    """Close the shared writer (thread-local readers die with their threads)"""
+    global _write_conn
+    if _write_conn is not None:
+        _write_conn.close()
+        _write_conn = None
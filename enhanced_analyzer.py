@@ -1,232 +1,496 @@
 from sklearn.preprocessing import StandardScaler
+import concurrent.futures
+import logging
+import os
 import sqlite3
+import threading
+import numpy as np
 import pandas as pd
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
 from sklearn.metrics import silhouette_score
-import json
+import orjson
+from collections import OrderedDict
 from datetime import datetime
 from plotly.subplots import make_subplots
 import plotly.graph_objects as go
 
+# pyarrow列后端：跳过sqlite3逐行Python对象装箱，float32内存减半
+# 没装pyarrow时退回pandas默认路径
+try:
+    import pyarrow  # noqa: F401
+    _ARROW_READ_KW = {
+        'dtype_backend': 'pyarrow',
+        'dtype': {'force_value': 'float32[pyarrow]',
+                  'angle_value': 'float32[pyarrow]'},
+    }
+except ImportError:
+    _ARROW_READ_KW = {}
+
+# ADBC驱动直接从sqlite吐Arrow批，跳过DB-API逐行Python对象构造
+# （时间戳走i64纳秒而不是str→datetime），没装就退回read_sql_query
+try:
+    from adbc_driver_sqlite import dbapi as adbc_sqlite
+except ImportError:
+    adbc_sqlite = None
+
+# numba把评分核函数编译成机器码（长会话上~10×）；没装时核函数照常以
+# 纯Python/NumPy跑，语义一致
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        def _passthrough(func):
+            return func
+        return _passthrough
+
+
+# 一维自然断点（Fisher-Jenks精确解）；没装jenkspy时退化为分位数切分
+try:
+    import jenkspy
+except ImportError:
+    jenkspy = None
+
+# bottleneck的C实现nan归约比np.nan*快2-5×；pandas装了它也会自动加速
+# 自身的Series归约。缺依赖时退回numpy同名函数
+try:
+    import bottleneck as bn
+    _nanmean = bn.nanmean
+except ImportError:
+    _nanmean = np.nanmean
+
+# orjson原生支持numpy标量，分析结果不用再逐个float()/int()装箱
+# （orjson默认就是UTF-8输出，等价于ensure_ascii=False）
+_DUMP_OPTS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def _dump_results(results):
+    return orjson.dumps(results, option=_DUMP_OPTS).decode()
+
+
+@njit(cache=True, fastmath=True)
+def _score_angle(angle):
+    return (np.nanmax(angle) - np.nanmin(angle)) / 90.0 * 100.0
+
+
+@njit(cache=True, fastmath=True)
+def _score_force(force):
+    return (300.0 - np.nanmax(force)) / 300.0
+
+
+@njit(cache=True, fastmath=True)
+def _score_force_angle(force, angle):
+    # 数组已按timestamp有序，顺序找第一个受力>10N时的角度（NaN>10为假）
+    first_angle = angle[0]
+    for i in range(force.shape[0]):
+        if force[i] > 10.0:
+            first_angle = angle[i]
+            break
+    amax = np.nanmax(angle)
+    amin = np.nanmin(angle)
+    angle_score = (amax - first_angle) / (amax - amin) * 100.0
+    force_score = (300.0 - np.nanmax(force)) / 300.0
+    return (angle_score + force_score) / 2.0
+
+# 热循环里的print会全局串行化stdout（并行分析时尤其明显），
+# 调试输出走logger.debug，默认不开
+logger = logging.getLogger(__name__)
+
+
+def _parse_timestamps(series):
+    """sensor_data.timestamp兼容两种存储：新库epoch微秒整数，旧库TEXT"""
+    if pd.api.types.is_numeric_dtype(series):
+        return pd.to_datetime(series, unit='us')
+    return pd.to_datetime(series)
+
+
 class EnhancedRehabilitationAnalyzer:
     def __init__(self,db_path = 'rehabilitation_data.db'):
-        self.db_path = db_path 
+        self.db_path = db_path
         self.scaler=StandardScaler()
+        # 每次分析都重新connect会反复支付连接建立+日志初始化成本，
+        # 这里保持一个长连接并调好PRAGMA（WAL下读写互不阻塞）
+        self._conn = sqlite3.connect(db_path, check_same_thread=False,
+                                     isolation_level=None)
+        self._conn.executescript('''
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            PRAGMA temp_store=MEMORY;
+            PRAGMA mmap_size=268435456;
+            PRAGMA cache_size=-65536;
+            PRAGMA busy_timeout=5000;
+        ''')
+        # 分析查询的覆盖索引：按会话取数/按用户取历史都从全表扫描降为索引查找
+        try:
+            self._conn.executescript('''
+                CREATE INDEX IF NOT EXISTS idx_sensor_session_ts
+                    ON sensor_data(session_id, timestamp);
+                CREATE INDEX IF NOT EXISTS idx_sensor_session_type_ts
+                    ON sensor_data(session_id, test_type, timestamp);
+                CREATE INDEX IF NOT EXISTS idx_sensor_ts ON sensor_data(timestamp);
+                CREATE INDEX IF NOT EXISTS idx_training_user
+                    ON training_sessions(user_id, session_id);
+            ''')
+        except sqlite3.OperationalError as e:
+            # 表还没建好（独立使用时）——查询自己会报错，这里不拦初始化
+            print(f"分析索引创建跳过: {e}")
+        # 新建库的force/angle以定点整数存储（×100，厘牛/厘度），旧库是
+        # REAL物理值——按列声明类型判定一次，读出后统一还原为物理单位
+        try:
+            cols = {row[1]: (row[2] or '').upper() for row in
+                    self._conn.execute('PRAGMA table_info(sensor_data)')}
+            self._fixed_values = cols.get('force_value') == 'INTEGER'
+        except sqlite3.OperationalError:
+            self._fixed_values = False
+        # 同一会话常被连续分析多次（综合分析→可视化→对比），
+        # 小LRU缓存让重复加载免掉SQL查询+DataFrame构建
+        self._df_cache = OrderedDict()
+        # 只读ADBC连接（可选）：Arrow批流加载原始行
+        self._adbc_conn = None
+        if adbc_sqlite is not None:
+            try:
+                self._adbc_conn = adbc_sqlite.connect(
+                    'file:{}?mode=ro'.format(db_path))
+            except Exception as e:
+                print(f"ADBC连接不可用，退回sqlite3: {e}")
+
+    def _read_df(self, query, params):
+        """原始行加载：优先ADBC的Arrow路径，缺驱动时走read_sql_query"""
+        if self._adbc_conn is not None:
+            with self._adbc_conn.cursor() as cur:
+                cur.execute(query, params)
+                return cur.fetch_arrow_table().to_pandas(types_mapper=pd.ArrowDtype)
+        return pd.read_sql_query(query, self._conn, params=params, **_ARROW_READ_KW)
+
+    def close(self):
+        if self._adbc_conn is not None:
+            self._adbc_conn.close()
+            self._adbc_conn = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    @staticmethod
+    def _mark_columns(df):
+        df.attrs['has_force'] = (not df.empty and
+                                 bool(df['force_value'].notna().any()))
+        df.attrs['has_angle'] = (not df.empty and
+                                 bool(df['angle_value'].notna().any()))
+
+    _DF_CACHE_SIZE = 64
+
+    def _df_cache_get(self, key):
+        df = self._df_cache.get(key)
+        if df is not None:
+            self._df_cache.move_to_end(key)
+        return df
+
+    def _df_cache_put(self, key, df):
+        self._df_cache[key] = df
+        if len(self._df_cache) > self._DF_CACHE_SIZE:
+            self._df_cache.popitem(last=False)
+
     def load_session_data(self,session_id):
-        conn = sqlite3.connect(self.db_path)
+        cached = self._df_cache_get(('session', session_id))
+        if cached is not None:
+            return cached
         query = '''
             SELECT timestamp, test_type, force_value, angle_value
             FROM sensor_data
             WHERE session_id = ?
             ORDER BY timestamp
         '''
-        df = pd.read_sql_query(query,conn,params=(session_id,))
-        conn.close()
+        df = self._read_df(query, (session_id,))
 
         if not df.empty:
-            df['timestamp']=pd.to_datetime(df['timestamp'])
-            df=df.fillna(0)
+            df['timestamp']=_parse_timestamps(df['timestamp'])
+            # 缺测保留为NaN：全帧fillna(0)既多一次整帧拷贝，
+            # 又会把填出来的0当真实读数算进均值/最小值
+            # 三个固定取值的列用category存：比较变成int8等值判断，内存减半
+            df['test_type']=df['test_type'].astype('category')
+            if self._fixed_values:
+                df['force_value'] = df['force_value'] / 100.0
+                df['angle_value'] = df['angle_value'] / 100.0
 
+        # SQL已按timestamp排好序，标记出来让下游免掉O(N log N)重排；
+        # 两列的有效性也在这里扫一次，下游直接读attrs不再重复notna().any()
+        df.attrs['sorted_by'] = 'timestamp'
+        self._mark_columns(df)
+        self._df_cache_put(('session', session_id), df)
         return df
     def load_user_historical_data(self,user_id,days=30):
-        conn = sqlite3.connect(self.db_path)
+        cached = self._df_cache_get(('history', user_id, days))
+        if cached is not None:
+            return cached
+        # 时间过滤按存储类型分别比较：整数时间戳和TEXT在SQLite里
+        # 跨类型永远比不出有意义的结果
         query = '''
             SELECT s.timestamp, s.test_type, s.force_value, s.angle_value, s.session_id
             FROM sensor_data s
             JOIN training_sessions ts ON s.session_id = ts.session_id
             WHERE ts.user_id = ?
-            AND s.timestamp >= date('now', '-{} days')
-            ORDER BY s.timestamp 
-        '''.format(days)
+            AND (CASE typeof(s.timestamp)
+                 WHEN 'integer' THEN s.timestamp >=
+                     CAST(strftime('%s', 'now', '-{days} days') AS INTEGER) * 1000000
+                 ELSE s.timestamp >= date('now', '-{days} days') END)
+            ORDER BY s.timestamp
+        '''.format(days=days)
 
-        df = pd.read_sql_query(query, conn, params=(user_id,))
-        conn.close()
+        df = self._read_df(query, (user_id,))
         if not df.empty:
-            df['timestamp']=pd.to_datetime(df['timestamp'])
-            df=df.fillna(0)
+            df['timestamp']=_parse_timestamps(df['timestamp'])
+            df['test_type']=df['test_type'].astype('category')
+            if self._fixed_values:
+                df['force_value'] = df['force_value'] / 100.0
+                df['angle_value'] = df['angle_value'] / 100.0
+        df.attrs['sorted_by'] = 'timestamp'
+        self._mark_columns(df)
+        self._df_cache_put(('history', user_id, days), df)
+        return df
+    def load_user_session_aggregates(self,user_id,days=30):
+        """
+        按(session_id, test_type)在SQL侧聚合
+        行数从O(样本数)降到O(会话数×测试类型)，避免把全部原始数据拉进pandas
+        """
+        query = '''
+            SELECT s.session_id, s.test_type,
+                   MIN(s.timestamp) AS t_min,
+                   MAX(s.timestamp) AS t_max,
+                   AVG(s.force_value) AS avg_force,
+                   MAX(s.force_value) AS max_force,
+                   AVG(s.angle_value) AS avg_angle,
+                   MAX(s.angle_value) AS max_angle,
+                   MIN(s.angle_value) AS min_angle,
+                   (SELECT s2.angle_value FROM sensor_data s2
+                    WHERE s2.session_id = s.session_id AND s2.force_value > 0
+                    ORDER BY s2.timestamp LIMIT 1) AS first_angle
+            FROM sensor_data s
+            JOIN training_sessions ts ON s.session_id = ts.session_id
+            WHERE ts.user_id = ?
+            AND (CASE typeof(s.timestamp)
+                 WHEN 'integer' THEN s.timestamp >=
+                     CAST(strftime('%s', 'now', '-{days} days') AS INTEGER) * 1000000
+                 ELSE s.timestamp >= date('now', '-{days} days') END)
+            GROUP BY s.session_id, s.test_type
+            ORDER BY t_min
+        '''.format(days=days)
+        df = pd.read_sql_query(query, self._conn, params=(user_id,))
+        if not df.empty:
+            df['t_min']=_parse_timestamps(df['t_min'])
+            df['t_max']=_parse_timestamps(df['t_max'])
+            if self._fixed_values:
+                # 聚合在定点整数上算完再整体还原，比逐行CASE便宜
+                for col in ('avg_force', 'max_force', 'avg_angle',
+                            'max_angle', 'min_angle', 'first_angle'):
+                    df[col] = df[col] / 100.0
         return df
     def basic_statistical_analysis(self, df):
         if df.empty:
             return{'error':'No data found'}
+        # 一次groupby把6种统计量算完（单趟Cython归约），
+        # 替代逐test_type切片后再跑6趟.mean/.std/...的做法
+        # 加载时标好的列有效性让全空列直接跳过聚合
+        empty_flags = {'force_value': df.attrs.get('has_force') is False,
+                       'angle_value': df.attrs.get('has_angle') is False}
+        value_cols = [c for c in ('force_value', 'angle_value')
+                      if c in df.columns and not empty_flags[c]]
+        stats = df.groupby('test_type', observed=True, sort=False)[value_cols].agg(
+            ['mean', 'std', 'min', 'max', 'median', 'count'])
+
         analysis = {}
-        for test_type in df['test_type'].unique():
-            test_data = df[df['test_type'] == test_type]
+        for test_type, row in stats.iterrows():
             type_analysis = {}
-            
-            if 'force_value' in test_data.columns and test_data['force_value'].notna().any():
-                force_data = test_data['force_value'].dropna()
-                type_analysis['force'] = {
-                    'mean': float(force_data.mean()),
-                    'std': float(force_data.std()),
-                    'min': float(force_data.min()),
-                    'max': float(force_data.max()),
-                    'median': float(force_data.median()),
-                    'count': int(len(force_data))
-                }
-            
-            if 'angle_value' in test_data.columns and test_data['angle_value'].notna().any():
-                angle_data = test_data['angle_value'].dropna()
-                type_analysis['angle'] = {
-                    'mean': float(angle_data.mean()),
-                    'std': float(angle_data.std()),
-                    'min': float(angle_data.min()),
-                    'max': float(angle_data.max()),
-                    'median': float(angle_data.median()),
-                    'count': int(len(angle_data))
-                }
-            
+            for col, key in (('force_value', 'force'), ('angle_value', 'angle')):
+                # count统计的是非NaN行，等价于原来的dropna非空判断
+                if col in value_cols and row[(col, 'count')] > 0:
+                    type_analysis[key] = {
+                        'mean': row[(col, 'mean')],
+                        'std': row[(col, 'std')],
+                        'min': row[(col, 'min')],
+                        'max': row[(col, 'max')],
+                        'median': row[(col, 'median')],
+                        'count': row[(col, 'count')]
+                    }
             analysis[test_type] = type_analysis
-        
+
         return analysis
     
+    # 每种测试类型关注的会话级指标 / 整体趋势字段
+    _SESSION_METRICS = {
+        'force test': ('avg_force', 'max_force'),
+        'angle test': ('avg_angle', 'max_angle'),
+        'force and angle test': ('avg_angle', 'max_angle', 'avg_force', 'max_force'),
+    }
+    _IMPROVEMENT_COLS = {
+        'force test': (('force_improvement', 'force_value'),),
+        'angle test': (('angle_improvement', 'angle_value'),),
+        'force and angle test': (('force_improvement', 'force_value'),
+                                 ('angle_improvement', 'angle_value')),
+    }
+
     def trend_analysis(self,df):
 
         if df.empty:
             return {"error": "数据为空"}
         if 'session_id' in df.columns:
+            # 单次groupby聚合替代逐test_type/逐session的重复过滤扫描
+            agg = df.groupby(['test_type', 'session_id'], observed=True, sort=False).agg(
+                t_min=('timestamp', 'min'),
+                t_max=('timestamp', 'max'),
+                avg_force=('force_value', 'mean'),
+                max_force=('force_value', 'max'),
+                avg_angle=('angle_value', 'mean'),
+                max_angle=('angle_value', 'max'))
+            agg['duration_minutes'] = (agg['t_max'] - agg['t_min']).dt.total_seconds() / 60
+
             trends = {}
-            for test_type in df['test_type'].unique():
-                print(test_type)
+            if df.attrs.get('sorted_by') == 'timestamp':
+                df_sorted = df
+            else:
+                df_sorted = df.sort_values('timestamp', kind='stable')
+            for test_type, ydf in df_sorted.groupby('test_type', observed=True, sort=False):
+                logger.debug('trend analysis: %s', test_type)
                 type_analysis = {}
+                metrics = self._SESSION_METRICS.get(test_type)
 
-                if test_type == 'force test':
-                    ydf = df[df['test_type'] == 'force test']
-                    #print(ydf)
+                if metrics is not None:
                     session_trends = []
-                    for session_id in ydf['session_id'].unique():
-                        session_data = ydf[ydf['session_id'] == session_id]
-
+                    for session_id, row in agg.loc[test_type].iterrows():
                         session_analysis = {
-                        'session_id': session_id,
-                        'timestamp': session_data['timestamp'].min().isoformat(),
-                        'duration_minutes': (session_data['timestamp'].max() - 
-                                        session_data['timestamp'].min()).total_seconds() / 60
-                    }
-                        session_analysis['avg_force'] = float(session_data['force_value'].mean())
-                        session_analysis['max_force'] = float(session_data['force_value'].max())
-                        session_trends.append(session_analysis)
-                    type_analysis['session_trends'] = session_trends 
-                    ydf_sorted = ydf.sort_values('timestamp')
-                    if len(ydf_sorted)>10:
-                        mid_point = len(ydf_sorted) // 2
-                        first_half = ydf_sorted.iloc[:mid_point]
-                        second_half = ydf_sorted.iloc[mid_point:]
-                        type_analysis['overall_trends'] = {}
-                        force_change = (second_half['force_value'].mean() - first_half['force_value'].mean())
-                        type_analysis['overall_trends']['force_improvement'] = {
-                            'change': float(force_change),
-                            'percentage': float((force_change / first_half['force_value'].mean()) * 100) if first_half['force_value'].mean() != 0 else 0
+                            'session_id': session_id,
+                            'timestamp': row['t_min'].isoformat(),
+                            'duration_minutes': row['duration_minutes']
                         }
-                    #trends[test_type] = type_analysis
-                
-                elif test_type == 'angle test':
-                    ydf = df[df['test_type'] == 'angle test']
-                    #print(ydf)
-                    session_trends = []
-                    for session_id in ydf['session_id'].unique():
-                        session_data = ydf[ydf['session_id'] == session_id]
-
-                        session_analysis = {
-                        'session_id': session_id,
-                        'timestamp': session_data['timestamp'].min().isoformat(),
-                        'duration_minutes': (session_data['timestamp'].max() - 
-                                        session_data['timestamp'].min()).total_seconds() / 60
-                    }
-                        session_analysis['avg_angle'] = float(session_data['angle_value'].mean())
-                        session_analysis['max_angle'] = float(session_data['angle_value'].max())
+                        for metric in metrics:
+                            session_analysis[metric] = row[metric]
                         session_trends.append(session_analysis)
-                    type_analysis['session_trends'] = session_trends 
-                    ydf_sorted = ydf.sort_values('timestamp')
-                    if len(ydf_sorted)>10:
-                        mid_point = len(ydf_sorted) // 2
-                        first_half = ydf_sorted.iloc[:mid_point]
-                        second_half = ydf_sorted.iloc[mid_point:]
-                        type_analysis['overall_trends'] = {}
-                        angle_change = (second_half['angle_value'].mean() - first_half['angle_value'].mean())
+                    type_analysis['session_trends'] = session_trends
 
-                        type_analysis['overall_trends']['angle_improvement'] = {
-                            'change': float(angle_change),
-                            'percentage': float((angle_change / first_half['angle_value'].mean()) * 100) if first_half['angle_value'].mean() != 0 else 0
-                        }
-                    #trends[test_type] = type_analysis
-
-                    
-                elif test_type == 'force and angle test':
-                    ydf = df[df['test_type'] == 'force and angle test']
-                    #print(ydf)
-                    session_trends = []
-                    for session_id in ydf['session_id'].unique():
-                        session_data = ydf[ydf['session_id'] == session_id]
-
-                        session_analysis = {
-                        'session_id': session_id,
-                        'timestamp': session_data['timestamp'].min().isoformat(),
-                        'duration_minutes': (session_data['timestamp'].max() - 
-                                        session_data['timestamp'].min()).total_seconds() / 60
-                    }
-                        session_analysis['avg_angle'] = float(session_data['angle_value'].mean())
-                        session_analysis['max_angle'] = float(session_data['angle_value'].max())
-                        session_analysis['avg_force'] = float(session_data['force_value'].mean())
-                        session_analysis['max_force'] = float(session_data['force_value'].max())
-                        session_trends.append(session_analysis)
-                    type_analysis['session_trends'] = session_trends 
-                    ydf_sorted = ydf.sort_values('timestamp')
-                    if len(ydf_sorted)>10:
-                        mid_point = len(ydf_sorted) // 2
-                        first_half = ydf_sorted.iloc[:mid_point]
-                        second_half = ydf_sorted.iloc[mid_point:]
+                    if len(ydf) > 10:
                         type_analysis['overall_trends'] = {}
-                        angle_change = (second_half['angle_value'].mean() - first_half['angle_value'].mean())
-                        force_change = (second_half['force_value'].mean() - first_half['force_value'].mean())
+                        for key, col in self._IMPROVEMENT_COLS[test_type]:
+                            # 前后半段均值对比：numpy视图，零拷贝，nan感知归约
+                            first_half, second_half = np.array_split(
+                                ydf[col].to_numpy(dtype=np.float64), 2)
+                            first_mean = _nanmean(first_half)
+                            change = _nanmean(second_half) - first_mean
+                            type_analysis['overall_trends'][key] = {
+                                'change': change,
+                                'percentage': (change / first_mean) * 100 if first_mean != 0 else 0
+                            }
 
-                        type_analysis['overall_trends']['force_improvement'] = {
-                            'change': float(force_change),
-                            'percentage': float((force_change / first_half['force_value'].mean()) * 100) if first_half['force_value'].mean() != 0 else 0
-                        }
-                        type_analysis['overall_trends']['angle_improvement'] = {
-                            'change': float(angle_change),
-                            'percentage': float((angle_change / first_half['angle_value'].mean()) * 100) if first_half['angle_value'].mean() != 0 else 0
-                        }
-                    
-                
                 trends[test_type] = type_analysis
                 #print(trends)
 
             return trends
         
+    @staticmethod
+    def _make_kmeans(k, n_features):
+        # 单特征聚类用MiniBatch版本：批量更新少跑几轮Lloyd迭代就收敛
+        if n_features == 1:
+            return MiniBatchKMeans(n_clusters=k, random_state=42,
+                                   n_init=3, batch_size=1024)
+        return KMeans(n_clusters=k, random_state=42, n_init=3, algorithm='elkan')
+
+    @staticmethod
+    def _cluster_1d(arr):
+        """
+        一维聚类：自然断点/分位数切分的O(kN)精确解
+        KMeans迭代和O(N²)的silhouette对单列数据都是多余的；
+        选k用GVF（组内方差消减比），取第一个达到0.8的k
+        """
+        sdam = np.sum((arr - arr.mean()) ** 2)
+        best = None
+        max_classes = min(5, len(np.unique(arr)) - 1)
+        for k in range(2, max(max_classes, 2) + 1):
+            if jenkspy is not None:
+                breaks = np.asarray(jenkspy.jenks_breaks(arr, n_classes=k))
+            else:
+                breaks = np.quantile(arr, np.linspace(0.0, 1.0, k + 1))
+            labels = np.clip(np.searchsorted(breaks[1:-1], arr, side='right'),
+                             0, k - 1)
+            sdcm = 0.0
+            centers = []
+            for c in range(k):
+                members = arr[labels == c]
+                if members.size:
+                    center = members.mean()
+                    sdcm += np.sum((members - center) ** 2)
+                    centers.append([center])
+            gvf = 1.0 - sdcm / sdam if sdam > 0 else 1.0
+            best = {
+                'n_clusters': int(len(centers)),
+                'silhoutte_score': gvf,
+                'cluster_centers': centers,
+                'cluster_lables': labels.tolist()
+            }
+            if gvf >= 0.8:
+                break
+        return best
+
+    # 每种测试类型参与聚类的特征列（查表替代逐类型的字符串分支，
+    # 顺带修掉原分支里'angle_test'/'force and angle_est'的拼写错配）
+    _CLUSTER_FEATURES = {
+        'force test': ['force_value'],
+        'angle test': ['angle_value'],
+        'force and angle test': ['force_value', 'angle_value'],
+    }
+
     def performance_clustering(self,df):
         if 'session_id' in df.columns:
+            if df.empty or len(df)<=15:
+                return {'Data insufficient for clustering'}
             clustering_results_all={}
-            for test_type in df['test_type'].unique():
-                print(test_type)
-                if test_type == 'force test':
-                    ydf = df[df['test_type'] == test_type]
-                    features = ['force_value']
-                elif test_type == 'angle_test':
-                    ydf=df[df['test_type'] == test_type]
-                    features = ['angle_value']
-                elif test_type == 'force and angle_test':
-                    ydf=df[df['test_type'] == test_type]
-                    features = ['force_value', 'angle_value']
-                if df.empty or len(df)<=15: 
-                    return {'Data insufficient for clustering'}
-                numerical_data=ydf[features].fillna(0)
+            for test_type, ydf in df.groupby('test_type', observed=True, sort=False):
+                logger.debug('clustering: %s', test_type)
+                features = self._CLUSTER_FEATURES.get(test_type)
+                if features is None:
+                    continue
+                # 聚类特征矩阵用列中位数填补缺测（0填充会制造假簇）
+                numerical_data=ydf[features].to_numpy(dtype=np.float64)
+                nan_mask = np.isnan(numerical_data)
+                if nan_mask.any():
+                    col_median = np.nanmedian(numerical_data, axis=0)
+                    numerical_data[nan_mask] = np.take(
+                        col_median, np.nonzero(nan_mask)[1])
+                # 单特征直接走一维精确切分，跳过KMeans+silhouette
+                if len(features) == 1:
+                    clustering_results_all[test_type] = self._cluster_1d(
+                        numerical_data[:, 0])
+                    continue
                 scaled_data = self.scaler.fit_transform(numerical_data)
                 max_clusters = min(5,len(numerical_data)-1)
                 best_k=2
                 best_score=0
+                best_kmeans=None
+                best_labels=None
 
                 for k in range(2,max_clusters+1):
                     if k<=len(numerical_data):
-                        kmeans = KMeans(n_clusters=k,random_state=42,n_init=10)
+                        kmeans = self._make_kmeans(k, len(features))
                         cluster_labels = kmeans.fit_predict(scaled_data)
                         if len(set(cluster_labels))>1:
-                            score = silhouette_score(scaled_data,cluster_labels)
+                            # silhouette是O(N²)的，抽样2000点已足够稳定选k
+                            score = silhouette_score(
+                                scaled_data, cluster_labels,
+                                sample_size=min(len(scaled_data), 2000),
+                                random_state=42)
                             if score>best_score:
                                 best_score = score
                                 best_k=k
-                kmeans= KMeans (n_clusters=best_k,random_state=42,n_init=10)
-                cluster_labels = kmeans.fit_predict(scaled_data)
+                                best_kmeans=kmeans
+                                best_labels=cluster_labels
+                # 搜索循环里已经拟合过最优k，直接复用，不再重复refit
+                if best_kmeans is None:
+                    best_kmeans = self._make_kmeans(best_k, len(features))
+                    best_labels = best_kmeans.fit_predict(scaled_data)
+                kmeans = best_kmeans
+                cluster_labels = best_labels
 
                 clustering_results = {
                     'n_clusters' : int(best_k),
@@ -239,20 +503,20 @@ class EnhancedRehabilitationAnalyzer:
             return clustering_results_all
     def generate_performance_score(self,df):
         type={}
+        # 每列只取一次numpy数组，算分交给编译好的核函数，
+        # 不再按类型分支生成中间Series
+        force_arr = df['force_value'].to_numpy(dtype=np.float64)
+        angle_arr = df['angle_value'].to_numpy(dtype=np.float64)
         for test_type in df['test_type'].unique():
             if test_type == 'angle test':
-                score = (max(df['angle_value'].max()-df['angle_value'])/90)*100
-                print(score)
+                score = _score_angle(angle_arr)
+                logger.debug('angle score: %s', score)
             elif test_type == 'force test':
-                score = (300-df['force_value'].max())/300
-                print(score)
+                score = _score_force(force_arr)
+                logger.debug('force score: %s', score)
             elif test_type == 'force and angle test':
-                ydf = df[df['force_value']>10]
-                ydf_sorted = ydf.sort_values('timestamp')
-                angle = ydf['angle_value'].iloc[0]
-                angle_score = (df['angle_value'].max()-angle)/(df['angle_value'].max()-df['angle_value'].min())*100
-                force_score = (300-df['force_value'].max())/300
-                score = (angle_score+force_score)/2 
+                # 数据加载时已按timestamp排序，核函数内顺序扫描即可
+                score = _score_force_angle(force_arr, angle_arr)
             type[test_type] = score
     
         
@@ -284,6 +548,50 @@ class EnhancedRehabilitationAnalyzer:
         :param session_id: 会话ID
         :return: 完整的分析结果
         """
+        analysis_results = self._analyze_session(session_id)
+
+        if 'error' not in analysis_results:
+            # 保存分析结果到数据库
+            self.save_analysis_results(session_id, 'comprehensive', analysis_results)
+
+        return analysis_results
+
+    def comprehensive_analysis_many(self, session_ids, n_jobs=None):
+        """
+        批量综合分析：WAL模式下读互不阻塞，线程池并行跑各会话，
+        每个工作线程用自己的analyzer（连接不跨线程共享），
+        结果最后一次批量落库
+        :param session_ids: 会话ID列表
+        :param n_jobs: 并行度，默认取CPU核数
+        :return: {session_id: 分析结果}
+        """
+        if not session_ids:
+            return {}
+        if n_jobs is None:
+            n_jobs = min(len(session_ids), os.cpu_count() or 4)
+
+        local = threading.local()
+
+        def _analyze(session_id):
+            worker = getattr(local, 'analyzer', None)
+            if worker is None:
+                worker = EnhancedRehabilitationAnalyzer(self.db_path)
+                local.analyzer = worker
+            return session_id, worker._analyze_session(session_id)
+
+        results = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=n_jobs) as pool:
+            for session_id, analysis in pool.map(_analyze, session_ids):
+                results[session_id] = analysis
+
+        self.save_analysis_results_bulk(
+            [(session_id, 'comprehensive', analysis)
+             for session_id, analysis in results.items()
+             if 'error' not in analysis])
+        return results
+
+    def _analyze_session(self, session_id):
+        """跑完整分析流水线但不落库（批量路径统一批量保存）"""
         # 加载数据
         df = self.load_session_data(session_id)
         
@@ -308,10 +616,7 @@ class EnhancedRehabilitationAnalyzer:
             'performance_score': self.generate_performance_score(df),
             'analysis_timestamp': datetime.now().isoformat()
         }
-        
-        # 保存分析结果到数据库
-        self.save_analysis_results(session_id, 'comprehensive', analysis_results)
-        
+
         return analysis_results
     
     def save_analysis_results(self, session_id, analysis_type, results):
@@ -321,22 +626,54 @@ class EnhancedRehabilitationAnalyzer:
         :param analysis_type: 分析类型
         :param results: 分析结果
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
         try:
-            cursor.execute('''
+            # isolation_level=None是自动提交模式，这里显式开事务一次fsync
+            self._conn.execute('BEGIN IMMEDIATE')
+            self._conn.execute('''
                 INSERT INTO final_data (session_id, analysis_type, results)
                 VALUES (?, ?, ?)
-            ''', (session_id, analysis_type, json.dumps(results, ensure_ascii=False)))
-            
-            conn.commit()
+            ''', (session_id, analysis_type, _dump_results(results)))
+            self._conn.execute('COMMIT')
+            # 保存意味着该会话刚被分析过，若期间有新采样，下次重新加载
+            # （历史缓存不受影响：final_data写入不改动sensor_data）
+            self._df_cache.pop(('session', session_id), None)
             print(f"分析结果已保存: {session_id} - {analysis_type}")
         except Exception as e:
+            self._conn.execute('ROLLBACK')
             print(f"保存分析结果失败: {e}")
-        finally:
-            conn.close()
+
+    def save_analysis_results_bulk(self, rows):
+        """
+        批量保存分析结果：整批一个事务 + executemany，只fsync一次
+        :param rows: [(session_id, analysis_type, results_dict), ...]
+        """
+        if not rows:
+            return
+        try:
+            self._conn.execute('BEGIN IMMEDIATE')
+            self._conn.executemany('''
+                INSERT INTO final_data (session_id, analysis_type, results)
+                VALUES (?, ?, ?)
+            ''', [(session_id, analysis_type, _dump_results(results))
+                  for session_id, analysis_type, results in rows])
+            self._conn.execute('COMMIT')
+            print(f"分析结果已批量保存: {len(rows)} 条")
+        except Exception as e:
+            self._conn.execute('ROLLBACK')
+            print(f"批量保存分析结果失败: {e}")
     
+    # plotly渲染成本和HTML体积都随点数线性增长，超过这个数就等距抽样
+    _MAX_PLOT_POINTS = 50000
+
+    @classmethod
+    def _plot_indices(cls, mask):
+        """掩码转下标，点太多时按np.linspace等距抽样"""
+        idx = np.flatnonzero(mask)
+        if idx.size > cls._MAX_PLOT_POINTS:
+            idx = idx[np.linspace(0, idx.size - 1,
+                                  cls._MAX_PLOT_POINTS).astype(np.intp)]
+        return idx
+
     def create_visualization(self, df, save_path=None):
         """
         创建数据可视化图表
@@ -346,7 +683,24 @@ class EnhancedRehabilitationAnalyzer:
         """
         if df.empty:
             return None
-        
+
+        # 同样的列反复notna()/dropna()要扫五遍，这里一次取numpy数组、
+        # 一次算好掩码，四个trace共用；传numpy数组还能跳过plotly的pandas路径
+        force_arr = df['force_value'].to_numpy(dtype=np.float64, na_value=np.nan)
+        angle_arr = df['angle_value'].to_numpy(dtype=np.float64, na_value=np.nan)
+        ts_arr = df['timestamp'].to_numpy()
+        # 加载时扫好的列有效性：全空列不用再建掩码
+        has_force = df.attrs.get('has_force', True)
+        has_angle = df.attrs.get('has_angle', True)
+        empty_idx = np.empty(0, dtype=np.intp)
+        force_mask = ~np.isnan(force_arr) if has_force else None
+        angle_mask = ~np.isnan(angle_arr) if has_angle else None
+
+        force_idx = self._plot_indices(force_mask) if has_force else empty_idx
+        angle_idx = self._plot_indices(angle_mask) if has_angle else empty_idx
+        both_idx = (self._plot_indices(force_mask & angle_mask)
+                    if has_force and has_angle else empty_idx)
+
         # 创建子图
         fig = make_subplots(
             rows=2, cols=2,
@@ -357,38 +711,34 @@ class EnhancedRehabilitationAnalyzer:
         )
         
         # 时间序列图 - 拉力
-        if df['force_value'].notna().any():
-            force_data = df[df['force_value'].notna()]
+        if force_idx.size:
             fig.add_trace(
-                go.Scatter(x=force_data['timestamp'], y=force_data['force_value'],
+                go.Scatter(x=ts_arr[force_idx], y=force_arr[force_idx],
                           mode='lines+markers', name='Force (N)', line=dict(color='blue')),
                 row=1, col=1
             )
-        
+
         # 时间序列图 - 角度
-        if df['angle_value'].notna().any():
-            angle_data = df[df['angle_value'].notna()]
+        if angle_idx.size:
             fig.add_trace(
-                go.Scatter(x=angle_data['timestamp'], y=angle_data['angle_value'],
+                go.Scatter(x=ts_arr[angle_idx], y=angle_arr[angle_idx],
                           mode='lines+markers', name='Angle (°)', line=dict(color='red')),
                 row=1, col=2
             )
-        
+
         # 散点图 - 拉力vs角度
-        if df['force_value'].notna().any() and df['angle_value'].notna().any():
-            combined_data = df.dropna(subset=['force_value', 'angle_value'])
-            if not combined_data.empty:
-                fig.add_trace(
-                    go.Scatter(x=combined_data['force_value'], y=combined_data['angle_value'],
-                              mode='markers', name='Force - Angle Relationship', 
-                              marker=dict(color='green', size=8)),
-                    row=2, col=1
-                )
-        
+        if both_idx.size:
+            fig.add_trace(
+                go.Scatter(x=force_arr[both_idx], y=angle_arr[both_idx],
+                          mode='markers', name='Force - Angle Relationship',
+                          marker=dict(color='green', size=8)),
+                row=2, col=1
+            )
+
         # 直方图 - 数据分布
-        if df['force_value'].notna().any():
+        if force_idx.size:
             fig.add_trace(
-                go.Histogram(x=df['force_value'].dropna(), name='Force distribution', 
+                go.Histogram(x=force_arr[force_idx], name='Force distribution',
                            marker=dict(color='lightblue'), opacity=0.7),
                 row=2, col=2
             )
@@ -421,46 +771,42 @@ class EnhancedRehabilitationAnalyzer:
         :param days: 对比天数
         :return: 对比分析结果
         """
-        df = self.load_user_historical_data(user_id, days)
-        
-        if df.empty:
+        # 聚合在SQL侧完成，这里只处理O(会话×类型)行
+        agg = self.load_user_session_aggregates(user_id, days)
+
+        if agg.empty:
             return {"error": "没有足够的历史数据"}
-        
-        # 按会话分组进行对比分析
-        session_comparison = {}
-        sessions = df['session_id'].unique()
-        
+
+        sessions = agg['session_id'].unique()
+
         if len(sessions) < 2:
             return {"error": "需要至少2个训练会话进行对比"}
-        
+
         session_stats = []
-        for session_id in sessions:
-            session_data = df[df['session_id'] == session_id]
-            
+        for session_id, session_agg in agg.groupby('session_id', sort=False):
             stats = {
                 'session_id': session_id,
-                'date': session_data['timestamp'].min().date().isoformat(),
-                'duration': (session_data['timestamp'].max() - 
-                           session_data['timestamp'].min()).total_seconds() / 60
+                'date': session_agg['t_min'].min().date().isoformat(),
+                'duration': (session_agg['t_max'].max() -
+                           session_agg['t_min'].min()).total_seconds() / 60
             }
             type = {}
-            for test_type in session_data['test_type'].unique():
+            for row in session_agg.itertuples(index=False):
                 values={}
-                print(test_type)
-                ydf = session_data[session_data['test_type'] == test_type]
-                if test_type == 'angle test':
-                    values['angle_value'] = ydf['angle_value'].min()
-                elif test_type == 'force test':
-                    values['force_value'] = ydf['force_value'].max()        
-                elif test_type == 'force angle test':
-                    ydf = df[df['force_value']>0]
-                    ydf_sorted = ydf.sort_values('timestamp')
-                    values['angle_value'] = float(ydf_sorted['angle_value'].iloc[0])
-                    values['force_value'] = ydf_sorted['force_value'].max()
-                type[test_type]=values
+                logger.debug('comparison: %s', row.test_type)
+                if row.test_type == 'angle test':
+                    values['angle_value'] = row.min_angle
+                elif row.test_type == 'force test':
+                    values['force_value'] = row.max_force
+                elif row.test_type == 'force angle test':
+                    values['angle_value'] = float(row.first_angle)
+                    values['force_value'] = row.max_force
+                type[row.test_type]=values
                 stats['values'] =type
             session_stats.append(stats)
-        session_stats.sort(key=lambda x: x['date'])
+        # 聚合SQL按t_min升序返回，groupby(sort=False)保留首次出现顺序，
+        # 所以session_stats天然按日期有序，无需再排
+
         # 计算改进趋势
         improvements = {}
         improvement = {}
@@ -1,53 +1,62 @@
+import asyncio
+import hashlib
+import logging
 import os
-from openai import OpenAI
+import httpx
+import openai
+from collections import OrderedDict, defaultdict
+from openai import OpenAI, AsyncOpenAI
 import json
 from datetime import datetime
 from typing import Dict,List,Any
+import random
 import sqlite3
+import threading
+import time
+import orjson
 import pandas as pd
-class EnhancedGPTRehabilitationAdvisor:
 
-    
-    def __init__(self, api_key = 'sk-cb387c428d9343328cea734e6ae0f9f5',db_path="rehabilitation_data.db",model="deepseek-chat"):
-        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
-        self.db_path = db_path
-        self.model = model
-        self.client=None
+logger = logging.getLogger(__name__)
 
-        self.client = OpenAI(api_key=self.api_key,base_url=f"https://api.deepseek.com")
+# 提示词里的JSON区块用orjson序列化：嵌套dict比stdlib快3-10倍，
+# OPT_SERIALIZE_NUMPY兼容分析结果里的numpy标量
+_PROMPT_JSON_OPTS = (orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+                     | orjson.OPT_SERIALIZE_NUMPY)
 
-    def create_analysis_prompt(self,analysis_data:Dict, user_profile:Dict=None):
-        ''' Create a prompt that can be used to generate an analysis
-            "param analysis data: 分析数据
-            param user profile: 用户信息'''
 
-        prompt = f"""
-    ##patient message
-    {f"Age: {user_profile.get('age', 'unknown')}" if user_profile else ""}
-    {f"Gender: {user_profile.get('gender', 'unknown')}" if user_profile else ""}
-    {f"Height: {user_profile.get('height', 'Unknown')}" if user_profile else ""}
-    {f"Weight: {user_profile.get('weight', 'Unknown')}" if user_profile else ""}
-    {f"Rehabilitation Stage: {user_profile.get('rehabilitation_stage', 'Unknown')}" if user_profile else ""}
-    {f"Main Problems: {user_profile.get('main_issues', 'Unknown')}" if user_profile else ""}
+def _dump_json(obj):
+    return orjson.dumps(obj, option=_PROMPT_JSON_OPTS).decode()
 
-    ###Base analyze information
-    - Training Duration: {analysis_data.get('data_summary', {}).get('time_range', {}).get('duration_minutes', 0):.1f} minutes
-    - Data Record: {analysis_data.get('data_summary', {}).get('total_records', 0)} 条
-    - Test Type {', '.join(analysis_data.get('data_summary', {}).get('test_types', []))}
 
-    ### Performance Score
-    - General Performance: {analysis_data.get('performance_score', {}).get('overall_score', 0):.1f}/100
-    - Grade: {analysis_data.get('performance_score', {}).get('grade', 'N/A')}
-        
-    ### Statistical Analysis
-    {json.dumps(analysis_data.get('statistical_analysis', {}), ensure_ascii=False, indent=2)}
+# (api_key, base_url) -> 客户端：进程内所有advisor实例共用一个HTTPX
+# 连接池，按请求新建advisor时不再重付TLS握手和fd开销
+_client_cache = {}
+_aclient_cache = {}
 
-    ### Trend Analysis
-    {json.dumps(analysis_data.get('trend_analysis', {}), ensure_ascii=False, indent=2)}
 
-    ### Cluster Analysis
-    {json.dumps(analysis_data.get('clustering_analysis', {}), ensure_ascii=False, indent=2)}
+def _shared_client(api_key, base_url):
+    key = (api_key, base_url)
+    client = _client_cache.get(key)
+    if client is None:
+        client = _client_cache[key] = OpenAI(
+            api_key=api_key, base_url=base_url,
+            http_client=httpx.Client(limits=httpx.Limits(
+                max_connections=64, max_keepalive_connections=32)))
+    return client
+
 
+def _shared_aclient(api_key, base_url):
+    key = (api_key, base_url)
+    client = _aclient_cache.get(key)
+    if client is None:
+        client = _aclient_cache[key] = AsyncOpenAI(
+            api_key=api_key, base_url=base_url,
+            http_client=httpx.AsyncClient(limits=httpx.Limits(
+                max_connections=64, max_keepalive_connections=32)))
+    return client
+
+# 提示词里的静态任务清单：和动态数据分开，避免每次调用都重建这一大段
+_ANALYSIS_TASKS = """
     ## Please provide the following suggestions:
 
     1. Training performance evaluation
@@ -69,37 +78,8 @@ class EnhancedGPTRehabilitationAdvisor:
         -Estimated time to achieve rehabilitation goals
         Please reply in professional and in english but understandable language to ensure that the suggestions are actionable.
     """
-        return prompt
-    
-    def create_comparison_prompt(self, comparison_data:dict, user_profile=None) -> str:
-        """
-        创建对比分析提示词
-        :param comparison_data: 对比数据
-        :param user_profile: 用户档案
-        :return: 格式化的提示词
-        """
-        prompt = f"""
-        You are a professional physiotherapist and doctor, please provide a rehabilitation progress assessment and follow-up recommendations based on a comparative analysis of the patient's historical training data.
-
-        ## Patient Information
-        {f"Age: {user_profile.get('age', 'unknown')}" if user_profile else ""}
-        {f"Rehabilitation Stage: {user_profile.get('rehabilitation_stage', 'unknown')}" if user_profile else ""}
-
-        ##Historical Training Data Comparison and Analysis
-
-        ### Overal Situation
-        - Analysis Timeframe: {comparison_data.get('analysis_period_days', 0)} days
-        - Total Training Sessions: {comparison_data.get('total_sessions', 0)} times
-
-        ### Data Improvements
-        {json.dumps(comparison_data.get('improvements', {}), ensure_ascii=False, indent=2)}
-
-        ### Overall Trend
-        {json.dumps(comparison_data.get('overall_trend', {}), ensure_ascii=False, indent=2)}
-
-        ### Session Data details
-        {json.dumps(comparison_data.get('session_statistics', [])[:5], ensure_ascii=False, indent=2)}
 
+_COMPARISON_TASKS = """
         ## Please provide the following analysis and suggestions:
 
         1. Rehabilitation progress assessment
@@ -124,7 +104,195 @@ class EnhancedGPTRehabilitationAdvisor:
 
         Please provide professional, warm, and motivating advice in english.
         """
-        return prompt
+
+# 预编译的{}-占位符模板：构建提示词退化成一次dict填充+format_map，
+# 批量夜间报告时不再为每个用户重走f-string求值
+_PROFILE_TMPL = """    Age: {age}
+    Gender: {gender}
+    Height: {height}
+    Weight: {weight}
+    Rehabilitation Stage: {rehabilitation_stage}
+    Main Problems: {main_issues}
+"""
+
+_ANALYSIS_TMPL = """
+    ##patient message
+{profile_block}
+    ###Base analyze information
+    - Training Duration: {duration_minutes} minutes
+    - Data Record: {total_records} 条
+    - Test Type {test_types}
+
+    ### Performance Score
+    - General Performance: {overall_score}/100
+    - Grade: {grade}
+
+    ### Statistical Analysis
+{stats_json}
+
+    ### Trend Analysis
+{trend_json}
+
+    ### Cluster Analysis
+{cluster_json}""" + _ANALYSIS_TASKS
+
+_COMPARISON_PROFILE_TMPL = """        Age: {age}
+        Rehabilitation Stage: {rehabilitation_stage}
+"""
+
+_COMPARISON_TMPL = """
+        You are a professional physiotherapist and doctor, please provide a rehabilitation progress assessment and follow-up recommendations based on a comparative analysis of the patient's historical training data.
+
+        ## Patient Information
+{profile_block}
+        ##Historical Training Data Comparison and Analysis
+
+        ### Overal Situation
+        - Analysis Timeframe: {period_days} days
+        - Total Training Sessions: {total_sessions} times
+
+        ### Data Improvements
+{improvements_json}
+
+        ### Overall Trend
+{trend_json}
+
+        ### Session Data details
+{sessions_json}""" + _COMPARISON_TASKS
+
+_DAILY_TMPL = """
+As a rehabilitation training expert, please provide a brief daily report and recommendations in english based on the patient's training situation today.
+
+Todays training report：
+- Training count：{session_count} Times
+- Total training duration：{total_minutes} Minutes
+
+Please provide：
+1. Brief analysis and evaluation of todays training（Under 50 words）
+2. Training suggestions for tomorrow（Under 50 words）
+3. Words of motivation（Under 30 words）
+
+Please keep tone concise, professional, and warm.
+"""
+
+_WEEKLY_TMPL = """
+
+As a rehabilitation training expert, please provide a weekly summary and next week's recommendations in english based on the patient's training situation this week.
+
+This weeks training situation:：
+- Training sessions：{total_sessions} times
+- Total duration：{total_hours} Hours
+- Average session duration：{avg_minutes} Minutes
+- Training frequency：{frequency} Times/days
+
+
+Please provide:
+1. Summary of this week's training performance (within 100 words)
+2. Suggestions for next week's training plan (within 100 words)
+3. Long term rehabilitation recommendations (within 80 words)
+Maintain a professional and encouraging tone.
+"""
+
+
+class EnhancedGPTRehabilitationAdvisor:
+
+
+    def __init__(self, api_key = 'sk-cb387c428d9343328cea734e6ae0f9f5',db_path="rehabilitation_data.db",model="deepseek-chat",max_concurrency=8):
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        self.db_path = db_path
+        self.model = model
+        self.client=None
+
+        self.client = _shared_client(self.api_key, "https://api.deepseek.com")
+        # 异步客户端：多份报告用gather并发跑，墙钟时间≈单次调用延迟
+        self.aclient = _shared_aclient(self.api_key, "https://api.deepseek.com")
+        # 并发上限：gather扇出时不顶穿账号的RPM限制
+        self._sem = asyncio.Semaphore(max_concurrency)
+
+        # 报告路径每次都重新connect会反复付文件打开+页缓存预热的成本，
+        # 这里保持一个WAL长连接，用锁串行化访问
+        self._conn = sqlite3.connect(db_path, check_same_thread=False,
+                                     isolation_level=None)
+        self._conn.executescript('''
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            PRAGMA temp_store=MEMORY;
+            PRAGMA mmap_size=268435456;
+            PRAGMA cache_size=-65536;
+            PRAGMA busy_timeout=5000;
+        ''')
+        # 日报/周报都按 (user_id, 时间段) 查询，这个复合索引把全表扫描
+        # 变成几行的索引范围扫描
+        try:
+            self._conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_sessions_user_time
+                ON training_sessions(user_id, start_time)
+            ''')
+        except sqlite3.OperationalError:
+            pass  # 表还没建好时跳过，不影响后续查询
+        self._lock = threading.Lock()
+
+        # 提示词哈希→回复的精确匹配缓存：同一会话重复打开报告时
+        # 既省全程延迟又省token
+        self._response_cache = OrderedDict()
+
+        # user_id -> (profile, 过期时刻)
+        self._profile_cache = {}
+
+        # 按任务分档：日报/周报的提示词本身就把输出限制在百字级，
+        # 没必要按2000 token的预算生成；模型档位留作配置点，
+        # 接入有小模型的服务商时改这里即可
+        self.models = {
+            "analysis": self.model,
+            "daily": self.model,
+            "weekly": self.model,
+        }
+        self.max_tokens = {"analysis": 2000, "daily": 250, "weekly": 450}
+
+    def create_analysis_prompt(self,analysis_data:Dict, user_profile:Dict=None):
+        ''' Create a prompt that can be used to generate an analysis
+            "param analysis data: 分析数据
+            param user profile: 用户信息'''
+
+        # 嵌套dict只解包一次；填充预编译模板而不是每次求值巨型f-string。
+        # defaultdict兜底缺失字段，省掉逐字段的.get(..., 'Unknown')
+        ds = analysis_data.get('data_summary') or {}
+        tr = ds.get('time_range') or {}
+        ps = analysis_data.get('performance_score') or {}
+
+        profile_block = (_PROFILE_TMPL.format_map(
+            defaultdict(lambda: 'Unknown', user_profile))
+            if user_profile else "")
+        return _ANALYSIS_TMPL.format_map({
+            'profile_block': profile_block,
+            'duration_minutes': f"{tr.get('duration_minutes', 0):.1f}",
+            'total_records': ds.get('total_records', 0),
+            'test_types': ', '.join(ds.get('test_types', [])),
+            'overall_score': f"{ps.get('overall_score', 0):.1f}",
+            'grade': ps.get('grade', 'N/A'),
+            'stats_json': _dump_json(analysis_data.get('statistical_analysis', {})),
+            'trend_json': _dump_json(analysis_data.get('trend_analysis', {})),
+            'cluster_json': _dump_json(analysis_data.get('clustering_analysis', {})),
+        })
+
+    def create_comparison_prompt(self, comparison_data:dict, user_profile=None) -> str:
+        """
+        创建对比分析提示词
+        :param comparison_data: 对比数据
+        :param user_profile: 用户档案
+        :return: 格式化的提示词
+        """
+        profile_block = (_COMPARISON_PROFILE_TMPL.format_map(
+            defaultdict(lambda: 'Unknown', user_profile))
+            if user_profile else "")
+        return _COMPARISON_TMPL.format_map({
+            'profile_block': profile_block,
+            'period_days': comparison_data.get('analysis_period_days', 0),
+            'total_sessions': comparison_data.get('total_sessions', 0),
+            'improvements_json': _dump_json(comparison_data.get('improvements', {})),
+            'trend_json': _dump_json(comparison_data.get('overall_trend', {})),
+            'sessions_json': _dump_json(comparison_data.get('session_statistics', [])[:5]),
+        })
 
 
     def generate_recommendations(self, analysis_data, user_profile=None):
@@ -134,37 +302,26 @@ class EnhancedGPTRehabilitationAdvisor:
         :param user_profile: 用户档案
         :return: 生成的建议
         """
-        #try:
-            # 创建提示词
+        # 创建提示词
         prompt = self.create_analysis_prompt(analysis_data, user_profile)
-        print(prompt)
-            
-            # 调用GPT API，如果失败则使用模拟响应
-        try:
-            if self.client:
-                response = self.call_openai_api(prompt)
-                print(response)
-            '''else:
-                response = self.generate_mock_recommendations(analysis_data)'''
-        except (ConnectionError, Exception):
-                # 网络错误或其他API错误时使用模拟响应
-            print("API调用失败，使用模拟建议生成器")
-            #response = self.generate_mock_recommendations(analysis_data)
-            
+        logger.debug("analysis prompt: %s", prompt)
+
+        # 瞬时错误由call_openai_api内部退避重试；其余异常直接抛给调用方，
+        # 不再静默吞掉后用未定义的response继续跑
+        response = self.call_openai_api(prompt)
+        logger.debug("analysis response: %s", response)
+
         session_id = analysis_data.get('session_id')
         if session_id:
             self.save_recommendations(session_id, 'analysis_based', response)
-            
+
         return {
                 'type': 'analysis_based_recommendations',
                 'session_id': session_id,
                 'recommendations': response,
                 'generated_at': datetime.now().isoformat()
             }
-            
-        '''except Exception as e:
-            print(f"生成建议时发生错误: {e}")'''
-    
+
 
     def generate_comparison_recommendations(self, comparison_data: Dict, user_profile: Dict = None) -> Dict:
         """
@@ -173,127 +330,367 @@ class EnhancedGPTRehabilitationAdvisor:
         :param user_profile: 用户档案
         :return: 生成的建议
         """
-        try:
-            # 创建提示词
-            prompt = self.create_comparison_prompt(comparison_data, user_profile)
-            
-            # 调用GPT API，如果失败则使用模拟响应
+        # 创建提示词
+        prompt = self.create_comparison_prompt(comparison_data, user_profile)
+
+        response = self.call_openai_api(prompt)
+
+        return {
+            'type': 'comparison_based_recommendations',
+            'user_id': comparison_data.get('user_id'),
+            'recommendations': response,
+            'generated_at': datetime.now().isoformat()
+        }
+
+    _RESPONSE_CACHE_SIZE = 1024
+
+    def _cached_response(self, prompt):
+        key = hashlib.blake2b(prompt.encode(), digest_size=16).hexdigest()
+        cached = self._response_cache.get(key)
+        if cached is not None:
+            self._response_cache.move_to_end(key)
+        return key, cached
+
+    def _store_response(self, key, response):
+        self._response_cache[key] = response
+        if len(self._response_cache) > self._RESPONSE_CACHE_SIZE:
+            self._response_cache.popitem(last=False)
+
+    def call_openai_api(self,prompt,task="analysis",retries=5):
+        key, cached = self._cached_response(prompt)
+        if cached is not None:
+            return cached
+        # 429/连接/超时这类瞬时错误带抖动地指数退避重试，
+        # 其余错误直接抛出——和acall_openai_api同一套策略
+        delay = 0.5
+        for attempt in range(retries):
             try:
-                if self.client:
-                    response = self.call_openai_api(prompt)
-                else:
-                    response = self.generate_mock_comparison_recommendations(comparison_data)
-            except (ConnectionError, Exception):
-                # 网络错误或其他API错误时使用模拟响应
-                print("API调用失败，使用模拟建议生成器")
-                response = self.generate_mock_comparison_recommendations(comparison_data)
-            
-            return {
-                'type': 'comparison_based_recommendations',
-                'user_id': comparison_data.get('user_id'),
+                response = self.client.chat.completions.create(
+                            model=self.models[task],
+                            messages=[
+                                {
+                                    "role": "system",
+                                    "content": "你是一位专业的康复训练专家，擅长分析康复数据并提供专业建议。"
+                                },
+                                {
+                                    "role": "user",
+                                    "content": prompt
+                                }
+                            ],
+                            max_tokens=self.max_tokens[task],
+                            temperature=0.7
+                        )
+                break
+            except (openai.RateLimitError, openai.APIConnectionError,
+                    openai.APITimeoutError):
+                if attempt == retries - 1:
+                    raise
+                time.sleep(delay * (0.5 + random.random()))
+                delay = min(delay * 2, 8.0)
+        content = response.choices[0].message.content.strip()
+        self._store_response(key, content)
+        return content
+
+    async def acall_openai_api(self,prompt,task="analysis",retries=5):
+        key, cached = self._cached_response(prompt)
+        if cached is not None:
+            return cached
+        # 信号量封顶并发，瞬时429/超时指数退避重试；其他错误直接抛出
+        async with self._sem:
+            delay = 0.5
+            for attempt in range(retries):
+                try:
+                    response = await self.aclient.chat.completions.create(
+                                model=self.models[task],
+                                messages=[
+                                    {
+                                        "role": "system",
+                                        "content": "你是一位专业的康复训练专家，擅长分析康复数据并提供专业建议。"
+                                    },
+                                    {
+                                        "role": "user",
+                                        "content": prompt
+                                    }
+                                ],
+                                max_tokens=self.max_tokens[task],
+                                temperature=0.7
+                            )
+                    content = response.choices[0].message.content.strip()
+                    self._store_response(key, content)
+                    return content
+                except (openai.RateLimitError, openai.APIConnectionError,
+                        openai.APITimeoutError):
+                    if attempt == retries - 1:
+                        raise
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, 8.0)
+
+    async def acall_openai_api_stream(self, prompt, task="analysis"):
+        """
+        流式调用：逐块yield增量文本，首字延迟从整段生成时间降到约1个RTT。
+        完整内容照常写入缓存，供后续落库/复用。
+        """
+        key, cached = self._cached_response(prompt)
+        if cached is not None:
+            yield cached
+            return
+        async with self._sem:
+            stream = await self.aclient.chat.completions.create(
+                        model=self.models[task],
+                        messages=[
+                            {
+                                "role": "system",
+                                "content": "你是一位专业的康复训练专家，擅长分析康复数据并提供专业建议。"
+                            },
+                            {
+                                "role": "user",
+                                "content": prompt
+                            }
+                        ],
+                        max_tokens=self.max_tokens[task],
+                        temperature=0.7,
+                        stream=True
+                    )
+            parts = []
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        self._store_response(key, "".join(parts).strip())
+
+    async def agenerate_recommendations_stream(self, analysis_data, user_profile=None):
+        """
+        边生成边下发的建议流（供WebSocket/SSE消费）；
+        流结束后把累积的完整文本落库，持久化与生成重叠
+        """
+        prompt = self.create_analysis_prompt(analysis_data, user_profile)
+        parts = []
+        async for delta in self.acall_openai_api_stream(prompt):
+            parts.append(delta)
+            yield delta
+
+        session_id = analysis_data.get('session_id')
+        if session_id:
+            await asyncio.to_thread(
+                self.save_recommendations,
+                session_id, 'analysis_based', "".join(parts).strip())
+
+    async def agenerate_recommendations(self, analysis_data, user_profile=None):
+        """generate_recommendations的异步版本，供gather并发使用"""
+        prompt = self.create_analysis_prompt(analysis_data, user_profile)
+        response = await self.acall_openai_api(prompt)
+
+        session_id = analysis_data.get('session_id')
+        if session_id:
+            self.save_recommendations(session_id, 'analysis_based', response)
+
+        return {
+                'type': 'analysis_based_recommendations',
+                'session_id': session_id,
                 'recommendations': response,
                 'generated_at': datetime.now().isoformat()
             }
-            
-        except Exception as e:
-            print(f"生成对比建议时发生错误: {e}")
-
-    def call_openai_api(self,prompt):
-        response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
+
+    def submit_batch_reports(self, user_ids):
+        """
+        夜间批量日报走Batch API：非实时任务换约一半的token成本，
+        吞吐不再受交互式RPM限制
+        :param user_ids: 用户ID列表
+        :return: batch id；没有可生成日报的用户时返回None
+        """
+        lines = []
+        for user_id in user_ids:
+            prompt, _ = self._prepare_daily_report(
+                user_id, self._fetch_today_sessions(user_id))
+            if prompt is None:
+                continue
+            lines.append(json.dumps({
+                "custom_id": str(user_id),
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": self.models["daily"],
+                    "messages": [
                         {
                             "role": "system",
                             "content": "你是一位专业的康复训练专家，擅长分析康复数据并提供专业建议。"
                         },
-                        {
-                            "role": "user",
-                            "content": prompt
-                        }
+                        {"role": "user", "content": prompt}
                     ],
-                    max_tokens=2000,
-                    temperature=0.7
-                )
-        return response.choices[0].message.content.strip()
-    
+                    "max_tokens": self.max_tokens["daily"],
+                    "temperature": 0.7
+                }
+            }, ensure_ascii=False))
+
+        if not lines:
+            return None
+
+        batch_file = self.client.files.create(
+            file=("daily_reports.jsonl", ("\n".join(lines) + "\n").encode("utf-8")),
+            purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h")
+        return batch.id
+
+    def collect_batch_reports(self, batch_id):
+        """
+        取回批量日报结果
+        :return: 完成时{user_id: 建议文本}；还在跑返回None
+        """
+        batch = self.client.batches.retrieve(batch_id)
+        if batch.status != 'completed':
+            return None
+
+        results = {}
+        content = self.client.files.content(batch.output_file_id).text
+        for line in content.splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            choices = (item.get('response', {}).get('body', {})
+                       .get('choices') or [])
+            if choices:
+                results[item['custom_id']] = choices[0]['message']['content'].strip()
+        return results
+
     def save_recommendations(self,session_id,recommendations_type,content):
 
-        conn=sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-                UPDATE analysis_results 
+        with self._lock:
+            self._conn.execute('''
+                UPDATE analysis_results
                 SET recommendations = ?
                 WHERE session_id = ? AND analysis_type = ?
             ''', (content, session_id,recommendations_type))
-        conn.close()
 
-    def get_user_profile(self,user_id):
+    def save_recommendations_bulk(self, items):
+        """
+        批量写入建议：一个事务一次executemany，整批只提交一次
+        :param items: [(session_id, recommendations_type, content), ...]
+        """
+        if not items:
+            return
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._conn.executemany('''
+                    UPDATE analysis_results
+                    SET recommendations = ?
+                    WHERE session_id = ? AND analysis_type = ?
+                ''', [(content, session_id, recommendations_type)
+                      for session_id, recommendations_type, content in items])
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    # 用户档案很少变动，按TTL缓存；批量任务先用get_user_profiles_bulk
+    # 一次查询预热，避免每个用户一趟DB
+    _PROFILE_TTL = 3600.0
+    _PROFILE_COLS = 'age, sex, weight, rehabilitation_stage, main_problems'
+    _SEX = {1: '男', 2: '女'}
+
+    # users表不存在（独立用默认db_path时）或查不到用户时的兜底档案，
+    # 保持查询失败前的默认返回值
+    _DEFAULT_PROFILE = {
+        'age': 35,
+        'gender': '男',
+        'rehabilitation_stage': '中期康复',
+        'main_issues': '膝关节功能恢复',
+        'training_experience': '3个月'
+    }
+
+    @classmethod
+    def _profile_from_row(cls, row):
         return {
-            'age': 35,
-            'gender': '男',
-            'rehabilitation_stage': '中期康复',
-            'main_issues': '膝关节功能恢复',
-            'training_experience': '3个月'
+            'age': row[0],
+            'gender': cls._SEX.get(row[1], 'unknown'),
+            'weight': row[2],
+            'rehabilitation_stage': row[3],
+            'main_issues': row[4],
         }
 
-    def generate_daily_report(self,user_id):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # 获取今日训练数据
-        cursor.execute('''
-            SELECT s.session_id, s.start_time, s.end_time, s.duration
-            FROM training_sessions s
-            WHERE s.user_id = ? 
-            AND date(s.start_time) = date('now')
-            ORDER BY s.start_time DESC
-        ''', (user_id,))
-
-        today_sessions = cursor.fetchall()
-        conn.close()
-
-        if not today_sessions:
-            return {
+    def get_user_profile(self,user_id):
+        cached = self._profile_cache.get(user_id)
+        if cached is not None and cached[1] > time.monotonic():
+            return cached[0]
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    f'SELECT {self._PROFILE_COLS} FROM users WHERE id = ?',
+                    (user_id,)).fetchone()
+        except sqlite3.OperationalError:
+            row = None  # 表还没建好（独立使用时）——退回兜底档案
+        profile = self._profile_from_row(row) if row else dict(self._DEFAULT_PROFILE)
+        self._profile_cache[user_id] = (profile, time.monotonic() + self._PROFILE_TTL)
+        return profile
+
+    def get_user_profiles_bulk(self, user_ids):
+        """一条IN查询取回一批档案并填充缓存，返回 {user_id: profile}"""
+        user_ids = list(user_ids)
+        if not user_ids:
+            return {}
+        placeholders = ','.join('?' * len(user_ids))
+        try:
+            with self._lock:
+                rows = self._conn.execute(
+                    f'SELECT id, {self._PROFILE_COLS} FROM users '
+                    f'WHERE id IN ({placeholders})', user_ids).fetchall()
+        except sqlite3.OperationalError:
+            rows = []  # 表还没建好——逐个get_user_profile会给兜底档案
+        expires = time.monotonic() + self._PROFILE_TTL
+        profiles = {}
+        for row in rows:
+            profile = self._profile_from_row(row[1:])
+            profiles[row[0]] = profile
+            self._profile_cache[row[0]] = (profile, expires)
+        return profiles
+
+    def _fetch_today_sessions(self,user_id):
+        # 获取今日训练数据（直接读成DataFrame，后面的统计走向量化路径）
+        with self._lock:
+            return pd.read_sql_query('''
+                SELECT s.session_id, s.start_time, s.end_time, s.duration
+                FROM training_sessions s
+                WHERE s.user_id = ?
+                AND s.start_time >= datetime('now', 'start of day')
+                AND s.start_time < datetime('now', 'start of day', '+1 day')
+                ORDER BY s.start_time DESC
+            ''', self._conn, params=(user_id,))
+
+    def _prepare_daily_report(self,user_id,today_sessions):
+        """构建日报数据和提示词；今日无数据时返回(None, 兜底回复)"""
+        if today_sessions.empty:
+            return None, {
                 'message': '今日暂无训练数据',
                 'recommendation': '建议进行适量的康复训练以保持训练连续性。'
             }
-        
-        # 构建每日报告数据
-        total_duration = sum([session[3] or 0 for session in today_sessions])
+
+        # 构建每日报告数据：列级向量化求和/换算，不逐行走Python对象
+        duration = today_sessions['duration'].fillna(0)
+        total_duration = float(duration.sum())
         session_count = len(today_sessions)
-        
+
         report_data = {
             'date': datetime.now().date().isoformat(),
             'session_count': session_count,
             'total_duration_minutes': total_duration / 60 if total_duration else 0,
-            'sessions': [
-                {
-                    'session_id': session[0],
-                    'start_time': session[1],
-                    'end_time': session[2],
-                    'duration_minutes': (session[3] / 60) if session[3] else 0
-                }
-                for session in today_sessions
-            ]
+            'sessions': today_sessions.assign(duration_minutes=duration / 60)
+                                      .drop(columns='duration')
+                                      .to_dict(orient='records')
         }
         
         # 生成每日建议
-        prompt = f"""
-As a rehabilitation training expert, please provide a brief daily report and recommendations in english based on the patient's training situation today.
-
-Todays training report：
-- Training count：{session_count} Times
-- Total training duration：{report_data['total_duration_minutes']:.1f} Minutes
-
-Please provide：
-1. Brief analysis and evaluation of todays training（Under 50 words）
-2. Training suggestions for tomorrow（Under 50 words）
-3. Words of motivation（Under 30 words）
+        prompt = _DAILY_TMPL.format_map({
+            'session_count': session_count,
+            'total_minutes': f"{report_data['total_duration_minutes']:.1f}",
+        })
+        return prompt, report_data
 
-Please keep tone concise, professional, and warm.
-"""
-        daily_advice = self.call_openai_api(prompt)
-        print(daily_advice)
+    @staticmethod
+    def _daily_result(report_data, daily_advice):
         return {
                 'type': 'daily_report',
                 'date': report_data['date'],
@@ -301,40 +698,50 @@ Please keep tone concise, professional, and warm.
                 'advice': daily_advice,
                 'generated_at': datetime.now().isoformat()
             }
-    
-    def generate_weekly_summary(self, user_id: str) -> Dict:
-        """
-        生成周训练总结
-        :param user_id: 用户ID
-        :return: 周总结
-        """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
+
+    def generate_daily_report(self,user_id):
+        prompt, report_data = self._prepare_daily_report(
+            user_id, self._fetch_today_sessions(user_id))
+        if prompt is None:
+            return report_data
+        daily_advice = self.call_openai_api(prompt, task="daily")
+        logger.debug("daily advice: %s", daily_advice)
+        return self._daily_result(report_data, daily_advice)
+
+    async def agenerate_daily_report(self,user_id):
+        """generate_daily_report的异步版本，供gather并发使用"""
+        # 同步sqlite查询放到线程池里跑，不阻塞事件循环上其他在飞的LLM请求
+        today_sessions = await asyncio.to_thread(
+            self._fetch_today_sessions, user_id)
+        prompt, report_data = self._prepare_daily_report(
+            user_id, today_sessions)
+        if prompt is None:
+            return report_data
+        daily_advice = await self.acall_openai_api(prompt, task="daily")
+        return self._daily_result(report_data, daily_advice)
+
+    def _fetch_week_sessions(self, user_id: str):
         # 获取本周训练数据
-        cursor.execute('''
-            SELECT s.session_id, s.start_time, s.duration,
-                   COUNT(sd.id) as data_points
-            FROM training_sessions s
-            LEFT JOIN sensor_data sd ON s.session_id = sd.session_id
-            WHERE s.user_id = ? 
-            AND s.start_time >= date('now', '-7 days')
-            GROUP BY s.session_id
-            ORDER BY s.start_time
-        ''', (user_id,))
-        
-        week_sessions = cursor.fetchall()
-        conn.close()
-        
-        if not week_sessions:
-            return {
+        with self._lock:
+            return pd.read_sql_query('''
+                SELECT s.session_id, s.start_time, s.duration
+                FROM training_sessions s
+                WHERE s.user_id = ?
+                AND s.start_time >= date('now', '-7 days')
+                ORDER BY s.start_time
+            ''', self._conn, params=(user_id,))
+
+    def _prepare_weekly_summary(self, user_id: str, week_sessions):
+        """构建周统计和提示词；本周无数据时返回(None, 兜底回复)"""
+        if week_sessions.empty:
+            return None, {
                 'message': 'No training data available this week',
                 'recommendation': 'It is recommended to develop a regular training plan and train 3-4 times a week'
             }
-        
-        # 计算周统计
+
+        # 计算周统计（向量化求和）
         total_sessions = len(week_sessions)
-        total_duration = sum([session[2] or 0 for session in week_sessions])
+        total_duration = float(week_sessions['duration'].fillna(0).sum())
         avg_duration = total_duration / total_sessions if total_sessions > 0 else 0
         
         weekly_data = {
@@ -345,25 +752,16 @@ Please keep tone concise, professional, and warm.
             'average_session_duration_minutes': avg_duration / 60 if avg_duration else 0,
             'training_frequency': total_sessions / 7  # 每日平均训练次数
         }
-        prompt = f"""
-
-As a rehabilitation training expert, please provide a weekly summary and next week's recommendations in english based on the patient's training situation this week.
-
-This weeks training situation:：
-- Training sessions：{total_sessions} times
-- Total duration：{weekly_data['total_duration_hours']:.1f} Hours
-- Average session duration：{weekly_data['average_session_duration_minutes']:.1f} Minutes
-- Training frequency：{weekly_data['training_frequency']:.1f} Times/days
-
-
-Please provide:
-1. Summary of this week's training performance (within 100 words)
-2. Suggestions for next week's training plan (within 100 words)
-3. Long term rehabilitation recommendations (within 80 words)
-Maintain a professional and encouraging tone.
-"""
-        weekly_advice = self.call_openai_api(prompt)
-        print(weekly_advice)
+        prompt = _WEEKLY_TMPL.format_map({
+            'total_sessions': total_sessions,
+            'total_hours': f"{weekly_data['total_duration_hours']:.1f}",
+            'avg_minutes': f"{weekly_data['average_session_duration_minutes']:.1f}",
+            'frequency': f"{weekly_data['training_frequency']:.1f}",
+        })
+        return prompt, weekly_data
+
+    @staticmethod
+    def _weekly_result(weekly_data, weekly_advice):
         return {
                 'type': 'weekly_summary',
                 'week_period': f"{weekly_data['week_start']} 至 {weekly_data['week_end']}",
@@ -372,6 +770,46 @@ Maintain a professional and encouraging tone.
                 'generated_at': datetime.now().isoformat()
             }
 
+    def generate_weekly_summary(self, user_id: str) -> Dict:
+        """
+        生成周训练总结
+        :param user_id: 用户ID
+        :return: 周总结
+        """
+        prompt, weekly_data = self._prepare_weekly_summary(
+            user_id, self._fetch_week_sessions(user_id))
+        if prompt is None:
+            return weekly_data
+        weekly_advice = self.call_openai_api(prompt, task="weekly")
+        logger.debug("weekly advice: %s", weekly_advice)
+        return self._weekly_result(weekly_data, weekly_advice)
+
+    async def agenerate_weekly_summary(self, user_id: str) -> Dict:
+        """generate_weekly_summary的异步版本，供gather并发使用"""
+        week_sessions = await asyncio.to_thread(
+            self._fetch_week_sessions, user_id)
+        prompt, weekly_data = self._prepare_weekly_summary(
+            user_id, week_sessions)
+        if prompt is None:
+            return weekly_data
+        weekly_advice = await self.acall_openai_api(prompt, task="weekly")
+        return self._weekly_result(weekly_data, weekly_advice)
+
+    async def generate_full_report(self, user_id, analysis_data, user_profile=None):
+        """
+        并发生成建议+日报+周总结：三个LLM调用的网络等待重叠，
+        总耗时≈最慢的一次而不是三次相加
+        """
+        recommendations, daily_report, weekly_summary = await asyncio.gather(
+            self.agenerate_recommendations(analysis_data, user_profile),
+            self.agenerate_daily_report(user_id),
+            self.agenerate_weekly_summary(user_id))
+        return {
+            'recommendations': recommendations,
+            'daily_report': daily_report,
+            'weekly_summary': weekly_summary,
+        }
+
 
 '''
 advisor = GPTRehabilitationAdvisor()
@@ -1,13 +1,46 @@
+import asyncio
+import csv
+import io
+import os
+import queue
+import threading
 import sqlite3
+import httpx
 import requests
 from datetime import datetime
+from math import sin
 import numpy as np
 import time
 import random
-import json
-import uuid
+import orjson
+import secrets
 import re
 
+# pyarrow是可选依赖：仅会话归档功能需要，未安装时archive_session不可用
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# 同一份字面量SQL从所有写入路径复用，命中sqlite3的语句缓存，
+# 热循环里不再重复过一遍SQL解析和查询计划
+INSERT_SENSOR_SQL = (
+    'INSERT INTO sensor_data '
+    '(timestamp, test_type, force_value, angle_value, session_id, user_id, '
+    'data_quality) '
+    'VALUES (?, ?, ?, ?, ?, ?, ?)')
+
+# 50行展开的多值INSERT：executemany每行走一次bind/step循环，
+# 多值形式整批只过一次VM调度，满批flush时省掉49次step往返
+_INSERT_CHUNK = 50
+INSERT_SENSOR_SQL_50 = (
+    'INSERT INTO sensor_data '
+    '(timestamp, test_type, force_value, angle_value, session_id, user_id, '
+    'data_quality) '
+    'VALUES ' + ', '.join(['(?, ?, ?, ?, ?, ?, ?)'] * _INSERT_CHUNK))
+
+
 class EnhancedSensorDataHandler:
     """
     增强型传感器数据处理器 - WiFi通信版本
@@ -42,16 +75,63 @@ class EnhancedSensorDataHandler:
         self.is_running = False
         self.current_mode = self.MODE_ALL  # 默认模式3
         self.timeout = 5  # HTTP请求超时时间（秒）
+        # 测试类型→专用解析函数：分派在进解析前做一次哈希查找，
+        # 解析函数内部不再有任何类型成员判断
+        self._parsers = {
+            'force test': self._parse_force,
+            'angle test': self._parse_angle,
+            'force and angle test': self._parse_both,
+        }
         self.init_database()
 
+        # 写入走长连接+本地缓冲：每0.1s一条的采样如果逐条connect/commit，
+        # 每个样本都付一次fsync，批量flush把这笔开销摊到整批上
+        self._conn = sqlite3.connect(db_path, isolation_level=None,
+                                     check_same_thread=False,
+                                     cached_statements=512)
+        self._conn.executescript(self._PRAGMAS)
+        self._cursor = self._conn.cursor()
+        # 定点格式按库判定一次：新建库的force/angle列声明为INTEGER，
+        # 旧库是REAL——不能按行猜（REAL亲和会把整数转成浮点，类型标签不可靠）
+        cols = {row[1]: (row[2] or '').upper()
+                for row in self._conn.execute('PRAGMA table_info(sensor_data)')}
+        self._fixed_point = cols.get('force_value') == 'INTEGER'
+        # 所有DB访问共用这一个连接，跨线程时用锁串行化临界区
+        self._db_lock = threading.Lock()
+        self._pending = []
+        self._last_flush = time.monotonic()
+        # 1秒TTL读缓存：前端轮询常在同一秒内重复拉同一会话的数据，
+        # 命中时直接还上次的结果，不再跑查询+逐行建dict
+        self._query_cache = {}
+
+        # 复用TCP连接：每0.1s一次的采样如果每次都新开连接，
+        # 三次握手+慢启动比1KB的JSON往返本身还贵
+        self._http = requests.Session()
+        self._http.headers.update({"Connection": "keep-alive"})
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=2, pool_maxsize=4, max_retries=0)
+        self._http.mount("http://", adapter)
+
         print("[INFO] ESP32 WiFi配置:")
         print("       SSID: ESP32_Server")
         print("       密码: 12345678")
         print("       请先连接到ESP32的WiFi热点，然后使用ESP32的IP地址")
 
+    # WAL+NORMAL是SQLite写入路径的主杠杆：写不再阻塞读，
+    # 每次commit也不用等journal双写fsync（NORMAL只在断电时丢最后一笔事务）
+    _PRAGMAS = '''
+        PRAGMA journal_mode=WAL;
+        PRAGMA synchronous=NORMAL;
+        PRAGMA temp_store=MEMORY;
+        PRAGMA cache_size=-20000;
+        PRAGMA mmap_size=268435456;
+        PRAGMA busy_timeout=5000;
+    '''
+
     def init_database(self):
         """Initialize enhanced database schema"""
         conn = sqlite3.connect(self.db_path)
+        conn.executescript(self._PRAGMAS)
         cursor = conn.cursor()
 
         # Users table
@@ -76,10 +156,15 @@ class EnhancedSensorDataHandler:
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS sensor_data (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                -- epoch微秒整数：8字节、整型比较排序，比19字节的TEXT时间戳
+                -- 行更窄、索引键更紧（已有库保持旧TEXT格式，读侧做兼容）
+                timestamp INTEGER NOT NULL DEFAULT
+                    (CAST((julianday('now') - 2440587.5) * 86400000000 AS INTEGER)),
                 test_type TEXT NOT NULL,  -- 'force test', 'angle test', 'force and angle test'
-                force_value REAL,         -- Force in Newtons
-                angle_value REAL,         -- Angle in degrees
+                -- 定点整数存储（×100，厘牛/厘度）：1-3字节varint替代
+                -- 8字节REAL；旧库保持REAL物理值，读写两侧按声明类型分派
+                force_value INTEGER,      -- Force in centinewtons (N × 100)
+                angle_value INTEGER,      -- Angle in centidegrees (° × 100)
                 session_id TEXT NOT NULL,
                 user_id TEXT NOT NULL,
                 data_quality REAL DEFAULT 1.0,  -- Data quality score 0-1
@@ -150,6 +235,22 @@ class EnhancedSensorDataHandler:
             )
         ''')
 
+        # 读路径的索引：get_session_data按(session_id, timestamp)范围扫，
+        # get_user_sessions按(user_id, start_time DESC)取最近N条，
+        # 诊断里的active计数走status索引——都不再全表扫描+临时排序
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_sensor_session_ts
+            ON sensor_data(session_id, timestamp)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_sessions_user_start
+            ON training_sessions(user_id, start_time DESC)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_sessions_status
+            ON training_sessions(status)
+        ''')
+
         conn.commit()
         conn.close()
         print('[OK] Enhanced database schema created successfully')
@@ -163,14 +264,15 @@ class EnhancedSensorDataHandler:
         """
         try:
             # 测试连接 - 调用ESP32的/data端点
-            response = requests.get(
+            response = self._http.get(
                 f"{self.sensor_url_base}/data",
                 timeout=self.timeout
             )
 
             if response.status_code == 200:
                 # 尝试解析返回的JSON数据以验证格式
-                data = response.json()
+                # orjson直接吃bytes：C解析器，不经过requests的纯Python json
+                data = orjson.loads(response.content)
                 # leg.ino 返回格式: {"angle": x, "yaw": y, "force": z}
                 if 'angle' in data or 'yaw' in data or 'force' in data:
                     self.is_connected = True
@@ -193,7 +295,7 @@ class EnhancedSensorDataHandler:
             print(f"[INFO] Will use simulation mode")
             self.is_connected = False
             return False
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             print(f"[ERROR] Failed to parse sensor response: {e}")
             self.is_connected = False
             return False
@@ -227,7 +329,7 @@ class EnhancedSensorDataHandler:
     def simulate_sensor_data(self, test_type):
         """Enhanced sensor data simulation with realistic patterns"""
         data = {
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': time.time(),  # 与parse_wifi_data一致的epoch浮点秒
             'test_type': test_type,
             'data_quality': random.uniform(0.85, 1.0)  # Simulate data quality
         }
@@ -242,7 +344,8 @@ class EnhancedSensorDataHandler:
             fatigue_factor = max(0.7, 1 - (current_time % 60) / 300)
 
             # Add periodic muscle contraction pattern
-            contraction_pattern = 20 * np.sin(current_time * 0.8) * fatigue_factor
+            # math.sin对标量比np.sin快一个量级：后者每次都要过ufunc分发
+            contraction_pattern = 20 * sin(current_time * 0.8) * fatigue_factor
 
             # Add some controlled noise
             noise = random.gauss(0, 5)
@@ -255,10 +358,10 @@ class EnhancedSensorDataHandler:
             base_angle = 90  # Base angle in degrees
 
             # Simulate range of motion exercise
-            rom_pattern = 30 * np.sin(current_time * 0.4)
+            rom_pattern = 30 * sin(current_time * 0.4)
 
             # Add slight tremor/instability
-            tremor = 2 * np.sin(current_time * 3) * random.uniform(0.5, 1.0)
+            tremor = 2 * sin(current_time * 3) * random.uniform(0.5, 1.0)
 
             # Add controlled noise
             noise = random.gauss(0, 1)
@@ -280,14 +383,14 @@ class EnhancedSensorDataHandler:
         """
         if self.is_connected:
             try:
-                # 通过WiFi HTTP获取ESP32传感器数据
-                response = requests.get(
+                # 通过WiFi HTTP获取ESP32传感器数据（keep-alive复用连接）
+                response = self._http.get(
                     f"{self.sensor_url_base}/data",
                     timeout=2  # 较短的超时时间以便实时更新
                 )
 
                 if response.status_code == 200:
-                    sensor_data = response.json()
+                    sensor_data = orjson.loads(response.content)
                     # ESP32直接返回数据，格式: {"s1": X, "s2": Y, "y": Z, "f": W}
                     data = self.parse_wifi_data(sensor_data, test_type)
                     if data:
@@ -302,18 +405,72 @@ class EnhancedSensorDataHandler:
 
             except requests.exceptions.RequestException as e:
                 print(f"[ERROR] WiFi data reading error: {e}")
-            except json.JSONDecodeError as e:
+            except orjson.JSONDecodeError as e:
                 print(f"[ERROR] Failed to parse sensor data: {e}")
 
         # Fallback to simulation
         return self.simulate_sensor_data(test_type)
 
+    def _base_record(self, sensor_data, test_type):
+        """公共字段 + 虚拟/真实角度附加信息"""
+        data = {
+            # epoch浮点秒：isoformat()每个样本都要格式化一个新字符串，
+            # 需要可读时间时在落库/展示处再转
+            'timestamp': time.time(),
+            'test_type': test_type,
+            'data_quality': 1.0  # ESP32不提供quality，默认为1.0
+        }
+        angle = sensor_data.get('angle')
+        if angle is not None:
+            data['virtual_angle'] = float(angle)
+        yaw = sensor_data.get('yaw')
+        if yaw is not None:
+            data['yaw_angle'] = float(yaw)
+        return data
+
+    def _parse_force(self, sensor_data, test_type):
+        """仅拉力 (leg.ino的'force'字段)"""
+        data = self._base_record(sensor_data, test_type)
+        force = sensor_data.get('force')
+        if force is None:
+            return None
+        data['force_value'] = float(force)
+        return data
+
+    def _parse_angle(self, sensor_data, test_type):
+        """仅角度：优先yaw（真实MPU6050角度），其次angle（虚拟角度）"""
+        data = self._base_record(sensor_data, test_type)
+        if 'yaw_angle' in data:
+            data['angle_value'] = data['yaw_angle']
+        elif 'virtual_angle' in data:
+            data['angle_value'] = data['virtual_angle']
+        else:
+            return None
+        return data
+
+    def _parse_both(self, sensor_data, test_type):
+        """拉力+角度，至少解析到一项才算有效"""
+        data = self._base_record(sensor_data, test_type)
+        force = sensor_data.get('force')
+        if force is not None:
+            data['force_value'] = float(force)
+        if 'yaw_angle' in data:
+            data['angle_value'] = data['yaw_angle']
+        elif 'virtual_angle' in data:
+            data['angle_value'] = data['virtual_angle']
+        if 'force_value' not in data and 'angle_value' not in data:
+            return None
+        return data
+
     def parse_wifi_data(self, sensor_data, test_type):
         """
         解析从WiFi传感器(ESP32)接收的数据
 
         leg.ino数据格式: {"angle": virtual_angle, "yaw": angleY1, "force": force_N}
 
+        按测试类型分派到专用解析函数，热循环里每个样本只剩
+        一次字典查找，没有逐字段的成员判断
+
         Args:
             sensor_data: 从传感器接收的原始数据（leg.ino格式）
             test_type: 测试类型
@@ -321,46 +478,15 @@ class EnhancedSensorDataHandler:
         Returns:
             dict: 解析后的数据
         """
-        data = {
-            'timestamp': datetime.now().isoformat(),
-            'test_type': test_type,
-            'data_quality': 1.0  # ESP32不提供quality，默认为1.0
-        }
-
+        parser = self._parsers.get(test_type)
+        if parser is None:
+            return None
         try:
-            # 解析拉力数据 (leg.ino的'force'字段)
-            if test_type in ['force test', 'force and angle test']:
-                force = sensor_data.get('force')
-                if force is not None:
-                    data['force_value'] = float(force)
-
-            # 解析角度数据 (leg.ino的'yaw'字段 - MPU6050的Y轴角度)
-            if test_type in ['angle test', 'force and angle test']:
-                # 优先使用yaw（真实MPU6050角度），其次使用angle（虚拟角度）
-                yaw = sensor_data.get('yaw')
-                angle = sensor_data.get('angle')
-
-                if yaw is not None:
-                    data['angle_value'] = float(yaw)
-                elif angle is not None:
-                    data['angle_value'] = float(angle)
-
-            # 额外保存虚拟角度和真实角度信息
-            if 'angle' in sensor_data:
-                data['virtual_angle'] = float(sensor_data['angle'])
-            if 'yaw' in sensor_data:
-                data['yaw_angle'] = float(sensor_data['yaw'])
-
-            # 如果没有解析到任何数据，返回None
-            if 'force_value' not in data and 'angle_value' not in data:
-                return None
-
+            return parser(sensor_data, test_type)
         except Exception as e:
             print(f"[ERROR] WiFi data parsing error: {e}")
             return None
 
-        return data
-
     def send_command(self, command, servo1=None, servo2=None):
         """
         通过WiFi发送命令到传感器（ESP32 leg.ino）
@@ -392,13 +518,14 @@ class EnhancedSensorDataHandler:
                 print("[ERROR] Must provide either command or servo angles")
                 return False
 
-            response = requests.post(
+            response = self._http.post(
                 f"{self.sensor_url_base}/control",
                 data=payload,  # leg.ino使用form data而不是JSON
                 timeout=self.timeout
             )
 
-            if response.status_code == 200 and response.text == 'ok':
+            # 直接比较字节，跳过Response.text的编码探测/解码
+            if response.status_code == 200 and response.content == b'ok':
                 if command:
                     print(f"[OK] Command sent successfully: {command}")
                     if command in ['a11', 'a12', 'b11', 'b12']:
@@ -416,163 +543,304 @@ class EnhancedSensorDataHandler:
             print(f"[ERROR] Failed to send command: {e}")
             return False
 
+    # 每满100行或隔2秒落一次盘：一次事务/fsync覆盖一整批样本
+    _QUERY_TTL = 1.0  # 读缓存有效期（秒）
+    _FLUSH_SIZE = 100
+    _FLUSH_SECONDS = 2.0
+
+    @staticmethod
+    def _to_fixed(value):
+        """物理值→定点整数（×100）；None透传"""
+        return int(round(value * 100)) if value is not None else None
+
+    @staticmethod
+    def _from_fixed(value):
+        """定点整数→物理值；None透传"""
+        return value / 100.0 if value is not None else None
+
     def save_to_database(self, data, session_id, user_id=None):
-        """Save sensor data to database with enhanced error handling"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        """Buffer a sensor sample; rows are flushed to SQLite in batches"""
+        force = data.get('force_value')
+        angle = data.get('angle_value')
+        if self._fixed_point:
+            force = self._to_fixed(force)
+            angle = self._to_fixed(angle)
+        # 绑定样本自己的采集时间：批量flush时列DEFAULT是在落库时刻
+        # 求值的，10Hz缓冲下整批会挤到同一时间点、最多晚2秒
+        self._pending.append((
+            int(data.get('timestamp', time.time()) * 1e6),
+            data['test_type'],
+            force,
+            angle,
+            session_id,
+            user_id,
+            data.get('data_quality', 1.0)
+        ))
+
+        if (len(self._pending) >= self._FLUSH_SIZE
+                or time.monotonic() - self._last_flush >= self._FLUSH_SECONDS):
+            self._flush()
+
+    def _flush(self):
+        """Write all buffered rows in one BEGIN IMMEDIATE/COMMIT transaction"""
+        if self._pending:
+            rows = self._pending
+            try:
+                with self._db_lock:
+                    self._cursor.execute('BEGIN IMMEDIATE')
+                    # 满50行的部分走展开的多值INSERT，零头走executemany
+                    full = len(rows) - len(rows) % _INSERT_CHUNK
+                    for i in range(0, full, _INSERT_CHUNK):
+                        self._cursor.execute(
+                            INSERT_SENSOR_SQL_50,
+                            [v for row in rows[i:i + _INSERT_CHUNK]
+                             for v in row])
+                    if full < len(rows):
+                        self._cursor.executemany(INSERT_SENSOR_SQL,
+                                                 rows[full:])
+                    self._cursor.execute('COMMIT')
+                # 新数据落库后对应会话的缓存结果已过期
+                for sid in {row[4] for row in rows}:
+                    self._query_cache.pop(('session', sid), None)
+                self._pending.clear()
+            except Exception as e:
+                print(f"[ERROR] Database insertion error: {e}")
+                try:
+                    with self._db_lock:
+                        self._conn.execute('ROLLBACK')
+                except sqlite3.OperationalError:
+                    pass
+        self._last_flush = time.monotonic()
 
-        try:
-            cursor.execute('''
-                INSERT INTO sensor_data
-                (test_type, force_value, angle_value, session_id, user_id, data_quality)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (
-                data['test_type'],
-                data.get('force_value'),
-                data.get('angle_value'),
-                session_id,
-                user_id,
-                data.get('data_quality', 1.0)
-            ))
-            conn.commit()
+    def save_batch(self, rows):
+        """Save a batch of sensor rows in one transaction
+
+        Args:
+            rows: list of (timestamp, test_type, force_value, angle_value,
+                  session_id, user_id, data_quality) tuples; timestamp is
+                  the sample's epoch time in float seconds
+
+        One commit per batch instead of one per sample keeps the
+        collection loop sensor-bound rather than fsync-bound.
+        Callers pass physical units; fixed-point scaling and the
+        epoch-microsecond timestamp conversion happen here.
+        """
+        if not rows:
+            return
+
+        if self._fixed_point:
+            rows = [(int(ts * 1e6), tt, self._to_fixed(f),
+                     self._to_fixed(a), sid, uid, q)
+                    for ts, tt, f, a, sid, uid, q in rows]
+        else:
+            rows = [(int(ts * 1e6), tt, f, a, sid, uid, q)
+                    for ts, tt, f, a, sid, uid, q in rows]
 
+        try:
+            with self._db_lock:
+                self._cursor.execute('BEGIN IMMEDIATE')
+                self._cursor.executemany(INSERT_SENSOR_SQL, rows)
+                self._cursor.execute('COMMIT')
         except Exception as e:
-            print(f"[ERROR] Database insertion error: {e}")
-            conn.rollback()
-        finally:
-            conn.close()
+            print(f"[ERROR] Batch database insertion error: {e}")
+            try:
+                with self._db_lock:
+                    self._conn.execute('ROLLBACK')
+            except sqlite3.OperationalError:
+                pass
 
     def create_training_session(self, user_id, test_types, session_config=None):
         """Create enhanced training session"""
-        session_id = f"session_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{str(uuid.uuid4())[:8]}"
-
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        # 秒级时间戳前缀保持按时间可排序，8位随机hex防撞，
+        # 比strftime+uuid4便宜一个数量级
+        session_id = f"session_{int(time.time())}_{secrets.token_hex(4)}"
 
         try:
-            cursor.execute('''
-                INSERT INTO training_sessions
-                (session_id, user_id, start_time, test_types, session_config, status)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (
-                session_id,
-                user_id,
-                datetime.now(),
-                json.dumps(test_types),
-                json.dumps(session_config) if session_config else None,
-                'active'
-            ))
-            conn.commit()
+            # 长连接自动提交模式：单条INSERT执行完即落库
+            with self._db_lock:
+                self._conn.execute('''
+                    INSERT INTO training_sessions
+                    (session_id, user_id, start_time, test_types, session_config, status)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (
+                    session_id,
+                    user_id,
+                    datetime.now(),
+                    orjson.dumps(test_types).decode(),
+                    orjson.dumps(session_config).decode() if session_config else None,
+                    'active'
+                ))
             print(f"[OK] Training session created: {session_id}")
 
         except Exception as e:
             print(f"[ERROR] Session creation error: {e}")
-            conn.rollback()
-        finally:
-            conn.close()
 
         return session_id
 
     def end_training_session(self, session_id, notes=None):
         """End training session with enhanced logging"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        self._flush()  # 会话收尾前确保本会话数据已全部落库
 
         try:
-            # Get session start time
-            cursor.execute(
-                'SELECT start_time FROM training_sessions WHERE session_id = ?',
-                (session_id,)
-            )
-            result = cursor.fetchone()
+            with self._db_lock:
+                # Get session start time
+                result = self._conn.execute(
+                    'SELECT start_time FROM training_sessions WHERE session_id = ?',
+                    (session_id,)
+                ).fetchone()
+
+                if result:
+                    start_time = datetime.fromisoformat(result[0])
+                    duration = int((datetime.now() - start_time).total_seconds())
+
+                    self._conn.execute('''
+                        UPDATE training_sessions
+                        SET end_time = ?, duration = ?, status = ?, notes = ?
+                        WHERE session_id = ?
+                    ''', (datetime.now(), duration, 'completed', notes, session_id))
 
             if result:
-                start_time = datetime.fromisoformat(result[0])
-                duration = int((datetime.now() - start_time).total_seconds())
-
-                cursor.execute('''
-                    UPDATE training_sessions
-                    SET end_time = ?, duration = ?, status = ?, notes = ?
-                    WHERE session_id = ?
-                ''', (datetime.now(), duration, 'completed', notes, session_id))
-
-                conn.commit()
+                # 会话状态变更会影响用户会话列表的缓存结果
+                self._query_cache.clear()
                 print(f"[OK] Session {session_id} completed - Duration: {duration}s")
             else:
                 print(f"[ERROR] Session {session_id} not found")
 
         except Exception as e:
             print(f"[ERROR] Session end error: {e}")
-            conn.rollback()
-        finally:
-            conn.close()
+
+    def archive_session(self, session_id, archive_dir='archive'):
+        """
+        把已结束会话的原始样本归档为Parquet并从热表删除
+
+        zstd压缩+字典编码的列存文件远小于SQLite行存，sensor_data
+        只保留活跃会话后，实时查询和WAL checkpoint都更轻。
+        分析/报告跑完后再调用；pyarrow未安装时直接返回None。
+
+        Returns:
+            str: 归档文件路径，无数据或失败时为None
+        """
+        if pa is None:
+            print("[WARN] pyarrow not installed, session archiving unavailable")
+            return None
+
+        self._flush()  # 归档前确保缓冲数据已落库
+
+        # 归档统一为物理单位，定点库在SQL侧还原
+        vals = ('force_value / 100.0, angle_value / 100.0'
+                if self._fixed_point else 'force_value, angle_value')
+        try:
+            with self._db_lock:
+                rows = self._conn.execute(f'''
+                    SELECT timestamp, test_type, {vals}, data_quality
+                    FROM sensor_data
+                    WHERE session_id = ?
+                    ORDER BY timestamp
+                ''', (session_id,)).fetchall()
+
+            if not rows:
+                return None
+
+            os.makedirs(archive_dir, exist_ok=True)
+            cols = list(zip(*rows))
+            table = pa.table({
+                # timestamp保持原始类型（新库int微秒/旧库TEXT），其余
+                # 数值列降到float32——传感器精度远用不满float64
+                'timestamp': pa.array(cols[0]),
+                'test_type': pa.array(cols[1], pa.string()),
+                'force_value': pa.array(cols[2], pa.float32()),
+                'angle_value': pa.array(cols[3], pa.float32()),
+                'data_quality': pa.array(cols[4], pa.float32()),
+            })
+            path = os.path.join(archive_dir, f'{session_id}.parquet')
+            pq.write_table(table, path, compression='zstd',
+                           use_dictionary=True)
+
+            with self._db_lock:
+                self._conn.execute(
+                    'DELETE FROM sensor_data WHERE session_id = ?',
+                    (session_id,))
+            self._query_cache.pop(('session', session_id), None)
+
+            print(f"[OK] Session {session_id} archived to {path} ({len(rows)} rows)")
+            return path
+
+        except Exception as e:
+            print(f"[ERROR] Session archive error: {e}")
+            return None
 
     def get_session_data(self, session_id):
         """Get session data with enhanced filtering"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        key = ('session', session_id)
+        cached = self._query_cache.get(key)
+        if cached is not None and time.monotonic() - cached[0] < self._QUERY_TTL:
+            return cached[1]
 
         try:
-            cursor.execute('''
-                SELECT timestamp, test_type, force_value, angle_value, data_quality
-                FROM sensor_data
-                WHERE session_id = ?
-                ORDER BY timestamp
-            ''', (session_id,))
-
-            data = cursor.fetchall()
+            with self._db_lock:
+                data = self._conn.execute('''
+                    SELECT timestamp, test_type, force_value, angle_value, data_quality
+                    FROM sensor_data
+                    WHERE session_id = ?
+                    ORDER BY timestamp
+                ''', (session_id,)).fetchall()
 
-            return [
+            fixed = self._fixed_point
+            result = [
                 {
-                    'timestamp': row[0],
+                    # 新库存epoch微秒整数，旧库是TEXT时间戳——对外统一成ISO字符串
+                    'timestamp': (datetime.fromtimestamp(row[0] / 1e6).isoformat()
+                                  if isinstance(row[0], (int, float)) else row[0]),
                     'test_type': row[1],
-                    'force_value': row[2],
-                    'angle_value': row[3],
+                    # 定点库存的是×100整数，对外还原为物理单位
+                    'force_value': self._from_fixed(row[2]) if fixed else row[2],
+                    'angle_value': self._from_fixed(row[3]) if fixed else row[3],
                     'data_quality': row[4]
                 }
                 for row in data
             ]
+            self._query_cache[key] = (time.monotonic(), result)
+            return result
 
         except Exception as e:
             print(f"[ERROR] Error retrieving session data: {e}")
             return []
-        finally:
-            conn.close()
 
     def get_user_sessions(self, user_id, limit=50):
         """Get user's training sessions"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        key = ('user', user_id, limit)
+        cached = self._query_cache.get(key)
+        if cached is not None and time.monotonic() - cached[0] < self._QUERY_TTL:
+            return cached[1]
 
         try:
-            cursor.execute('''
-                SELECT session_id, start_time, end_time, duration, test_types, status, notes
-                FROM training_sessions
-                WHERE user_id = ?
-                ORDER BY start_time DESC
-                LIMIT ?
-            ''', (user_id, limit))
-
-            sessions = cursor.fetchall()
-
-            return [
+            with self._db_lock:
+                sessions = self._conn.execute('''
+                    SELECT session_id, start_time, end_time, duration, test_types, status, notes
+                    FROM training_sessions
+                    WHERE user_id = ?
+                    ORDER BY start_time DESC
+                    LIMIT ?
+                ''', (user_id, limit)).fetchall()
+
+            result = [
                 {
                     'session_id': row[0],
                     'start_time': row[1],
                     'end_time': row[2],
                     'duration': row[3],
-                    'test_types': json.loads(row[4]) if row[4] else [],
+                    'test_types': orjson.loads(row[4]) if row[4] else [],
                     'status': row[5],
                     'notes': row[6]
                 }
                 for row in sessions
             ]
+            self._query_cache[key] = (time.monotonic(), result)
+            return result
 
         except Exception as e:
             print(f"[ERROR] Error retrieving user sessions: {e}")
             return []
-        finally:
-            conn.close()
 
     def start_data_collection(self, test_type, session_id, user_id, duration=60, interval=0.1):
         """
@@ -599,7 +867,8 @@ class EnhancedSensorDataHandler:
             self.set_mode(target_mode)
 
         self.is_running = True
-        start_time = time.time()
+        start_time = time.monotonic()
+        tick = 0
         data_count = 0
         error_count = 0
         max_errors = 10
@@ -607,12 +876,19 @@ class EnhancedSensorDataHandler:
         print(f"[START] Starting {test_type} data collection via WiFi (Mode {target_mode})")
         print(f"[TIME] Duration: {duration}s, Interval: {interval}s")
 
-        while self.is_running and (time.time() - start_time) < duration and error_count < max_errors:
+        # 生产者/消费者拆分：本线程只做HTTP读+入队，写线程批量落盘，
+        # ESP32往返和磁盘fsync得以重叠而不是串行排队
+        q = queue.Queue(maxsize=1024)
+        writer = threading.Thread(target=self._drain_queue,
+                                  args=(q, session_id, user_id), daemon=True)
+        writer.start()
+
+        while self.is_running and (time.monotonic() - start_time) < duration and error_count < max_errors:
             try:
                 data = self.read_sensor_data(test_type)
 
                 if data:
-                    self.save_to_database(data, session_id, user_id)
+                    q.put(data)
                     data_count += 1
 
                     # Enhanced logging
@@ -626,20 +902,88 @@ class EnhancedSensorDataHandler:
 
                     print(f"[{data_count:04d}] {' | '.join(status_parts)}")
 
-                time.sleep(interval)
-
             except Exception as e:
                 error_count += 1
                 print(f"[ERROR] Data collection error #{error_count}: {e}")
-                time.sleep(interval)  # Continue despite errors
+
+            # 对齐到 start + n*interval 的下一拍：HTTP/DB耗时的波动
+            # 不会累积成采样漂移（monotonic不受系统时钟跳变影响）
+            tick += 1
+            delay = start_time + tick * interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
 
         self.is_running = False
+        q.put(None)  # 哨兵：通知写线程收尾
+        writer.join()
 
         if error_count >= max_errors:
             print(f"[WARN] Data collection stopped due to excessive errors ({error_count})")
         else:
             print(f"[OK] Data collection completed - {data_count} data points collected")
 
+    async def _poll_loop(self, test_type, session_id, user_id, duration, interval):
+        """httpx异步轮询：传感器GET的等待期可与DB落盘及其它端点的
+        请求重叠，采样率只受ESP32限制而不是客户端串行RTT"""
+        loop = asyncio.get_running_loop()
+        start = time.monotonic()
+        tick = 0
+        async with httpx.AsyncClient(timeout=2) as client:
+            while self.is_running and time.monotonic() - start < duration:
+                data = None
+                if self.is_connected:
+                    try:
+                        r = await client.get(f"{self.sensor_url_base}/data")
+                        if r.status_code == 200:
+                            data = self.parse_wifi_data(
+                                orjson.loads(r.content), test_type)
+                    except (httpx.HTTPError, orjson.JSONDecodeError) as e:
+                        print(f"[ERROR] WiFi data reading error: {e}")
+                if data is None:
+                    data = self.simulate_sensor_data(test_type)
+
+                # 批量写盘路径丢给线程池执行，不阻塞事件循环
+                await loop.run_in_executor(
+                    None, self.save_to_database, data, session_id, user_id)
+
+                tick += 1
+                delay = start + tick * interval - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+        await loop.run_in_executor(None, self._flush)
+
+    def start_data_collection_async(self, test_type, session_id, user_id,
+                                    duration=60, interval=0.1):
+        """Async-backed collection with the same blocking call signature
+
+        起一个事件循环驱动_poll_loop；对外仍是同步API，
+        适合多传感器/多端点并发轮询的部署
+        """
+        self.is_running = True
+        try:
+            asyncio.run(self._poll_loop(test_type, session_id, user_id,
+                                        duration, interval))
+        finally:
+            self.is_running = False
+
+    def _drain_queue(self, q, session_id, user_id):
+        """Writer thread: drain queued samples into the batched insert path
+
+        单写线程独占持久连接（SQLite serialized模式下安全），
+        None哨兵表示采集结束，退出前flush缓冲尾巴。
+        """
+        while True:
+            try:
+                data = q.get(timeout=0.5)
+            except queue.Empty:
+                if not self.is_running:
+                    break
+                continue
+            if data is None:
+                break
+            self.save_to_database(data, session_id, user_id)
+        self._flush()
+
     def stop_data_collection(self):
         """Stop data collection gracefully"""
         self.is_running = False
@@ -649,30 +993,37 @@ class EnhancedSensorDataHandler:
         """Calibrate sensors for accurate measurements"""
         print(f"🔧 Starting sensor calibration for {test_type}...")
 
-        calibration_data = []
-        start_time = time.time()
-
-        while (time.time() - start_time) < calibration_duration:
+        # 预分配连续的float32缓冲按索引填充：不积累Python对象列表，
+        # 也省掉np.mean(list)时的一次O(n)转换拷贝
+        cap = int(calibration_duration / 0.1) + 8
+        forces = np.empty(cap, np.float32)
+        angles = np.empty(cap, np.float32)
+        nf = na = 0
+        want_force = test_type in ('force test', 'force and angle test')
+        want_angle = test_type in ('angle test', 'force and angle test')
+        start_time = time.monotonic()
+
+        while (time.monotonic() - start_time) < calibration_duration:
             data = self.read_sensor_data(test_type)
             if data:
-                calibration_data.append(data)
+                if want_force and nf < cap and data.get('force_value'):
+                    forces[nf] = data['force_value']
+                    nf += 1
+                if want_angle and na < cap and data.get('angle_value'):
+                    angles[na] = data['angle_value']
+                    na += 1
             time.sleep(0.1)
 
         # Calculate calibration factors
         calibration_factors = {}
 
-        if calibration_data:
-            if test_type in ['force test', 'force and angle test']:
-                forces = [d.get('force_value', 0) for d in calibration_data if d.get('force_value')]
-                if forces:
-                    baseline_force = np.mean(forces)
-                    calibration_factors['force'] = 1.0 if baseline_force == 0 else 50.0 / baseline_force
+        if nf:
+            baseline_force = float(forces[:nf].mean())
+            calibration_factors['force'] = 1.0 if baseline_force == 0 else 50.0 / baseline_force
 
-            if test_type in ['angle test', 'force and angle test']:
-                angles = [d.get('angle_value', 0) for d in calibration_data if d.get('angle_value')]
-                if angles:
-                    baseline_angle = np.mean(angles)
-                    calibration_factors['angle'] = 1.0 if baseline_angle == 0 else 90.0 / baseline_angle
+        if na:
+            baseline_angle = float(angles[:na].mean())
+            calibration_factors['angle'] = 1.0 if baseline_angle == 0 else 90.0 / baseline_angle
 
         print(f"[OK] Calibration completed: {calibration_factors}")
         return calibration_factors
@@ -682,17 +1033,42 @@ class EnhancedSensorDataHandler:
         data = self.get_session_data(session_id)
 
         if format.lower() == 'csv':
-            csv_content = "Timestamp,Test Type,Force Value (N),Angle Value (°),Data Quality\n"
-            for item in data:
-                csv_content += f"{item['timestamp']},{item['test_type']},{item.get('force_value', '')},{item.get('angle_value', '')},{item.get('data_quality', '')}\n"
-            return csv_content
+            # csv.writer写入StringIO是摊还O(n)的追加；逐行+=拼接字符串
+            # 每次都要重新分配整个缓冲，大会话下是O(n^2)
+            buf = io.StringIO()
+            writer = csv.writer(buf)
+            writer.writerow(["Timestamp", "Test Type", "Force Value (N)",
+                             "Angle Value (°)", "Data Quality"])
+            writer.writerows(
+                (item['timestamp'], item['test_type'],
+                 item.get('force_value', ''), item.get('angle_value', ''),
+                 item.get('data_quality', ''))
+                for item in data)
+            return buf.getvalue()
 
         elif format.lower() == 'json':
-            return json.dumps(data, indent=2)
+            return orjson.dumps(data, option=orjson.OPT_INDENT_2).decode()
 
         else:
             raise ValueError(f"Unsupported export format: {format}")
 
+    def export_session_data_iter(self, session_id):
+        """Yield CSV lines one at a time for streaming downloads"""
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(["Timestamp", "Test Type", "Force Value (N)",
+                         "Angle Value (°)", "Data Quality"])
+        yield buf.getvalue()
+
+        for item in self.get_session_data(session_id):
+            buf.seek(0)
+            buf.truncate()
+            writer.writerow((item['timestamp'], item['test_type'],
+                             item.get('force_value', ''),
+                             item.get('angle_value', ''),
+                             item.get('data_quality', '')))
+            yield buf.getvalue()
+
     def get_system_diagnostics(self):
         """Get system diagnostics and health information"""
         diagnostics = {
@@ -708,26 +1084,24 @@ class EnhancedSensorDataHandler:
         }
 
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
             # Check database health
-            cursor.execute('SELECT COUNT(*) FROM users')
-            diagnostics['total_users'] = cursor.fetchone()[0]
-
-            cursor.execute('SELECT COUNT(*) FROM training_sessions')
-            diagnostics['total_sessions'] = cursor.fetchone()[0]
-
-            cursor.execute('SELECT COUNT(*) FROM sensor_data')
-            diagnostics['total_data_points'] = cursor.fetchone()[0]
-
-            cursor.execute("SELECT COUNT(*) FROM training_sessions WHERE status = 'active'")
-            diagnostics['active_sessions'] = cursor.fetchone()[0]
+            # 四个COUNT合成一条语句：一次round-trip拿齐，
+            # 不用为每个计数单独付planner+VDBE启动的成本
+            with self._db_lock:
+                row = self._conn.execute('''
+                    SELECT (SELECT COUNT(*) FROM users),
+                           (SELECT COUNT(*) FROM training_sessions),
+                           (SELECT COUNT(*) FROM sensor_data),
+                           (SELECT COUNT(*) FROM training_sessions
+                            WHERE status = 'active')
+                ''').fetchone()
+            (diagnostics['total_users'],
+             diagnostics['total_sessions'],
+             diagnostics['total_data_points'],
+             diagnostics['active_sessions']) = row
 
             diagnostics['database_status'] = 'healthy'
 
-            conn.close()
-
         except Exception as e:
             diagnostics['database_status'] = f'error: {str(e)}'
 
@@ -742,6 +1116,9 @@ class EnhancedSensorDataHandler:
     def close(self):
         """Close connections and cleanup"""
         self.is_running = False
+        self._flush()
+        self._conn.close()
+        self._http.close()
         print("[OK] WiFi sensor data handler closed successfully")
 
 
@@ -1,5 +1,11 @@
+import csv
+import io
+import logging
+import queue
 import sqlite3
 import serial
+import threading
+from logging.handlers import QueueHandler, QueueListener
 from datetime import datetime
 import numpy as np
 import time
@@ -8,6 +14,135 @@ import json
 import uuid
 import re
 
+# 热路径SQL提成模块级字面量：sqlite3按语句文本缓存已编译的VDBE程序，
+# 每条样本不再重复解析SQL和生成查询计划
+INSERT_SENSOR_SQL = (
+    'INSERT INTO sensor_data '
+    '(test_type, force_value, angle_value, session_id, user_id, data_quality) '
+    'VALUES (?, ?, ?, ?, ?, ?)')
+
+# 按模式特化的INSERT：单通道模式下不绑定注定为NULL的列，
+# 每行少走一截VDBE绑定/写列开销
+INSERT_SENSOR_SQL_ANGLE = (
+    'INSERT INTO sensor_data '
+    '(test_type, angle_value, session_id, user_id, data_quality) '
+    'VALUES (?, ?, ?, ?, ?)')
+INSERT_SENSOR_SQL_FORCE = (
+    'INSERT INTO sensor_data '
+    '(test_type, force_value, session_id, user_id, data_quality) '
+    'VALUES (?, ?, ?, ?, ?)')
+
+# 预编译协议正则：免掉每行一次的re模块缓存探测和模式对象查找
+_RE_ANGLE = re.compile(r'A:([\d.]+)')
+_RE_FORCE = re.compile(r'F:([\d.]+)')
+# 状态/确认消息的行首标记，一次startswith替代多次全行扫描
+_STATUS_PREFIXES = ('Receiver', 'Command', 'MODE')
+
+# 采样热循环的逐样本输出走logging队列：热路径只在DEBUG开启时入队一个
+# Record，格式化和stdout I/O都在监听线程做；默认INFO级别下零成本
+logger = logging.getLogger(__name__)
+if not logger.handlers:
+    _log_q = queue.Queue()
+    logger.addHandler(QueueHandler(_log_q))
+    _log_listener = QueueListener(_log_q, logging.StreamHandler())
+    _log_listener.start()
+    logger.setLevel(logging.INFO)
+
+# 全部DDL合成一个脚本：一次parse+plan+execute和一笔写事务，
+# 替代六次单独execute+commit（反复重建库的测试里启动开销可见）
+SCHEMA_SQL = '''
+    CREATE TABLE IF NOT EXISTS users (
+        id TEXT PRIMARY KEY,
+        email TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        full_name TEXT NOT NULL,
+        age INTEGER,
+        sex INTEGER,  -- 1=Male, 2=Female
+        weight REAL,
+        role TEXT NOT NULL DEFAULT 'patient',  -- patient, therapist, doctor, researcher
+        rehabilitation_stage TEXT,  -- Early, Middle, Late
+        main_problems TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+
+    CREATE TABLE IF NOT EXISTS sensor_data (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        -- epoch微秒整数，与WiFi处理器建的库保持同一schema
+        -- （两个处理器共用默认rehabtech_pro.db，谁先建库都一样）
+        timestamp INTEGER NOT NULL DEFAULT
+            (CAST((julianday('now') - 2440587.5) * 86400000000 AS INTEGER)),
+        test_type TEXT NOT NULL,  -- 'force test', 'angle test', 'force and angle test'
+        -- 定点整数存储（×100，厘牛/厘度）；旧库保持REAL物理值，
+        -- 读写两侧按声明类型分派
+        force_value INTEGER,      -- Force in centinewtons (N × 100)
+        angle_value INTEGER,      -- Angle in centidegrees (° × 100)
+        session_id TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        data_quality REAL DEFAULT 1.0,  -- Data quality score 0-1
+        calibration_factor REAL DEFAULT 1.0,
+        FOREIGN KEY (user_id) REFERENCES users(id),
+        FOREIGN KEY (session_id) REFERENCES training_sessions(session_id)
+    );
+
+    CREATE TABLE IF NOT EXISTS training_sessions (
+        session_id TEXT PRIMARY KEY,
+        user_id TEXT NOT NULL,
+        start_time DATETIME NOT NULL,
+        end_time DATETIME,
+        duration INTEGER,  -- Duration in seconds
+        test_types TEXT,   -- JSON array of test types
+        status TEXT DEFAULT 'active',  -- active, completed, cancelled
+        session_config TEXT,  -- JSON configuration
+        notes TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users(id)
+    );
+
+    CREATE TABLE IF NOT EXISTS analysis_results (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_id TEXT NOT NULL,
+        analysis_type TEXT NOT NULL,  -- comprehensive, statistical, trend, clustering
+        results TEXT,  -- JSON results
+        overall_score REAL,  -- Overall performance score
+        grade TEXT,  -- Performance grade A-F
+        recommendations TEXT,  -- AI-generated recommendations
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (session_id) REFERENCES training_sessions(session_id)
+    );
+
+    CREATE TABLE IF NOT EXISTS user_preferences (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT NOT NULL,
+        preference_key TEXT NOT NULL,
+        preference_value TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users(id),
+        UNIQUE(user_id, preference_key)
+    );
+
+    CREATE TABLE IF NOT EXISTS training_goals (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT NOT NULL,
+        goal_type TEXT NOT NULL,  -- force_improvement, angle_improvement, frequency
+        target_value REAL NOT NULL,
+        current_value REAL DEFAULT 0,
+        target_date DATE,
+        status TEXT DEFAULT 'active',  -- active, achieved, paused
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users(id)
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_sensor_sess_ts
+        ON sensor_data(session_id, timestamp);
+    CREATE INDEX IF NOT EXISTS idx_sess_user_start
+        ON training_sessions(user_id, start_time DESC);
+    CREATE INDEX IF NOT EXISTS idx_sess_status
+        ON training_sessions(status);
+'''
+
+
 class EnhancedSensorDataHandler:
     """
     增强型传感器数据处理器 - 支持单角度三模式系统
@@ -23,6 +158,34 @@ class EnhancedSensorDataHandler:
     MODE_FORCE = 2
     MODE_ALL = 3
 
+    # WAL让10Hz的写入不再阻塞读取（诊断/会话查询），每次commit也免掉
+    # 回滚日志的双fsync；NORMAL在WAL下只有断电才可能丢最后一笔事务
+    _PRAGMAS = '''
+        PRAGMA journal_mode=WAL;
+        PRAGMA synchronous=NORMAL;
+        PRAGMA temp_store=MEMORY;
+        PRAGMA cache_size=-20000;
+        PRAGMA mmap_size=134217728;
+        PRAGMA wal_autocheckpoint=1000;
+    '''
+
+    # 本地缓冲批量落库：每批一次fsync而不是每条样本一次
+    _FLUSH_SIZE = 50
+    _FLUSH_SECONDS = 2.0
+    _DRAIN_BATCH = 64  # 写线程单事务最多合并的样本数
+
+    # 协议行是固定的`A:xx F:yy`格式，默认用C层split+切片解析；
+    # 置True退回正则路径（协议变体调试用）
+    _USE_REGEX_PARSER = False
+
+    # 固定属性集：省掉每实例__dict__，属性访问走紧凑的slot描述符
+    __slots__ = ('db_path', 'port', 'baudrate', 'serial_conn', 'is_running',
+                 'current_mode', '_conn', '_conn_lock', '_pending',
+                 '_last_flush', '_q', '_writer', '_rx_q', '_rx_thread',
+                 '_sim_contraction', '_sim_rom', '_sim_tremor', '_rng',
+                 '_rand_buf', '_randn_buf', '_rand_idx', '_randn_idx',
+                 '_fixed_point')
+
     def __init__(self, db_path='rehabtech_pro.db', port='COM9', baudrate=115200):
         self.db_path = db_path
         self.port = port
@@ -31,109 +194,62 @@ class EnhancedSensorDataHandler:
         self.is_running = False
         self.current_mode = self.MODE_ALL  # 默认模式3
         self.init_database()
-        
+
+        # 每次insert都connect/close要重复支付schema解析、页缓存预热和
+        # 关闭时的fsync；长连接让插入路径只剩bind+step+日志写
+        self._conn = sqlite3.connect(db_path, isolation_level=None,
+                                     check_same_thread=False,
+                                     cached_statements=512)
+        if db_path != ':memory:':
+            self._conn.executescript(self._PRAGMAS)
+        # Row按列名取值且dict(row)直接成映射，省掉手写的按位置取列；
+        # 列顺序变化也不再悄悄错位
+        self._conn.row_factory = sqlite3.Row
+        # 按声明类型判断本库的数值格式：新库INTEGER定点（×100），
+        # 旧库REAL物理值——与WiFi处理器的检测逻辑一致
+        cols = {row[1]: (row[2] or '').upper()
+                for row in self._conn.execute('PRAGMA table_info(sensor_data)')}
+        self._fixed_point = cols.get('force_value') == 'INTEGER'
+        self._conn_lock = threading.Lock()
+        self._pending = []
+        self._last_flush = time.monotonic()
+
+        # 生产者/消费者：采样线程只往有界队列塞样本，落库在专职写线程里
+        # 批量进行——SQLite卡顿不会抖动采样节奏
+        self._q = queue.Queue(maxsize=1024)
+        self._writer = threading.Thread(target=self._drain, daemon=True)
+        self._writer.start()
+
+        # 专职串口读线程的接收队列：readline的阻塞等待不再占用采样线程，
+        # set_mode的确认消息也从这里取，不再以100ms粒度轮询in_waiting
+        self._rx_q = queue.Queue()
+        self._rx_thread = None
+
+        # 模拟路径查表化：正弦项按10ms步长预计算60s一张表，采样时只做
+        # 一次下标运算；NumPy对标量的ufunc分发开销比查表贵一个量级
+        sim_t = np.arange(0, 60, 0.01)
+        self._sim_contraction = 20 * np.sin(sim_t * 0.8)
+        self._sim_rom = 30 * np.sin(sim_t * 0.4)
+        self._sim_tremor = 2 * np.sin(sim_t * 3)
+        # 随机数按4096块预抽，摊薄每次draw的Python调用成本
+        self._rng = np.random.default_rng()
+        self._rand_buf = self._rng.random(4096)
+        self._randn_buf = self._rng.standard_normal(4096)
+        self._rand_idx = 0
+        self._randn_idx = 0
+
     def init_database(self):
         """Initialize enhanced database schema"""
         conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        # Users table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id TEXT PRIMARY KEY,
-                email TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                full_name TEXT NOT NULL,
-                age INTEGER,
-                sex INTEGER,  -- 1=Male, 2=Female
-                weight REAL,
-                role TEXT NOT NULL DEFAULT 'patient',  -- patient, therapist, doctor, researcher
-                rehabilitation_stage TEXT,  -- Early, Middle, Late
-                main_problems TEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        # Enhanced sensor data table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS sensor_data (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                test_type TEXT NOT NULL,  -- 'force test', 'angle test', 'force and angle test'
-                force_value REAL,         -- Force in Newtons
-                angle_value REAL,         -- Angle in degrees
-                session_id TEXT NOT NULL,
-                user_id TEXT NOT NULL,
-                data_quality REAL DEFAULT 1.0,  -- Data quality score 0-1
-                calibration_factor REAL DEFAULT 1.0,
-                FOREIGN KEY (user_id) REFERENCES users(id),
-                FOREIGN KEY (session_id) REFERENCES training_sessions(session_id)
-            )
-        ''')
-
-        # Enhanced training sessions table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS training_sessions (
-                session_id TEXT PRIMARY KEY,
-                user_id TEXT NOT NULL,
-                start_time DATETIME NOT NULL,
-                end_time DATETIME,
-                duration INTEGER,  -- Duration in seconds
-                test_types TEXT,   -- JSON array of test types
-                status TEXT DEFAULT 'active',  -- active, completed, cancelled
-                session_config TEXT,  -- JSON configuration
-                notes TEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(id)
-            )
-        ''')
-
-        # Analysis results table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS analysis_results (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                session_id TEXT NOT NULL,
-                analysis_type TEXT NOT NULL,  -- comprehensive, statistical, trend, clustering
-                results TEXT,  -- JSON results
-                overall_score REAL,  -- Overall performance score
-                grade TEXT,  -- Performance grade A-F
-                recommendations TEXT,  -- AI-generated recommendations
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (session_id) REFERENCES training_sessions(session_id)
-            )
-        ''')
-
-        # User preferences table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_preferences (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id TEXT NOT NULL,
-                preference_key TEXT NOT NULL,
-                preference_value TEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(id),
-                UNIQUE(user_id, preference_key)
-            )
-        ''')
-
-        # Training goals table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS training_goals (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id TEXT NOT NULL,
-                goal_type TEXT NOT NULL,  -- force_improvement, angle_improvement, frequency
-                target_value REAL NOT NULL,
-                current_value REAL DEFAULT 0,
-                target_date DATE,
-                status TEXT DEFAULT 'active',  -- active, achieved, paused
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(id)
-            )
-        ''')
+        # 内存库没有持久journal文件，WAL在其上无意义
+        if self.db_path != ':memory:':
+            conn.executescript(self._PRAGMAS)
+            mode = conn.execute('PRAGMA journal_mode').fetchone()[0]
+            if mode.lower() != 'wal':
+                print(f"[WARN] journal_mode={mode} (WAL not active)")
+        # 表+索引DDL一次executescript跑完（单写事务）
+        conn.executescript(SCHEMA_SQL)
 
-        conn.commit()
         conn.close()
         print('[OK] Enhanced database schema created successfully')
 
@@ -144,6 +260,9 @@ class EnhancedSensorDataHandler:
                 self.serial_conn = serial.Serial(self.port, baudrate=self.baudrate, timeout=1)
                 print(f'[OK] Serial port connected successfully: {self.port}')
                 time.sleep(2)  # 等待连接稳定
+                self._rx_thread = threading.Thread(target=self._serial_reader,
+                                                   daemon=True)
+                self._rx_thread.start()
                 return True
             else:
                 print('[WARN] Serial port not specified, using simulation mode')
@@ -152,6 +271,41 @@ class EnhancedSensorDataHandler:
             print(f"[ERROR] Serial port connection error: {e}")
             return False
 
+    def _serial_reader(self):
+        """专职读线程：阻塞readline等首行，再把in_waiting一次性批量读走
+
+        高速率下积压的行用单次read(n)拿回来，而不是每行一次内核调用；
+        残缺尾行留在本地缓冲等下一轮补齐
+        """
+        pending = b''
+        while self.serial_conn and self.serial_conn.is_open:
+            try:
+                raw = self.serial_conn.readline()
+                n = self.serial_conn.in_waiting
+                if n:
+                    raw += self.serial_conn.read(n)
+            except Exception as e:
+                # 串口被close()时读取会抛错，静默退出
+                if self.serial_conn and self.serial_conn.is_open:
+                    print(f"[ERROR] Serial reader error: {e}")
+                break
+            if not raw:
+                continue  # readline超时，空转一圈
+            pending += raw
+            *complete, pending = pending.split(b'\n')
+            for raw_line in complete:
+                line = raw_line.decode('utf-8', errors='ignore').strip()
+                if line:
+                    self._rx_q.put(line)
+
+    def _drain_rx(self):
+        """清空接收队列（模式切换前丢弃在途数据）"""
+        while True:
+            try:
+                self._rx_q.get_nowait()
+            except queue.Empty:
+                return
+
     def set_mode(self, mode):
         """
         设置工作模式并发送指令到Receiver
@@ -174,40 +328,33 @@ class EnhancedSensorDataHandler:
 
         try:
             if self.serial_conn and self.serial_conn.is_open:
-                # 1. 第一次清空缓冲区
-                self.serial_conn.reset_input_buffer()
-                self.serial_conn.reset_output_buffer()
-
-                # 2. 等待任何在途数据到达（ESP-NOW + 串口传输延迟）
-                time.sleep(0.5)
-
-                # 3. 第二次清空缓冲区（清除等待期间到达的数据）
+                # 1. 清空内核缓冲和接收队列；确认消息按token精确匹配，
+                # 在途旧数据行会被等待循环自然跳过，不需要定长等待
                 self.serial_conn.reset_input_buffer()
                 self.serial_conn.reset_output_buffer()
-                time.sleep(0.1)
+                self._drain_rx()
 
-                # 4. 发送模式切换指令到Receiver
+                # 2. 发送模式切换指令到Receiver
                 command = f"MODE:{mode}\n"
                 self.serial_conn.write(command.encode('utf-8'))
                 self.serial_conn.flush()
 
-                # 5. 等待并读取确认消息
-                time.sleep(0.5)
+                # 3. 事件驱动等确认：ack一到就返回，而不是按固定延时干等
                 confirmation_received = False
-                timeout = time.time() + 2.0  # 2秒超时
+                token = f"MODE:{mode}"
+                deadline = time.monotonic() + 2.0  # 2秒超时
 
-                while time.time() < timeout:
-                    if self.serial_conn.in_waiting > 0:
-                        line = self.serial_conn.readline().decode('utf-8', errors='ignore').strip()
-                        if f"MODE:{mode}" in line:
-                            confirmation_received = True
-                            break
-                    time.sleep(0.1)
+                while time.monotonic() < deadline:
+                    try:
+                        line = self._rx_q.get(timeout=0.05)
+                    except queue.Empty:
+                        continue
+                    if token in line:
+                        confirmation_received = True
+                        break
 
-                # 6. 清空剩余的确认消息
-                time.sleep(0.3)
-                while self.serial_conn.in_waiting > 0:
-                    self.serial_conn.readline()
+                # 4. 清空剩余的确认消息
+                self._drain_rx()
 
                 self.current_mode = mode
                 print(f"[OK] 模式已切换到: 模式{mode} - {mode_names[mode]}")
@@ -224,62 +371,75 @@ class EnhancedSensorDataHandler:
             print(f"[ERROR] 切换模式失败: {e}")
             return False
 
+    def _rand(self):
+        """预抽缓冲里的下一个U(0,1)随机数"""
+        if self._rand_idx >= 4096:
+            self._rand_buf = self._rng.random(4096)
+            self._rand_idx = 0
+        v = self._rand_buf[self._rand_idx]
+        self._rand_idx += 1
+        return float(v)
+
+    def _randn(self):
+        """预抽缓冲里的下一个标准正态随机数"""
+        if self._randn_idx >= 4096:
+            self._randn_buf = self._rng.standard_normal(4096)
+            self._randn_idx = 0
+        v = self._randn_buf[self._randn_idx]
+        self._randn_idx += 1
+        return float(v)
+
     def simulate_sensor_data(self, test_type):
         """Enhanced sensor data simulation with realistic patterns"""
+        # 不带timestamp：落库走CURRENT_TIMESTAMP默认值，每样本免掉
+        # 一次datetime构造+isoformat字符串分配
         data = {
-            'timestamp': datetime.now().isoformat(),
             'test_type': test_type,
-            'data_quality': random.uniform(0.85, 1.0)  # Simulate data quality
+            'data_quality': 0.85 + 0.15 * self._rand()  # Simulate data quality
         }
-        
+
         current_time = time.time()
-        
+        # 周期60s、步长10ms的LUT下标
+        i = int((current_time % 60) / 0.01)
+
         if test_type in ['force test', 'force and angle test']:
             # Enhanced force simulation with realistic rehabilitation patterns
             base_force = 50  # Base force in Newtons
-            
+
             # Simulate fatigue effect (decreasing force over time)
             fatigue_factor = max(0.7, 1 - (current_time % 60) / 300)
-            
-            # Add periodic muscle contraction pattern
-            contraction_pattern = 20 * np.sin(current_time * 0.8) * fatigue_factor
-            
-            # Add some controlled noise
-            noise = random.gauss(0, 5)
-            
-            force_value = max(0, base_force + contraction_pattern + noise)
+
+            # Periodic muscle contraction pattern + controlled noise (查表)
+            force_value = max(0, base_force
+                              + self._sim_contraction[i] * fatigue_factor
+                              + 5 * self._randn())
             data['force_value'] = round(force_value, 2)
-            
+
         if test_type in ['angle test', 'force and angle test']:
             # Enhanced angle simulation with realistic joint movement
             base_angle = 90  # Base angle in degrees
-            
-            # Simulate range of motion exercise
-            rom_pattern = 30 * np.sin(current_time * 0.4)
-            
-            # Add slight tremor/instability
-            tremor = 2 * np.sin(current_time * 3) * random.uniform(0.5, 1.0)
-            
-            # Add controlled noise
-            noise = random.gauss(0, 1)
-            
-            angle_value = max(0, min(180, base_angle + rom_pattern + tremor + noise))
+
+            # Range of motion + tremor/instability + controlled noise (查表)
+            tremor = self._sim_tremor[i] * (0.5 + 0.5 * self._rand())
+            angle_value = max(0, min(180, base_angle + self._sim_rom[i]
+                                     + tremor + self._randn()))
             data['angle_value'] = round(angle_value, 2)
-        
+
         return data
 
     def read_sensor_data(self, test_type):
         """Read data from sensors with error handling"""
         if self.serial_conn and self.serial_conn.is_open:
             try:
-                line = self.serial_conn.readline().decode('utf-8').strip()
-                print(f"[RX] Serial data received: {line}")
-                if line:
-                    data = self.parse_serial_data(line, test_type)
-                    return data
+                # 读线程已把整行放进队列，这里最多等一个readline超时周期
+                line = self._rx_q.get(timeout=1)
+                logger.debug("[RX] Serial data received: %s", line)
+                return self.parse_serial_data(line, test_type)
+            except queue.Empty:
+                pass
             except Exception as e:
                 print(f"[ERROR] Serial data reading error: {e}")
-        
+
         # Fallback to simulation
         return self.simulate_sensor_data(test_type)
     
@@ -292,26 +452,34 @@ class EnhancedSensorDataHandler:
         - 模式2: F:75.50
         - 模式3: A:45.67 F:75.50
         """
+        # timestamp由数据库默认值分配，解析路径不再逐行格式化时间
         data = {
-            'timestamp': datetime.now().isoformat(),
             'test_type': test_type,
             'data_quality': 1.0
         }
 
         try:
             # 跳过状态消息
-            if "Receiver" in line or "Command" in line or "MODE" in line:
+            if line.startswith(_STATUS_PREFIXES):
                 return None
 
-            # 解析角度数据 (A:xx.xx)
-            angle_match = re.search(r'A:([\d.]+)', line)
-            if angle_match and test_type in ['angle test', 'force and angle test']:
-                data['angle_value'] = float(angle_match.group(1))
+            if self._USE_REGEX_PARSER:
+                # 正则回退路径
+                angle_match = _RE_ANGLE.search(line)
+                if angle_match and test_type in ['angle test', 'force and angle test']:
+                    data['angle_value'] = float(angle_match.group(1))
 
-            # 解析拉力数据 (F:xx.xx)
-            force_match = re.search(r'F:([\d.]+)', line)
-            if force_match and test_type in ['force test', 'force and angle test']:
-                data['force_value'] = float(force_match.group(1))
+                force_match = _RE_FORCE.search(line)
+                if force_match and test_type in ['force test', 'force and angle test']:
+                    data['force_value'] = float(force_match.group(1))
+            else:
+                # 按空格切token、看前两个字符分派：没有NFA状态机，
+                # 也不分配捕获组对象
+                for tok in line.split():
+                    if tok[:2] == 'A:' and test_type in ('angle test', 'force and angle test'):
+                        data['angle_value'] = float(tok[2:])
+                    elif tok[:2] == 'F:' and test_type in ('force test', 'force and angle test'):
+                        data['force_value'] = float(tok[2:])
 
             # 如果没有解析到任何数据，返回None
             if 'force_value' not in data and 'angle_value' not in data:
@@ -323,163 +491,212 @@ class EnhancedSensorDataHandler:
 
         return data
 
+    @staticmethod
+    def _to_fixed(value):
+        """物理值→定点整数（×100）；None透传"""
+        return int(round(value * 100)) if value is not None else None
+
+    @staticmethod
+    def _from_fixed(value):
+        """定点整数→物理值；None透传"""
+        return value / 100.0 if value is not None else None
+
     def save_to_database(self, data, session_id, user_id=None):
-        """Save sensor data to database with enhanced error handling"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
+        """Queue a sensor sample for the background writer thread
+
+        按当前模式选特化的INSERT语句和参数元组；队列元素是
+        (sql, params)对，写线程按语句分段executemany
+        """
+        force = data.get('force_value')
+        angle = data.get('angle_value')
+        if self._fixed_point:
+            force = self._to_fixed(force)
+            angle = self._to_fixed(angle)
+
+        mode = self.current_mode
+        if mode == self.MODE_ANGLE:
+            item = (INSERT_SENSOR_SQL_ANGLE, (
+                data['test_type'], angle,
+                session_id, user_id, data.get('data_quality', 1.0)))
+        elif mode == self.MODE_FORCE:
+            item = (INSERT_SENSOR_SQL_FORCE, (
+                data['test_type'], force,
+                session_id, user_id, data.get('data_quality', 1.0)))
+        else:
+            item = (INSERT_SENSOR_SQL, (
+                data['test_type'], force,
+                angle, session_id, user_id,
+                data.get('data_quality', 1.0)))
+
         try:
-            cursor.execute('''
-                INSERT INTO sensor_data 
-                (test_type, force_value, angle_value, session_id, user_id, data_quality)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (
-                data['test_type'],
-                data.get('force_value'),
-                data.get('angle_value'),
-                session_id,
-                user_id,
-                data.get('data_quality', 1.0)
-            ))
-            conn.commit()
-            
-        except Exception as e:
-            print(f"[ERROR] Database insertion error: {e}")
-            conn.rollback()
-        finally:
-            conn.close()
+            self._q.put_nowait(item)
+        except queue.Full:
+            # 写线程长时间跟不上时宁可丢样本也不阻塞采样
+            print("[WARN] Writer queue full, sample dropped")
+
+    def _drain(self):
+        """写线程主循环：成批取出队列样本，每批一个事务落库"""
+        running = True
+        while running:
+            try:
+                item = self._q.get(timeout=self._FLUSH_SECONDS)
+            except queue.Empty:
+                self._flush()  # 空闲期把残余缓冲写掉
+                continue
+
+            batch = []
+            while item is not None:
+                batch.append(item)
+                if len(batch) >= self._DRAIN_BATCH:
+                    break
+                try:
+                    item = self._q.get_nowait()
+                except queue.Empty:
+                    break
+            else:
+                running = False  # 收到哨兵：写完残余后退出
+
+            with self._conn_lock:
+                self._pending.extend(batch)
+            self._flush()
+
+    def _flush(self):
+        """Write all buffered rows in one BEGIN/COMMIT transaction
+
+        缓冲元素是(sql, params)，按语句连续分段executemany；
+        模式中途不变时整批就是一段
+        """
+        with self._conn_lock:
+            if self._pending:
+                try:
+                    self._conn.execute('BEGIN')
+                    i, n = 0, len(self._pending)
+                    while i < n:
+                        sql = self._pending[i][0]
+                        j = i
+                        while j < n and self._pending[j][0] == sql:
+                            j += 1
+                        self._conn.executemany(
+                            sql, [params for _, params in self._pending[i:j]])
+                        i = j
+                    self._conn.execute('COMMIT')
+                    self._pending.clear()
+                except Exception as e:
+                    print(f"[ERROR] Database insertion error: {e}")
+                    try:
+                        self._conn.execute('ROLLBACK')
+                    except sqlite3.OperationalError:
+                        pass
+            self._last_flush = time.monotonic()
+
+    def _sync_writer(self, timeout=2.0):
+        """等写线程清空队列，再冲刷残余缓冲（会话收尾/读取前调用）"""
+        deadline = time.monotonic() + timeout
+        while not self._q.empty() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self._flush()
 
     def create_training_session(self, user_id, test_types, session_config=None):
         """Create enhanced training session"""
         session_id = f"session_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{str(uuid.uuid4())[:8]}"
-        
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
+
         try:
-            cursor.execute('''
-                INSERT INTO training_sessions 
-                (session_id, user_id, start_time, test_types, session_config, status)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (
-                session_id, 
-                user_id, 
-                datetime.now(), 
-                json.dumps(test_types),
-                json.dumps(session_config) if session_config else None,
-                'active'
-            ))
-            conn.commit()
+            with self._conn_lock:
+                self._conn.execute('''
+                    INSERT INTO training_sessions
+                    (session_id, user_id, start_time, test_types, session_config, status)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (
+                    session_id,
+                    user_id,
+                    datetime.now(),
+                    json.dumps(test_types),
+                    json.dumps(session_config) if session_config else None,
+                    'active'
+                ))
             print(f"[OK] Training session created: {session_id}")
-            
+
         except Exception as e:
             print(f"[ERROR] Session creation error: {e}")
-            conn.rollback()
-        finally:
-            conn.close()
-            
+
         return session_id
 
     def end_training_session(self, session_id, notes=None):
         """End training session with enhanced logging"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
+        self._sync_writer()  # 会话收尾前确保本会话数据已全部落库
+
         try:
-            # Get session start time
-            cursor.execute(
-                'SELECT start_time FROM training_sessions WHERE session_id = ?', 
-                (session_id,)
-            )
-            result = cursor.fetchone()
+            with self._conn_lock:
+                # Get session start time
+                result = self._conn.execute(
+                    'SELECT start_time FROM training_sessions WHERE session_id = ?',
+                    (session_id,)
+                ).fetchone()
+
+                if result:
+                    start_time = datetime.fromisoformat(result[0])
+                    duration = int((datetime.now() - start_time).total_seconds())
+
+                    self._conn.execute('''
+                        UPDATE training_sessions
+                        SET end_time = ?, duration = ?, status = ?, notes = ?
+                        WHERE session_id = ?
+                    ''', (datetime.now(), duration, 'completed', notes, session_id))
 
             if result:
-                start_time = datetime.fromisoformat(result[0])
-                duration = int((datetime.now() - start_time).total_seconds())
-                
-                cursor.execute('''
-                    UPDATE training_sessions 
-                    SET end_time = ?, duration = ?, status = ?, notes = ?
-                    WHERE session_id = ?
-                ''', (datetime.now(), duration, 'completed', notes, session_id))
-                
-                conn.commit()
                 print(f"[OK] Session {session_id} completed - Duration: {duration}s")
             else:
                 print(f"[ERROR] Session {session_id} not found")
-                
+
         except Exception as e:
             print(f"[ERROR] Session end error: {e}")
-            conn.rollback()
-        finally:
-            conn.close()
 
     def get_session_data(self, session_id):
         """Get session data with enhanced filtering"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
         try:
-            cursor.execute('''
-                SELECT timestamp, test_type, force_value, angle_value, data_quality
-                FROM sensor_data 
-                WHERE session_id = ? 
-                ORDER BY timestamp
-            ''', (session_id,))
-            
-            data = cursor.fetchall()
-            
+            with self._conn_lock:
+                data = self._conn.execute(f'''
+                    SELECT timestamp, test_type, {self._value_cols()}, data_quality
+                    FROM sensor_data
+                    WHERE session_id = ?
+                    ORDER BY timestamp
+                ''', (session_id,)).fetchall()
+
             return [
-                {
-                    'timestamp': row[0],
-                    'test_type': row[1],
-                    'force_value': row[2],
-                    'angle_value': row[3],
-                    'data_quality': row[4]
-                }
-                for row in data
-            ]
-            
+                {**dict(row),
+                 # 新库存epoch微秒整数，旧库是TEXT时间戳——对外统一成
+                 # ISO字符串（与WiFi处理器的get_session_data行为一致）
+                 'timestamp': (datetime.fromtimestamp(row[0] / 1e6).isoformat()
+                               if isinstance(row[0], (int, float)) else row[0])}
+                for row in data]
+
         except Exception as e:
             print(f"[ERROR] Error retrieving session data: {e}")
             return []
-        finally:
-            conn.close()
 
     def get_user_sessions(self, user_id, limit=50):
         """Get user's training sessions"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
         try:
-            cursor.execute('''
-                SELECT session_id, start_time, end_time, duration, test_types, status, notes
-                FROM training_sessions 
-                WHERE user_id = ? 
-                ORDER BY start_time DESC 
-                LIMIT ?
-            ''', (user_id, limit))
-            
-            sessions = cursor.fetchall()
-            
-            return [
-                {
-                    'session_id': row[0],
-                    'start_time': row[1],
-                    'end_time': row[2],
-                    'duration': row[3],
-                    'test_types': json.loads(row[4]) if row[4] else [],
-                    'status': row[5],
-                    'notes': row[6]
-                }
-                for row in sessions
-            ]
-            
+            with self._conn_lock:
+                sessions = self._conn.execute('''
+                    SELECT session_id, start_time, end_time, duration, test_types, status, notes
+                    FROM training_sessions
+                    WHERE user_id = ?
+                    ORDER BY start_time DESC
+                    LIMIT ?
+                ''', (user_id, limit)).fetchall()
+
+            result = []
+            for row in sessions:
+                session = dict(row)
+                session['test_types'] = (json.loads(session['test_types'])
+                                         if session['test_types'] else [])
+                result.append(session)
+            return result
+
         except Exception as e:
             print(f"[ERROR] Error retrieving user sessions: {e}")
             return []
-        finally:
-            conn.close()
 
     def start_data_collection(self, test_type, session_id, user_id, duration=60, interval=0.1):
         """
@@ -506,6 +723,9 @@ class EnhancedSensorDataHandler:
         data_count = 0
         error_count = 0
         max_errors = 10
+        # 单调时钟截止期调度：实际周期=interval而不是interval+处理耗时，
+        # 误差不随样本数累积
+        next_t = time.monotonic()
 
         print(f"[START] Starting {test_type} data collection (Mode {target_mode})")
         print(f"[TIME] Duration: {duration}s, Interval: {interval}s")
@@ -518,25 +738,26 @@ class EnhancedSensorDataHandler:
                     self.save_to_database(data, session_id, user_id)
                     data_count += 1
 
-                    # Enhanced logging
-                    status_parts = []
-                    if data.get('force_value') is not None:
-                        status_parts.append(f"Force: {data['force_value']:.2f}N")
-                    if data.get('angle_value') is not None:
-                        status_parts.append(f"Angle: {data['angle_value']:.2f}°")
-                    if data.get('data_quality') is not None:
-                        status_parts.append(f"Quality: {data['data_quality']:.2f}")
-
-                    print(f"[{data_count:04d}] {' | '.join(status_parts)}")
-
-                time.sleep(interval)
+                    # 逐样本状态行只在DEBUG级别入队，格式化在监听线程做
+                    logger.debug("[%04d] force=%s angle=%s quality=%s",
+                                 data_count, data.get('force_value'),
+                                 data.get('angle_value'),
+                                 data.get('data_quality'))
 
             except Exception as e:
                 error_count += 1
                 print(f"[ERROR] Data collection error #{error_count}: {e}")
-                time.sleep(interval)  # Continue despite errors
+                # Continue despite errors
+
+            next_t += interval
+            sleep_for = next_t - time.monotonic()
+            if sleep_for > 0:
+                time.sleep(sleep_for)
+            else:
+                next_t = time.monotonic()  # 掉队时重置基准，不突击追赶
 
         self.is_running = False
+        self._sync_writer()  # 收尾：把不满一批的残余样本写入数据库
 
         if error_count >= max_errors:
             print(f"[WARN] Data collection stopped due to excessive errors ({error_count})")
@@ -546,53 +767,100 @@ class EnhancedSensorDataHandler:
     def stop_data_collection(self):
         """Stop data collection gracefully"""
         self.is_running = False
+        self._sync_writer()  # 残余缓冲立即落库
         print('🛑 Data collection stop requested')
 
     def calibrate_sensors(self, test_type, calibration_duration=10):
         """Calibrate sensors for accurate measurements"""
         print(f"🔧 Starting sensor calibration for {test_type}...")
         
-        calibration_data = []
+        # 预分配连续float32缓冲边采边填：均值是对齐数组上的单次SIMD归约，
+        # 不再经过list-of-dict装箱再np.mean重新拆箱
+        cap = int(calibration_duration / 0.1) + 8
+        forces = np.empty(cap, np.float32)
+        angles = np.empty(cap, np.float32)
+        nf = na = 0
+        want_force = test_type in ('force test', 'force and angle test')
+        want_angle = test_type in ('angle test', 'force and angle test')
+
         start_time = time.time()
-        
         while (time.time() - start_time) < calibration_duration:
             data = self.read_sensor_data(test_type)
             if data:
-                calibration_data.append(data)
+                if want_force and nf < cap and data.get('force_value'):
+                    forces[nf] = data['force_value']
+                    nf += 1
+                if want_angle and na < cap and data.get('angle_value'):
+                    angles[na] = data['angle_value']
+                    na += 1
             time.sleep(0.1)
-        
+
         # Calculate calibration factors
         calibration_factors = {}
-        
-        if calibration_data:
-            if test_type in ['force test', 'force and angle test']:
-                forces = [d.get('force_value', 0) for d in calibration_data if d.get('force_value')]
-                if forces:
-                    baseline_force = np.mean(forces)
-                    calibration_factors['force'] = 1.0 if baseline_force == 0 else 50.0 / baseline_force
-            
-            if test_type in ['angle test', 'force and angle test']:
-                angles = [d.get('angle_value', 0) for d in calibration_data if d.get('angle_value')]
-                if angles:
-                    baseline_angle = np.mean(angles)
-                    calibration_factors['angle'] = 1.0 if baseline_angle == 0 else 90.0 / baseline_angle
-        
+
+        if nf:
+            baseline_force = float(forces[:nf].mean())
+            calibration_factors['force'] = (1.0 if baseline_force == 0
+                                            else 50.0 / baseline_force)
+
+        if na:
+            baseline_angle = float(angles[:na].mean())
+            calibration_factors['angle'] = (1.0 if baseline_angle == 0
+                                            else 90.0 / baseline_angle)
+
         print(f"[OK] Calibration completed: {calibration_factors}")
         return calibration_factors
 
+    _EXPORT_SQL = '''
+        SELECT {ts} AS timestamp, test_type, {vals}, data_quality
+        FROM sensor_data
+        WHERE session_id = ?
+        ORDER BY sensor_data.timestamp
+    '''
+
+    # 新库存epoch微秒整数，旧库是TEXT时间戳——导出侧统一还原成可读文本
+    # （与app.py的ts_read_sql相同的表达式）
+    _TS_COL = ("CASE typeof(timestamp) WHEN 'integer' "
+               "THEN datetime(timestamp / 1000000, 'unixepoch') "
+               "ELSE timestamp END")
+
+    def _value_cols(self):
+        """SELECT片段：定点库在SQL侧还原为物理值，别名保持原列名"""
+        if self._fixed_point:
+            return ('force_value / 100.0 AS force_value, '
+                    'angle_value / 100.0 AS angle_value')
+        return 'force_value, angle_value'
+
     def export_session_data(self, session_id, format='csv'):
         """Export session data in various formats"""
-        data = self.get_session_data(session_id)
-        
+        self._sync_writer()  # 导出前确保队列中的样本已落库
+
+        with self._conn_lock:
+            rows = self._conn.execute(
+                self._EXPORT_SQL.format(ts=self._TS_COL,
+                                        vals=self._value_cols()),
+                (session_id,)).fetchall()
+
         if format.lower() == 'csv':
-            csv_content = "Timestamp,Test Type,Force Value (N),Angle Value (°),Data Quality\n"
-            for item in data:
-                csv_content += f"{item['timestamp']},{item['test_type']},{item.get('force_value', '')},{item.get('angle_value', '')},{item.get('data_quality', '')}\n"
-            return csv_content
-        
+            # csv.writer写入StringIO是摊还O(n)的追加；逐行+=拼接字符串
+            # 每次都要重新分配整个缓冲，大会话下是O(n^2)
+            buf = io.StringIO()
+            writer = csv.writer(buf)
+            writer.writerow(["Timestamp", "Test Type", "Force Value (N)",
+                             "Angle Value (°)", "Data Quality"])
+            writer.writerows(
+                ['' if v is None else v for v in row] for row in rows)
+            return buf.getvalue()
+
         elif format.lower() == 'json':
-            return json.dumps(data, indent=2)
-        
+            # 直接从游标行构造，不经过get_session_data的逐行dict物化
+            return json.dumps([
+                {'timestamp': row[0], 'test_type': row[1],
+                 'force_value': row[2], 'angle_value': row[3],
+                 'data_quality': row[4]}
+                for row in rows
+            ], indent=2)
+
         else:
             raise ValueError(f"Unsupported export format: {format}")
 
@@ -609,26 +877,23 @@ class EnhancedSensorDataHandler:
         }
         
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Check database health
-            cursor.execute('SELECT COUNT(*) FROM users')
-            diagnostics['total_users'] = cursor.fetchone()[0]
-            
-            cursor.execute('SELECT COUNT(*) FROM training_sessions')
-            diagnostics['total_sessions'] = cursor.fetchone()[0]
-            
-            cursor.execute('SELECT COUNT(*) FROM sensor_data')
-            diagnostics['total_data_points'] = cursor.fetchone()[0]
-            
-            cursor.execute("SELECT COUNT(*) FROM training_sessions WHERE status = 'active'")
-            diagnostics['active_sessions'] = cursor.fetchone()[0]
-            
+            # 四个计数合并成一条语句的标量子查询：一次prepare、一次往返
+            with self._conn_lock:
+                row = self._conn.execute('''
+                    SELECT (SELECT COUNT(*) FROM users),
+                           (SELECT COUNT(*) FROM training_sessions),
+                           (SELECT COUNT(*) FROM sensor_data),
+                           (SELECT COUNT(*) FROM training_sessions
+                            WHERE status = 'active')
+                ''').fetchone()
+
+            (diagnostics['total_users'],
+             diagnostics['total_sessions'],
+             diagnostics['total_data_points'],
+             diagnostics['active_sessions']) = row
+
             diagnostics['database_status'] = 'healthy'
-            
-            conn.close()
-            
+
         except Exception as e:
             diagnostics['database_status'] = f'error: {str(e)}'
         
@@ -645,10 +910,22 @@ class EnhancedSensorDataHandler:
         if self.serial_conn and self.serial_conn.is_open:
             self.serial_conn.close()
             print("[CLOSE] Serial connection closed")
-        
+
         self.is_running = False
+        # 哨兵让写线程清空队列后退出，join保证最后一批已提交
+        self._q.put(None)
+        self._writer.join(timeout=5)
+        self._flush()
+        self._conn.close()
         print("[OK] Sensor data handler closed successfully")
 
+    # with语句保证异常路径也会close——串口和SQLite连接不留悬挂
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
 
 # Testing and demonstration
 if __name__ == "__main__":
@@ -656,63 +933,57 @@ if __name__ == "__main__":
     print("[TEST] TESTING ENHANCED SENSOR DATA HANDLER")
     print("=" * 60)
 
-    handler = EnhancedSensorDataHandler()
+    with EnhancedSensorDataHandler() as handler:
+        # Test database initialization
+        diagnostics = handler.get_system_diagnostics()
+        print(f"\n[INFO] System Diagnostics:")
+        for key, value in diagnostics.items():
+            print(f"   {key}: {value}")
 
-    # Test database initialization
-    diagnostics = handler.get_system_diagnostics()
-    print(f"\n[INFO] System Diagnostics:")
-    for key, value in diagnostics.items():
-        print(f"   {key}: {value}")
+        # Test sensor connection
+        handler.connect_serial()
 
-    # Test sensor connection
-    handler.connect_serial()
+        # Create test session
+        session_id = handler.create_training_session(
+            user_id="test_user_123",
+            test_types=['force test', 'angle test', 'force and angle test'],
+            session_config={'duration': 10, 'interval': 0.5}
+        )
 
-    # Create test session
-    session_id = handler.create_training_session(
-        user_id="test_user_123",
-        test_types=['force test', 'angle test', 'force and angle test'],
-        session_config={'duration': 10, 'interval': 0.5}
-    )
+        print(f"\n[ID] Test session created: {session_id}")
 
-    print(f"\n[ID] Test session created: {session_id}")
+        # Test data collection for different test types
+        test_types = ['force test', 'angle test', 'force and angle test']
 
-    # Test data collection for different test types
-    test_types = ['force test', 'angle test', 'force and angle test']
+        for test_type in test_types:
+            print(f"\n[TEST] Testing {test_type}...")
 
-    for test_type in test_types:
-        print(f"\n[TEST] Testing {test_type}...")
+            # No settle delay needed: set_mode returns once the Receiver
+            # acks the switch (or times out), so back-to-back tests are safe
+            handler.start_data_collection(
+                test_type=test_type,
+                session_id=session_id,
+                user_id="test_user_123",
+                duration=5,  # Short duration for testing
+                interval=0.5
+            )
 
-        # Add delay between tests to ensure previous mode change completes
-        # and buffers clear to prevent command queue buildup
-        time.sleep(2)
+        # End session
+        handler.end_training_session(session_id, notes="Test session completed successfully")
+
+        # Test data retrieval
+        session_data = handler.get_session_data(session_id)
+        print(f"\n[DATA] Retrieved {len(session_data)} data points from session")
+
+        # Test data export
+        csv_export = handler.export_session_data(session_id, 'csv')
+        print(f"\n[EXPORT] CSV export size: {len(csv_export)} characters")
+
+        # Final diagnostics
+        final_diagnostics = handler.get_system_diagnostics()
+        print(f"\n[INFO] Final System State:")
+        for key, value in final_diagnostics.items():
+            print(f"   {key}: {value}")
 
-        handler.start_data_collection(
-            test_type=test_type,
-            session_id=session_id,
-            user_id="test_user_123",
-            duration=5,  # Short duration for testing
-            interval=0.5
-        )
-    
-    # End session
-    handler.end_training_session(session_id, notes="Test session completed successfully")
-
-    # Test data retrieval
-    session_data = handler.get_session_data(session_id)
-    print(f"\n[DATA] Retrieved {len(session_data)} data points from session")
-
-    # Test data export
-    csv_export = handler.export_session_data(session_id, 'csv')
-    print(f"\n[EXPORT] CSV export size: {len(csv_export)} characters")
-
-    # Final diagnostics
-    final_diagnostics = handler.get_system_diagnostics()
-    print(f"\n[INFO] Final System State:")
-    for key, value in final_diagnostics.items():
-        print(f"   {key}: {value}")
-    
-    # Cleanup
-    handler.close()
-    
     print("\n[OK] Enhanced sensor data handler testing completed!")
     print("=" * 60)
\ No newline at end of file